@@ -0,0 +1,142 @@
+import atexit
+import os
+import queue
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .dashboard import apply_user_deltas, record_activities
+from .etags import bump_version
+from .models import Activity
+
+
+class ActivityWriteBehindQueue:
+    """
+    Bounded in-process queue of unsaved Activity objects, drained by a
+    background thread with bulk_create. Dashboard counter deltas of the same
+    writes are queued alongside and applied with the batch, summed per user.
+
+    Activities are enqueued only once the surrounding transaction commits, so
+    rolled-back writes never produce activities. When the queue is full the
+    activity is written synchronously instead of being dropped, which keeps
+    memory bounded without losing history. Remaining items are flushed at
+    interpreter shutdown.
+    """
+
+    def __init__(self, max_size=None, batch_size=None, flush_interval=None, autostart=True):
+        self.max_size = max_size or getattr(settings, 'ACTIVITY_QUEUE_MAX_SIZE', 10000)
+        self.batch_size = batch_size or getattr(settings, 'ACTIVITY_QUEUE_BATCH_SIZE', 500)
+        self.flush_interval = flush_interval or getattr(settings, 'ACTIVITY_QUEUE_FLUSH_INTERVAL', 1.0)
+        self.autostart = autostart
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, activity):
+        """Queue an activity once the current transaction (if any) commits"""
+        transaction.on_commit(lambda: self._put(activity))
+
+    def enqueue_deltas(self, user_id, deltas):
+        """Queue dashboard counter deltas of `user_id` once the current transaction (if any) commits"""
+        transaction.on_commit(lambda: self._put((user_id, deltas)))
+
+    def _put(self, item):
+        if self.autostart:
+            self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Back-pressure: fall back to a synchronous insert
+            self._write([item])
+
+    def _ensure_worker(self):
+        # Restart the worker in forked children (e.g. gunicorn workers)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_size)
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                batch = self._drain(block=True)
+                if batch:
+                    self._write(batch)
+        finally:
+            connection.close()
+
+    def _drain(self, block=False):
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        activities = [item for item in batch if isinstance(item, Activity)]
+        deltas = {}
+        for user_id, user_deltas in (item for item in batch if not isinstance(item, Activity)):
+            deltas.setdefault(user_id, Counter()).update(user_deltas)
+        try:
+            with transaction.atomic():
+                Activity.objects.bulk_create(activities)
+                record_activities(activities, deltas)
+        except Exception as e:
+            # One bad row (e.g. its contact was deleted meanwhile) must not
+            # lose the whole batch: retry row by row.
+            print(f"Error flushing activity batch, retrying individually: {str(e)}")
+            written = []
+            for activity in activities:
+                try:
+                    activity.save(force_insert=True)
+                    written.append(activity)
+                except Exception as row_error:
+                    print(f"Error writing queued activity: {str(row_error)}")
+            activities = written
+            try:
+                apply_user_deltas(deltas)
+            except Exception as deltas_error:
+                print(f"Error applying queued dashboard counters: {str(deltas_error)}")
+        for user_id in {activity.user_id for activity in activities}:
+            bump_version(user_id, Activity._meta.db_table)
+
+    def flush(self):
+        """Write everything currently queued. Returns the number of items (activities and deltas) written."""
+        written = 0
+        while True:
+            batch = self._drain()
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def stop(self):
+        """Stop the worker and flush what is left"""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+        connection.close()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+activity_queue = ActivityWriteBehindQueue()
+atexit.register(activity_queue.stop)
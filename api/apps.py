@@ -6,6 +6,7 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        import api.checks  # noqa: F401
         try:
             import api.signals
         except Exception as e:
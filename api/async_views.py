@@ -0,0 +1,96 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import exceptions
+
+
+class AsyncActionsMixin:
+    """
+    Lets a viewset serve actions with `async def` methods (`alist`,
+    `agenerate`, ...) under ASGI, see `async_route`.
+
+    DRF dispatches synchronously, so `adispatch` mirrors APIView.dispatch and
+    `initial` with an async authentication step. Responses go through the
+    same exception handling, content negotiation and rendering as the sync
+    path, so both give identical responses.
+    """
+
+    async def adispatch(self, request, handler, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        # Authenticators without `aauthenticate` (session) are skipped:
+        # async_route hands session-authenticated requests to the sync view
+        for authenticator in request.authenticators:
+            aauthenticate = getattr(authenticator, 'aauthenticate', None)
+            if aauthenticate is None:
+                continue
+            try:
+                user_auth = await aauthenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+
+def _needs_sync_view(request):
+    """Session-authenticated and browsable API requests keep using the sync view"""
+    return (
+        settings.SESSION_COOKIE_NAME in request.COOKIES
+        or 'text/html' in request.headers.get('Accept', '')
+    )
+
+
+def async_route(viewset_class, actions, async_actions, **initkwargs):
+    """
+    URL view for one router route: methods in `async_actions` ({'get':
+    'alist'}) are served by the viewset's async methods, everything else by
+    the regular sync view built from `actions` ({'get': 'list', 'post':
+    'create'}).
+    """
+    sync_view = viewset_class.as_view(actions, **initkwargs)
+    async_sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        method = request.method.lower()
+        name = async_actions.get(method)
+        if name is None or _needs_sync_view(request):
+            return await async_sync_view(request, *args, **kwargs)
+
+        self = viewset_class(**initkwargs)
+        self.action_map = actions
+        self.action = actions.get(method)
+        self.format_kwarg = None
+        return await self.adispatch(request, getattr(self, name), *args, **kwargs)
+
+    # DRF views are CSRF exempt; SessionAuthentication enforces it on the sync path
+    view.csrf_exempt = True
+    view.cls = viewset_class
+    view.initkwargs = initkwargs
+    view.actions = actions
+    return view
@@ -1,11 +1,21 @@
+import copy
 import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
 from rest_framework import authentication
 from rest_framework import exceptions
-from .models import UserSessions, Users
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
 class LegacyTokenAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
+        # Imported lazily: these legacy models are not part of this app's schema
+        from .models import UserSessions, Users
+
         auth_header = request.headers.get('Authorization')
         if not auth_header:
             return None
@@ -35,3 +45,125 @@ class LegacyTokenAuthentication(authentication.BaseAuthentication):
             raise exceptions.AuthenticationFailed('Invalid or expired token')
 
         return (session.user, session)
+
+
+class TokenUserCache:
+    """
+    Bounded, thread-safe LRU of token key -> user with a per-entry TTL,
+    optionally backed by a shared Django cache alias for cross-worker reuse.
+    Keys are stored hashed so raw tokens never reach the shared cache.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @staticmethod
+    def _shared_cache():
+        alias = getattr(settings, 'TOKEN_AUTH_SHARED_CACHE', None)
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        hashed = self._hash(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(hashed)
+            if entry is not None:
+                user, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(hashed)
+                    return user
+                del self._entries[hashed]
+
+        shared = self._shared_cache()
+        if shared is not None:
+            user = shared.get(f"token-auth:{hashed}")
+            if user is not None:
+                self._store_local(hashed, user)
+                return user
+        return None
+
+    def set(self, key, user):
+        hashed = self._hash(key)
+        self._store_local(hashed, user)
+        shared = self._shared_cache()
+        if shared is not None:
+            shared.set(f"token-auth:{hashed}", user, timeout=getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60))
+
+    def _store_local(self, hashed, user):
+        ttl = getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60)
+        max_size = getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000)
+        with self._lock:
+            self._entries[hashed] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(hashed)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        hashed = self._hash(key)
+        with self._lock:
+            self._entries.pop(hashed, None)
+        shared = self._shared_cache()
+        if shared is not None:
+            shared.delete(f"token-auth:{hashed}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """
+    DRF TokenAuthentication that skips the Token + User query for tokens
+    validated within the last TOKEN_AUTH_CACHE_TTL seconds.
+
+    Entries are evicted when the token is deleted or the user is deactivated
+    (see signals.py). Other workers' local entries expire with the TTL; use
+    TOKEN_AUTH_SHARED_CACHE to share and invalidate entries across workers.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_user_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_user_cache.set(key, copy.copy(user))
+            return (user, token)
+        # Hand out a copy so request code can't mutate the cached instance
+        user = copy.copy(user)
+        return (user, self.get_model()(key=key, user=user))
+
+    async def aauthenticate(self, request):
+        """`authenticate` for async views: same checks and errors, token read with the async ORM"""
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.')
+            )
+
+        user = token_user_cache.get(key)
+        if user is None:
+            try:
+                token = await self.get_model().objects.select_related('user').aget(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            token_user_cache.set(key, copy.copy(token.user))
+            return (token.user, token)
+        user = copy.copy(user)
+        return (user, self.get_model()(key=key, user=user))
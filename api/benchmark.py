@@ -0,0 +1,411 @@
+import asyncio
+import importlib
+import json
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import clear_url_caches
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from .dashboard import rebuild_dashboard
+from .middleware import CompressionMiddleware
+from .models import Activity, Contact, OTP, PhoneNumber, Prospect
+from .otp_store import get_otp_store
+from .renderers import FastJSONRenderer
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+WILAYAS = ['Alger', 'Oran', 'Constantine', 'Annaba', 'Blida', 'Setif', 'Tlemcen', 'Bejaia']
+SECTEURS = ['Industrie', 'Commerce', 'Services', 'Agriculture', 'BTP']
+STATUSES = ['New', 'Contacted', 'Qualified', 'Lost']
+CONTACT_TYPES = ['Client', 'Prospect', 'Partenaire']
+ACTIVITY_TYPES = [choice for choice, _ in Activity.ACTIVITY_TYPE_CHOICES]
+
+
+def seed(users=2, contacts=200, prospects=500, activities=2000, seed=0):
+    """
+    Fill the current database with deterministic benchmark data: `users`
+    phone-number users, each with a token and the given number of contacts,
+    prospects and activities. Returns one context dict per user.
+    """
+    rng = random.Random(seed)
+    contexts = []
+    for index in range(users):
+        phone = f"0550{index:06d}"
+        PhoneNumber.objects.get_or_create(phone_number=phone)
+        user, _ = User.objects.get_or_create(username=phone)
+        token, _ = Token.objects.get_or_create(user=user)
+
+        contact_objs = Contact.objects.bulk_create([
+            Contact(
+                name=f"Contact {i}", phone_number=f"0661{i:06d}", email=f"contact{i}@example.com",
+                company=f"Company {rng.randrange(50)}", type=rng.choice(CONTACT_TYPES), user=user,
+            )
+            for i in range(contacts)
+        ])
+        prospect_objs = Prospect.objects.bulk_create([
+            Prospect(
+                entreprise=f"Entreprise {i}", wilaya=rng.choice(WILAYAS), commune=f"Commune {rng.randrange(30)}",
+                phone_number=f"0770{i:06d}", email=f"prospect{i}@example.com", secteur=rng.choice(SECTEURS),
+                nif=f"NIF{index:02d}{i:08d}", registre_commerce=f"RC{index:02d}{i:08d}",
+                status=rng.choice(STATUSES), user=user,
+            )
+            for i in range(prospects)
+        ])
+        Activity.objects.bulk_create([
+            Activity(
+                title=f"Activity {i}", description="Seeded for benchmarks", type=rng.choice(ACTIVITY_TYPES),
+                user=user,
+                contact=rng.choice(contact_objs) if contact_objs and i % 2 else None,
+                prospect=rng.choice(prospect_objs) if prospect_objs and not i % 2 else None,
+            )
+            for i in range(activities)
+        ], batch_size=1000)
+        rebuild_dashboard(user)
+
+        contexts.append({
+            'user': user,
+            'token': token.key,
+            'phone': phone,
+            'contact_id': str(contact_objs[0].pk) if contact_objs else None,
+            'prospect_id': str(prospect_objs[0].pk) if prospect_objs else None,
+        })
+    return contexts
+
+
+class Scenario:
+    """
+    One benchmarked request. `path` and `data` are strings/dicts or callables
+    taking (context, iteration); `prepare` runs untimed before each request.
+    """
+
+    def __init__(self, name, method, path, data=None, expected=200, auth=True, prepare=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.expected = expected if isinstance(expected, (tuple, list)) else (expected,)
+        self.auth = auth
+        self.prepare = prepare
+
+    def build(self, context, iteration):
+        path = self.path(context, iteration) if callable(self.path) else self.path
+        data = self.data(context, iteration) if callable(self.data) else self.data
+        return path, data
+
+
+def _issue_otp(context, iteration):
+    phone_obj = PhoneNumber.objects.get(phone_number=context['phone'])
+    get_otp_store().issue(phone_obj, '24680', timezone.now() + timedelta(minutes=5))
+
+
+# Every route of api/urls.py
+SCENARIOS = [
+    Scenario('phone-numbers:list', 'get', '/api/phone-numbers/', auth=False),
+    Scenario('phone-numbers:create', 'post', '/api/phone-numbers/',
+             lambda c, i: {'phone_number': c['phone']}, expected=(200, 201), auth=False),
+    Scenario('otps:create', 'post', '/api/otps/',
+             lambda c, i: {'phone_number': str(PhoneNumber.objects.values_list('pk', flat=True)
+                                              .get(phone_number=c['phone']))},
+             expected=201, auth=False),
+    Scenario('otps:generate', 'post', '/api/otps/generate/',
+             lambda c, i: {'phone_number': c['phone']}, expected=201, auth=False),
+    Scenario('otps:request_otp', 'post', '/api/otps/request_otp/',
+             lambda c, i: {'phone_number': c['phone']}, expected=201, auth=False),
+    Scenario('otps:verify', 'post', '/api/otps/verify/',
+             lambda c, i: {'phone_number': c['phone'], 'otp_code': '24680'}, auth=False, prepare=_issue_otp),
+    Scenario('contacts:list', 'get', '/api/contacts/'),
+    Scenario('contacts:list-fields', 'get', '/api/contacts/?fields=id,name'),
+    Scenario('contacts:retrieve', 'get', lambda c, i: f"/api/contacts/{c['contact_id']}/"),
+    Scenario('contacts:create', 'post', '/api/contacts/',
+             lambda c, i: {'name': f'Bench {i}', 'phone_number': '0555', 'email': 'b@example.com', 'type': 'Client'},
+             expected=201),
+    Scenario('contacts:update', 'patch', lambda c, i: f"/api/contacts/{c['contact_id']}/",
+             lambda c, i: {'company': f'Company {i}'}),
+    Scenario('contacts:export', 'get', '/api/contacts/export/'),
+    Scenario('prospects:list', 'get', '/api/prospects/'),
+    Scenario('prospects:search', 'get', '/api/prospects/?q=entreprise 1'),
+    Scenario('prospects:retrieve', 'get', lambda c, i: f"/api/prospects/{c['prospect_id']}/"),
+    Scenario('prospects:create', 'post', '/api/prospects/',
+             lambda c, i: {'entreprise': f'Bench {i}', 'status': 'New', 'user': c['user'].pk}, expected=201),
+    Scenario('prospects:update', 'patch', lambda c, i: f"/api/prospects/{c['prospect_id']}/",
+             lambda c, i: {'status': STATUSES[i % len(STATUSES)]}),
+    Scenario('activities:list', 'get', '/api/activities/'),
+    Scenario('sync:full', 'get', '/api/sync/'),
+    Scenario('dashboard', 'get', '/api/dashboard/'),
+    Scenario('lookup:phone', 'get', '/api/lookup/phone/?number=%2B213%20661%2000%2000%2001'),
+]
+
+
+# Mixed read/login load for the WSGI vs ASGI concurrency comparison
+MIXED_LOAD = ['otps:generate', 'contacts:list', 'prospects:list', 'activities:list']
+
+# Lists whose rendering and compression are compared by run_renderer_comparison
+RENDERER_LOAD = ['contacts:list', 'prospects:list', 'activities:list']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_scenario(client, scenario, context, iterations=50, warmup=5):
+    """Run one scenario sequentially and return its latency/throughput/query stats"""
+    headers = {'HTTP_AUTHORIZATION': f"Token {context['token']}"} if scenario.auth else {}
+    timings, queries = [], []
+    for iteration in range(warmup + iterations):
+        if scenario.prepare:
+            scenario.prepare(context, iteration)
+        path, data = scenario.build(context, iteration)
+        kwargs = dict(headers)
+        if data is not None:
+            kwargs.update(data=json.dumps(data), content_type='application/json')
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(path, **kwargs)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if response.status_code not in scenario.expected:
+            raise AssertionError(
+                f"{scenario.name}: {scenario.method.upper()} {path} returned {response.status_code}"
+            )
+        if iteration >= warmup:
+            timings.append(elapsed)
+            queries.append(len(captured.captured_queries))
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'throughput_rps': round(len(timings) / total, 1) if total else 0.0,
+        'queries': max(queries) if queries else 0,
+    }
+
+
+def run_benchmark(contexts, iterations=50, warmup=5, scenarios=None):
+    """Run every scenario as the first seeded user and return {scenario name: stats}"""
+    client = Client()
+    context = contexts[0]
+    results = {}
+    with throttling_disabled():
+        for scenario in scenarios or SCENARIOS:
+            results[scenario.name] = run_scenario(client, scenario, context, iterations, warmup)
+            # Keep OTP rows from piling up across scenarios
+            OTP.objects.filter(phone_number__phone_number=context['phone']).delete()
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.5, noise_ms=2.0):
+    """
+    Return the regressions of `results` against `baseline`: any increase in
+    the per-request query count, or a median latency more than `tolerance`
+    (and `noise_ms`) above the baseline. The median is gated rather than the
+    tail, which is too noisy on shared machines to fail a run on.
+    """
+    regressions = []
+    for name, stats in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if stats['queries'] > reference['queries']:
+            regressions.append(f"{name}: {stats['queries']} queries per request (baseline {reference['queries']})")
+        limit = reference['p50_ms'] * (1 + tolerance)
+        if stats['p50_ms'] > limit and stats['p50_ms'] - reference['p50_ms'] > noise_ms:
+            regressions.append(f"{name}: p50 {stats['p50_ms']}ms (baseline {reference['p50_ms']}ms)")
+    return regressions
+
+
+def _reload_urlconf():
+    from . import urls
+    importlib.reload(urls)
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def async_views_enabled():
+    """Route requests to the async views for the duration of the block"""
+    try:
+        with override_settings(ASYNC_VIEWS=True):
+            _reload_urlconf()
+            yield
+    finally:
+        _reload_urlconf()
+
+
+def throttling_disabled():
+    """The OTP scenarios repeat far beyond the production rates"""
+    return override_settings(OTP_THROTTLE_PHONE_RATE='', OTP_THROTTLE_IP_RATE='')
+
+
+@contextmanager
+def simulated_db_latency(ms):
+    """
+    Sleep `ms` milliseconds before every query, on every connection (in any
+    thread), to model the network round trip to a remote database.
+    """
+    if not ms:
+        yield
+        return
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(ms / 1000)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    for conn in connections.all(initialized_only=True):
+        install(conn)
+    connection_created.connect(install, weak=False, dispatch_uid='api.benchmark.delay')
+    try:
+        yield
+    finally:
+        connection_created.disconnect(dispatch_uid='api.benchmark.delay')
+        for conn in connections.all(initialized_only=True):
+            if delay in conn.execute_wrappers:
+                conn.execute_wrappers.remove(delay)
+
+
+async def _asgi_request(application, scenario, context, iteration):
+    path, data = scenario.build(context, iteration)
+    path, _, query = path.partition('?')
+    body = json.dumps(data).encode() if data is not None else b''
+    headers = [
+        (b'host', b'testserver'), (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ]
+    if scenario.auth:
+        headers.append((b'authorization', f"Token {context['token']}".encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': scenario.method.upper(), 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': query.encode(), 'headers': headers,
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    if status[0] not in scenario.expected:
+        raise AssertionError(f"{scenario.name}: {scenario.method.upper()} {path} returned {status[0]}")
+
+
+def run_concurrency(contexts, total=200, concurrency=20, db_latency_ms=0, load=MIXED_LOAD):
+    """
+    Requests per second for a mixed load through a single process: the WSGI
+    handler serving one request at a time (a gunicorn sync worker) vs the
+    ASGI handler with the async views and `concurrency` requests in flight
+    (a uvicorn worker). `db_latency_ms` adds a simulated round trip to every
+    query, as with a database on another host.
+    """
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in load]
+    context = contexts[0]
+
+    client = Client()
+    headers = {'HTTP_AUTHORIZATION': f"Token {context['token']}"}
+    with throttling_disabled(), simulated_db_latency(db_latency_ms):
+        started = time.perf_counter()
+        for iteration in range(total):
+            scenario = scenarios[iteration % len(scenarios)]
+            path, data = scenario.build(context, iteration)
+            kwargs = dict(headers) if scenario.auth else {}
+            if data is not None:
+                kwargs.update(data=json.dumps(data), content_type='application/json')
+            getattr(client, scenario.method)(path, **kwargs)
+        wsgi_elapsed = time.perf_counter() - started
+
+    async def drive(application):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(iteration):
+            async with semaphore:
+                await _asgi_request(application, scenarios[iteration % len(scenarios)], context, iteration)
+
+        await asyncio.gather(*(one(iteration) for iteration in range(total)))
+
+    with throttling_disabled(), async_views_enabled(), simulated_db_latency(db_latency_ms):
+        application = ASGIHandler()
+        started = time.perf_counter()
+        asyncio.run(drive(application))
+        asgi_elapsed = time.perf_counter() - started
+
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'wsgi_rps': round(total / wsgi_elapsed, 1),
+        'asgi_rps': round(total / asgi_elapsed, 1),
+    }
+
+
+def _cpu_us(function, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        result = function()
+    return result, round((time.process_time() - started) / iterations * 1e6, 1)
+
+
+def run_renderer_comparison(contexts, iterations=200, load=RENDERER_LOAD):
+    """
+    CPU time per response of DRF's stdlib JSONRenderer and FastJSONRenderer
+    on the data of the `load` lists, and the bytes on the wire uncompressed,
+    gzipped and brotli-compressed (with the CPU time of each compression).
+    """
+    context = contexts[0]
+    client = Client()
+    renderers = {'stdlib': JSONRenderer(), 'fast': FastJSONRenderer()}
+    results = {}
+    for scenario in SCENARIOS:
+        if scenario.name not in load:
+            continue
+        path, _ = scenario.build(context, 0)
+        data = client.get(path, HTTP_AUTHORIZATION=f"Token {context['token']}").data
+
+        render_us = {}
+        for name, renderer in renderers.items():
+            body, render_us[name] = _cpu_us(lambda: renderer.render(data, 'application/json', {}), iterations)
+        compressed = {}
+        # As CompressionMiddleware compresses them
+        max_random_bytes = CompressionMiddleware.max_random_bytes
+        gzipped, cpu = _cpu_us(lambda: compress_string(body, max_random_bytes=max_random_bytes), iterations)
+        compressed['gzip'] = {'bytes': len(gzipped), 'cpu_us': cpu}
+        if brotli is not None:
+            quality = getattr(settings, 'BROTLI_QUALITY', 4)
+            brotlied, cpu = _cpu_us(lambda: brotli.compress(body, quality=quality), iterations)
+            compressed['br'] = {'bytes': len(brotlied), 'cpu_us': cpu}
+        results[scenario.name] = {'bytes': len(body), 'render_us': render_us, 'compressed': compressed}
+    return results
@@ -0,0 +1,178 @@
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .models import Activity, Tombstone
+from .dashboard import cascaded_activity_deltas, instance_deltas, record_activities, save_deltas
+from .etags import bump_version
+from .phones import key_fields, refresh_keys
+from .references import resolve_pending_labels
+from .signals import coalesce_update_activities, mute_change_tracking
+
+
+class BulkModelMixin:
+    """
+    Adds a `bulk/` list action to a user-scoped ModelViewSet.
+
+        POST   /bulk/  [{...}, {...}]           create every object
+        PATCH  /bulk/  [{"id": ..., ...}, ...]  partially update every object
+        DELETE /bulk/  {"ids": [...]}           delete every object
+
+    All items are validated before anything is written. Writes happen in one
+    transaction with bulk_create / bulk_update, and the activities (and
+    tombstones) the per-row signal receivers would have written are inserted
+    in one batch each. Dashboard counters get one increment per changed group.
+
+    Subclasses set `build_activity` and `build_delete_activity` to the
+    matching builders in signals.py (wrapped in staticmethod).
+    """
+    build_activity = None
+    build_delete_activity = None
+
+    def _bulk_limit_error(self, items):
+        limit = getattr(settings, 'BULK_MAX_ITEMS', 1000)
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'A non-empty list is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > limit:
+            return Response({'error': f'At most {limit} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    @staticmethod
+    def _apply_dashboard_deltas(user_id, per_object_deltas, activities):
+        total = Counter()
+        for deltas in per_object_deltas:
+            total.update(deltas)
+        record_activities(activities, {user_id: total})
+
+    @staticmethod
+    def _valid_ids(ids):
+        try:
+            return [uuid.UUID(str(pk)) for pk in ids]
+        except ValueError:
+            return None
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        if request.method == 'POST':
+            return self._bulk_create(request)
+        if request.method == 'PATCH':
+            return self._bulk_update(request)
+        return self._bulk_destroy(request)
+
+    def _bulk_create(self, request):
+        error = self._bulk_limit_error(request.data)
+        if error:
+            return error
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        objs = [model(**{**data, 'user': request.user}) for data in serializer.validated_data]
+        with transaction.atomic():
+            model.objects.bulk_create(objs)
+            activities = Activity.objects.bulk_create([self.build_activity(obj, True) for obj in objs])
+            self._apply_dashboard_deltas(request.user.pk, [instance_deltas(obj) for obj in objs], activities)
+            bump_version(request.user.pk, model._meta.db_table, Activity._meta.db_table)
+        for obj in objs:
+            obj.remember_loaded_values()
+
+        return Response(self.get_serializer(objs, many=True).data, status=status.HTTP_201_CREATED)
+
+    def _bulk_update(self, request):
+        items = request.data
+        error = self._bulk_limit_error(items)
+        if error:
+            return error
+
+        ids = self._valid_ids(item.get('id') if isinstance(item, dict) else None for item in items)
+        if ids is None:
+            return Response({'error': 'Every item needs a valid id'}, status=status.HTTP_400_BAD_REQUEST)
+        # Two updates of one row would be applied in an arbitrary order
+        repeated = [str(pk) for pk, n in Counter(ids).items() if n > 1]
+        if repeated:
+            return Response({'error': 'Each id may appear only once', 'ids': repeated}, status=status.HTTP_400_BAD_REQUEST)
+
+        instances = self.get_queryset().in_bulk(ids)
+        errors, updates, fields = [], [], set()
+        for pk, item in zip(ids, items):
+            instance = instances.get(pk)
+            if instance is None:
+                errors.append({'id': ['Not found']})
+                continue
+            serializer = self.get_serializer(instance, data=item, partial=True)
+            if serializer.is_valid():
+                data = dict(serializer.validated_data)
+                # Ownership never changes through the API
+                data.pop('user', None)
+                errors.append({})
+                updates.append((instance, data))
+                fields.update(data)
+            else:
+                errors.append(serializer.errors)
+        if any(errors):
+            return Response({'error': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        # bulk_update() skips auto_now and pre_save: stamp updated_at for delta
+        # sync and refresh the derived keys
+        now = timezone.now()
+        changed = []
+        for instance, data in updates:
+            for field, value in data.items():
+                setattr(instance, field, value)
+            # Items that change nothing are neither written nor logged
+            if instance.get_dirty_fields():
+                instance.updated_at = now
+                refresh_keys(instance)
+                changed.append(instance)
+        objs = [instance for instance, _ in updates]
+        if changed:
+            model = type(changed[0])
+            key_names = [field.name for field in key_fields(model)]
+            with transaction.atomic():
+                # Rows for new labels are created with the update they belong to
+                for instance in changed:
+                    resolve_pending_labels(instance)
+                model.objects.bulk_update(changed, sorted(fields | {'updated_at', *key_names}))
+                # Bursts of updates merge into recent activities, as on the per-row path
+                activities = coalesce_update_activities([self.build_activity(obj, False) for obj in changed])
+                activities = Activity.objects.bulk_create(activities)
+                self._apply_dashboard_deltas(request.user.pk, [save_deltas(obj, False) for obj in changed], activities)
+                bump_version(request.user.pk, model._meta.db_table, Activity._meta.db_table)
+        for obj in changed:
+            obj.remember_loaded_values()
+
+        return Response(self.get_serializer(objs, many=True).data, status=status.HTTP_200_OK)
+
+    def _bulk_destroy(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        error = self._bulk_limit_error(ids)
+        if error:
+            return error
+
+        ids = self._valid_ids(ids)
+        if ids is None:
+            return Response({'error': 'Invalid id in ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset().filter(id__in=ids)
+        with transaction.atomic():
+            objs = list(queryset.select_for_update())
+            if objs:
+                cascaded = cascaded_activity_deltas(queryset.model, [obj.pk for obj in objs])
+                with mute_change_tracking():
+                    queryset.delete()
+                activities = Activity.objects.bulk_create([self.build_delete_activity(obj) for obj in objs])
+                Tombstone.objects.bulk_create([Tombstone.for_instance(obj) for obj in objs])
+                self._apply_dashboard_deltas(
+                    request.user.pk, [instance_deltas(obj, sign=-1) for obj in objs] + [cascaded], activities
+                )
+                bump_version(request.user.pk, queryset.model._meta.db_table, Activity._meta.db_table)
+
+        return Response({'deleted': len(objs)}, status=status.HTTP_200_OK)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+@register()
+def check_etag_cache(app_configs, **kwargs):
+    """
+    ETag version counters must live in a cache shared by every worker: with
+    a per-process cache, a bump in one worker is invisible to the others and
+    they keep answering 304 with stale data.
+    """
+    if not getattr(settings, 'ETAG_ENABLED', False):
+        return []
+    alias = getattr(settings, 'ETAG_CACHE_ALIAS', 'default')
+    if not isinstance(caches[alias], LocMemCache):
+        return []
+    return [Error(
+        f"ETAG_ENABLED needs a shared cache, but the '{alias}' cache is per-process (locmem).",
+        hint='Set REDIS_URL, or disable ETags with ETAG_ENABLED=False.',
+        id='api.E001',
+    )]
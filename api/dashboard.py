@@ -0,0 +1,207 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Activity, Contact, DashboardCounter, Prospect
+from .references import ReferenceField
+
+
+# (dimension, field) pairs counted for each model
+DIMENSIONS = {
+    Contact: [('contact_type', 'type')],
+    Prospect: [('prospect_status', 'status'), ('prospect_wilaya', 'wilaya'), ('prospect_secteur', 'secteur')],
+}
+ACTIVITY_DIMENSION = 'activity_type'
+
+
+def _value(value):
+    return '' if value is None else str(value)[:255]
+
+
+def instance_deltas(instance, sign=1, previous=False):
+    """Counter deltas contributed by a Contact/Prospect (its loaded values if `previous`)"""
+    deltas = Counter()
+    for dimension, field in DIMENSIONS[type(instance)]:
+        if previous:
+            marker = object()
+            model_field = instance._meta.get_field(field)
+            value = instance.get_loaded_value(model_field.attname, marker)
+            if value is marker:
+                continue
+            if isinstance(model_field, ReferenceField):
+                value = model_field.label(value)
+        else:
+            value = getattr(instance, field)
+        deltas[(dimension, _value(value), '')] += sign
+    return deltas
+
+
+def save_deltas(instance, created):
+    """Counter deltas for saving a Contact/Prospect: move it out of its old groups and into the new ones"""
+    deltas = instance_deltas(instance)
+    if not created:
+        previous = instance_deltas(instance, sign=-1, previous=True)
+        if not previous:
+            # Old values unknown (instance not loaded from the DB): leave drift to rebuild_dashboard
+            return Counter()
+        deltas.update(previous)
+    return deltas
+
+
+def activity_deltas(activities):
+    """Counter deltas per user for newly logged activities, bucketed by day"""
+    per_user = {}
+    day = timezone.localdate().isoformat()
+    for activity in activities:
+        bucket = activity.timestamp.date().isoformat() if activity.timestamp else day
+        per_user.setdefault(activity.user_id, Counter())[(ACTIVITY_DIMENSION, activity.type, bucket)] += 1
+    return per_user
+
+
+def cascaded_activity_deltas(model, pks):
+    """
+    Negative deltas for the activities that deleting these contacts/prospects
+    will cascade-delete (one grouped query on the activity foreign key).
+    """
+    since = timezone.now() - timedelta(days=getattr(settings, 'DASHBOARD_ACTIVITY_DAYS', 30))
+    rows = (
+        Activity.objects.filter(**{f'{model._meta.model_name}__in': pks}, timestamp__gte=since)
+        .annotate(day=TruncDate('timestamp')).values('type', 'day').annotate(n=Count('pk')).order_by()
+    )
+    return Counter({(ACTIVITY_DIMENSION, row['type'], row['day'].isoformat()): -row['n'] for row in rows})
+
+
+def apply_user_deltas(per_user):
+    """
+    Add counter deltas ({user_id: Counter}) to the counters in one
+    INSERT ... ON CONFLICT statement, creating missing counters
+    """
+    rows = [
+        (user_id, dimension, value, bucket, delta)
+        for user_id, deltas in per_user.items()
+        for (dimension, value, bucket), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    connection = connections[router.db_for_write(DashboardCounter)]
+    table = connection.ops.quote_name(DashboardCounter._meta.db_table)
+    count = connection.ops.quote_name('count')
+    columns = ', '.join(connection.ops.quote_name(name) for name in ('user_id', 'dimension', 'value', 'bucket', 'count'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))} '
+            f'ON CONFLICT (user_id, dimension, value, bucket) DO UPDATE SET {count} = {table}.{count} + excluded.{count}',
+            [param for row in rows for param in row],
+        )
+
+
+def apply_deltas(user_id, deltas):
+    apply_user_deltas({user_id: deltas})
+
+
+def _activity_cutoff():
+    """Oldest activity bucket the dashboard (and rebuild_dashboard) counts"""
+    return (timezone.localdate() - timedelta(days=getattr(settings, 'DASHBOARD_ACTIVITY_DAYS', 30))).isoformat()
+
+
+# Day each user's expired activity buckets were last pruned, per process
+_pruned_on = {}
+
+
+def prune_activity_buckets(user_id):
+    """Delete the user's activity buckets older than the dashboard window, once a day"""
+    today = timezone.localdate()
+    if _pruned_on.get(user_id) == today:
+        return
+    DashboardCounter.objects.filter(user_id=user_id, dimension=ACTIVITY_DIMENSION, bucket__lt=_activity_cutoff()).delete()
+    _pruned_on[user_id] = today
+
+
+def record_activities(activities, deltas=None):
+    """
+    Count newly logged activities, with the other counter deltas
+    ({user_id: Counter}) written alongside them, in one upsert
+    """
+    per_user = activity_deltas(activities)
+    for user_id, user_deltas in (deltas or {}).items():
+        per_user.setdefault(user_id, Counter()).update(user_deltas)
+    apply_user_deltas(per_user)
+    for user_id in {activity.user_id for activity in activities}:
+        prune_activity_buckets(user_id)
+
+
+def rebuild_dashboard(user):
+    """Recompute every counter of `user` from the tables (fixes drift, prunes old activity days)"""
+    days = getattr(settings, 'DASHBOARD_ACTIVITY_DAYS', 30)
+    since = timezone.now() - timedelta(days=days)
+    counters = []
+    for model, dimensions in DIMENSIONS.items():
+        for dimension, field in dimensions:
+            model_field = model._meta.get_field(field)
+            # Reference fields are grouped by id (an index-only scan), counted by label
+            label = model_field.label if isinstance(model_field, ReferenceField) else None
+            rows = model.objects.filter(user=user).values(model_field.attname).annotate(n=Count('pk')).order_by()
+            merged = Counter()
+            for row in rows:
+                value = row[model_field.attname]
+                merged[_value(label(value) if label else value)] += row['n']
+            counters.extend(
+                DashboardCounter(user=user, dimension=dimension, value=value, count=n)
+                for value, n in merged.items()
+            )
+    rows = (
+        Activity.objects.filter(user=user, timestamp__gte=since)
+        .annotate(day=TruncDate('timestamp')).values('type', 'day').annotate(n=Count('pk')).order_by()
+    )
+    counters.extend(
+        DashboardCounter(user=user, dimension=ACTIVITY_DIMENSION, value=row['type'],
+                         bucket=row['day'].isoformat(), count=row['n'])
+        for row in rows
+    )
+    with transaction.atomic():
+        DashboardCounter.objects.filter(user=user).delete()
+        DashboardCounter.objects.bulk_create(counters)
+    return len(counters)
+
+
+def dashboard_for(user):
+    """Build the dashboard payload from the user's counters in a single query"""
+    today = timezone.localdate()
+    week_start = (today - timedelta(days=6)).isoformat()
+    month_start = (today - timedelta(days=getattr(settings, 'DASHBOARD_ACTIVITY_DAYS', 30) - 1)).isoformat()
+
+    groups = {dimension: {} for dimensions in DIMENSIONS.values() for dimension, _ in dimensions}
+    last_7, last_30 = Counter(), Counter()
+    # Only the rows shown: no emptied groups, no activity days out of the window
+    rows = DashboardCounter.objects.filter(
+        Q(bucket='') | Q(dimension=ACTIVITY_DIMENSION, bucket__gte=month_start), user=user,
+    ).exclude(count=0)
+    for dimension, value, bucket, count in rows.values_list('dimension', 'value', 'bucket', 'count'):
+        if dimension == ACTIVITY_DIMENSION:
+            last_30[value] += count
+            if bucket >= week_start:
+                last_7[value] += count
+        else:
+            groups.setdefault(dimension, {})[value] = count
+
+    return {
+        'prospects': {
+            'total': sum(groups['prospect_status'].values()),
+            'by_status': groups['prospect_status'],
+            'by_wilaya': groups['prospect_wilaya'],
+            'by_secteur': groups['prospect_secteur'],
+        },
+        'contacts': {
+            'total': sum(groups['contact_type'].values()),
+            'by_type': groups['contact_type'],
+        },
+        'activities': {
+            'last_7_days': {value: count for value, count in last_7.items() if count},
+            'last_30_days': {value: count for value, count in last_30.items() if count},
+        },
+    }
@@ -0,0 +1,163 @@
+"""
+PostgreSQL backend that takes connections from a psycopg 3 connection pool.
+
+Django 5.1 ships this as the `pool` option of the postgresql backend; this is
+the same thing for Django 4.2, configured the same way so upgrading is just a
+change of ENGINE:
+
+    DATABASES['default'] = {
+        'ENGINE': 'api.db.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': {'min_size': 2, 'max_size': 10, 'timeout': 10}},
+        ...
+    }
+
+Closing a connection (at the end of every request with CONN_MAX_AGE = 0)
+hands it back to the per-process pool instead of disconnecting, so requests
+skip connection setup. With CONN_HEALTH_CHECKS, the pool checks a connection
+before handing it out. Pools are closed before the test database is dropped
+or cloned, and when the process exits.
+"""
+import atexit
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel, is_psycopg3
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError as e:
+    raise ImproperlyConfigured(f"Error loading psycopg_pool module: {e}")
+
+if not is_psycopg3:
+    raise ImproperlyConfigured('api.db.postgresql_pool requires psycopg 3')
+
+
+# (alias, database name, pid) -> pool. The name changes when the test runner
+# switches to the test database; the pid, when a worker is forked.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_stats(wrappers=None):
+    """
+    Current statistics of this process's pools, by database alias, for the
+    pooled connections among `wrappers` (default: every alias). Aliases
+    whose pool is not open yet get empty statistics: reading them never
+    opens a pool.
+    """
+    stats = {}
+    for wrapper in connections.all() if wrappers is None else wrappers:
+        if not isinstance(wrapper, DatabaseWrapper) or not wrapper.pool_options:
+            continue
+        pool = _pools.get(wrapper.pool_key)
+        stats[wrapper.alias] = pool.get_stats() if pool is not None else {}
+    return stats
+
+
+def close_pools(alias=None):
+    """Close this process's pools, or only those of database `alias`"""
+    with _pools_lock:
+        for key in list(_pools):
+            if alias is None or key[0] == alias:
+                _pools.pop(key).close()
+
+
+atexit.register(close_pools)
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # The pools' idle connections would block DROP DATABASE and CREATE DATABASE ... TEMPLATE
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.connection.close_pool()
+        return super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.connection.close_pool()
+        return super()._clone_test_db(suffix, verbosity, keepdb)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, settings_dict, alias=DEFAULT_DB_ALIAS):
+        super().__init__(settings_dict, alias)
+        if self.pool_options and self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured('Pooled connections require CONN_MAX_AGE = 0.')
+
+    @property
+    def pool_options(self):
+        return self.settings_dict['OPTIONS'].get('pool')
+
+    @property
+    def pool_key(self):
+        return (self.alias, self.settings_dict['NAME'], os.getpid())
+
+    @property
+    def pool(self):
+        options = self.pool_options
+        if not options or self.alias == NO_DB_ALIAS:
+            return None
+        key = self.pool_key
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    options = {} if options is True else dict(options)
+                    pool = ConnectionPool(
+                        kwargs=self.get_connection_params(),
+                        configure=self._configure_connection,
+                        check=ConnectionPool.check_connection if self.settings_dict['CONN_HEALTH_CHECKS'] else None,
+                        name=self.alias,
+                        open=False,
+                        **options,
+                    )
+                    pool.open()
+                    _pools[key] = pool
+        return pool
+
+    def close_pool(self):
+        """Close the pools of this alias, whichever database name they were opened for"""
+        close_pools(self.alias)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def _isolation_level(self):
+        try:
+            return IsolationLevel(self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED))
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {self.settings_dict['OPTIONS']['isolation_level']} "
+                f"specified. Use one of the psycopg.IsolationLevel values."
+            )
+
+    def _configure_connection(self, connection):
+        # Runs once for each new connection of the pool (possibly in a pool thread)
+        if 'isolation_level' in self.settings_dict['OPTIONS']:
+            connection.isolation_level = self._isolation_level()
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        self.isolation_level = self._isolation_level()
+        return pool.getconn()
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                # Back to the pool, which rolls back any open transaction
+                self.connection._pool.putconn(self.connection)
+                self.connection = None
+            return
+        return super()._close()
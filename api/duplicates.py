@@ -0,0 +1,182 @@
+from collections import defaultdict
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import Q
+
+from .phones import NormalizedKeyField
+from .references import split_words
+
+
+# Words that do not tell companies apart: legal forms and articles
+IGNORED_NAME_WORDS = frozenset({
+    'sarl', 'eurl', 'spa', 'snc', 'scs', 'sca', 'ets', 'etablissement', 'etablissements',
+    'entreprise', 'ste', 'societe', 'cie', 'groupe', 'group',
+    'el', 'al', 'de', 'des', 'du', 'la', 'le', 'les', 'et', 'd', 'l',
+})
+# Characters of the normalized name kept in the name blocking key
+NAME_KEY_PREFIX = 6
+
+# Exact keys a duplicate can share, in report order, with the score they give
+BLOCKING_KEYS = (
+    ('nif', 'nif', 1.0),
+    ('registre_commerce', 'registre_commerce', 1.0),
+    ('name_key', 'name', None),
+    ('phone_key', 'phone', 0.9),
+    ('email_key', 'email', 0.9),
+)
+CANDIDATE_FIELDS = (
+    'id', 'user_id', 'entreprise', 'commune_id', 'nif', 'registre_commerce', 'name_key', 'phone_key', 'email_key',
+)
+
+def normalize_name(entreprise):
+    """
+    Company name reduced to its distinguishing words, sorted so that word
+    order does not matter: 'SARL El Baraka' and 'Baraka (EURL)' both give
+    'baraka'.
+    """
+    words = split_words(entreprise)
+    return ' '.join(sorted([word for word in words if word not in IGNORED_NAME_WORDS] or words))
+
+
+def normalize_place(value):
+    """'Béjaïa', 'BEJAIA' and '06 - Bejaia' all give 'bejaia'"""
+    words = split_words(value)
+    return ''.join([word for word in words if not word.isdigit()] or words)
+
+
+def name_key(entreprise, wilaya):
+    """
+    Blocking key for near-identical names: the wilaya plus the first
+    NAME_KEY_PREFIX characters of the normalized name, so spelling
+    differences at the end of a name land in the same block.
+    """
+    name = normalize_name(entreprise).replace(' ', '')
+    if not name:
+        return ''
+    return f"{normalize_place(wilaya)}:{name[:NAME_KEY_PREFIX]}"
+
+
+def normalize_email(value):
+    value = (value or '').strip().lower()
+    return value if '@' in value else ''
+
+
+class NameKeyField(NormalizedKeyField):
+    """name_key() of the entreprise and wilaya fields"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 120)
+        super().__init__(*args, **kwargs)
+
+    def compute(self, model_instance):
+        return name_key(model_instance.entreprise, model_instance.wilaya)
+
+
+class EmailKeyField(NormalizedKeyField):
+    """normalize_email() of the email field"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 255)
+        super().__init__(*args, **kwargs)
+
+    def compute(self, model_instance):
+        return normalize_email(model_instance.email)
+
+
+def score_pair(a, b):
+    """
+    (score, reasons) for two candidate rows (dicts of CANDIDATE_FIELDS).
+    Shared NIF or RC scores 1, shared phone or email 0.9, and names in the
+    same block their similarity ratio when it reaches
+    DUPLICATE_NAME_SIMILARITY and the communes do not differ. The score is
+    the best of these; reasons is empty for unrelated rows.
+    """
+    score, reasons = 0.0, []
+    for field, reason, weight in BLOCKING_KEYS:
+        if not a[field] or a[field] != b[field]:
+            continue
+        if field == 'name_key':
+            if a['commune_id'] and b['commune_id'] and a['commune_id'] != b['commune_id']:
+                continue
+            weight = SequenceMatcher(None, normalize_name(a['entreprise']), normalize_name(b['entreprise'])).ratio()
+            if weight < settings.DUPLICATE_NAME_SIMILARITY:
+                continue
+        score = max(score, weight)
+        reasons.append(reason)
+    return round(score, 2), reasons
+
+
+def candidate_row(prospect):
+    return {field: getattr(prospect, field) for field in CANDIDATE_FIELDS}
+
+
+def find_duplicates(prospect):
+    """
+    Existing prospects of the same user that `prospect` likely duplicates,
+    best match first: [{'id', 'entreprise', 'score', 'reasons'}]. Only the
+    rows sharing one of its blocking keys are read, through the (user, key)
+    indexes.
+    """
+    row = candidate_row(prospect)
+    shared = Q()
+    for field, _, _ in BLOCKING_KEYS:
+        if row[field]:
+            shared |= Q(**{field: row[field]})
+    if not shared:
+        return []
+
+    candidates = (
+        type(prospect).objects.filter(shared, user_id=prospect.user_id)
+        .exclude(pk=prospect.pk)
+        .values(*CANDIDATE_FIELDS)[:settings.DUPLICATE_MAX_BLOCK_SIZE]
+    )
+    duplicates = []
+    for candidate in candidates:
+        score, reasons = score_pair(row, candidate)
+        if reasons:
+            duplicates.append({'id': candidate['id'], 'entreprise': candidate['entreprise'], 'score': score, 'reasons': reasons})
+    duplicates.sort(key=lambda duplicate: -duplicate['score'])
+    return duplicates
+
+
+def find_duplicate_pairs(queryset, min_score=0.0, max_block_size=None):
+    """
+    Score every pair of prospects in `queryset` sharing a blocking key
+    (within one user). The rows are read once and bucketed by key, so the
+    cost grows with the block sizes rather than the square of the portfolio.
+    Blocks larger than `max_block_size` (a placeholder email, a switchboard
+    number) are skipped.
+
+    Returns (pairs, skipped_blocks), pairs being [(score, reasons, row, row)]
+    best first.
+    """
+    max_block_size = max_block_size or settings.DUPLICATE_MAX_BLOCK_SIZE
+    rows = {}
+    blocks = defaultdict(list)
+    for row in queryset.values(*CANDIDATE_FIELDS).iterator(chunk_size=5000):
+        rows[row['id']] = row
+        for field, _, _ in BLOCKING_KEYS:
+            if row[field]:
+                blocks[(row['user_id'], field, row[field])].append(row['id'])
+
+    scored = set()
+    pairs = []
+    skipped_blocks = 0
+    for ids in blocks.values():
+        if len(ids) < 2:
+            continue
+        if len(ids) > max_block_size:
+            skipped_blocks += 1
+            continue
+        for pair in combinations(sorted(ids), 2):
+            # score_pair() looks at every key, a pair sharing several is scored once
+            if pair in scored:
+                continue
+            scored.add(pair)
+            score, reasons = score_pair(rows[pair[0]], rows[pair[1]])
+            if reasons and score >= min_score:
+                pairs.append((score, reasons, rows[pair[0]], rows[pair[1]]))
+    pairs.sort(key=lambda pair: -pair[0])
+    return pairs, skipped_blocks
@@ -0,0 +1,235 @@
+import csv
+import io
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .dashboard import rebuild_dashboard
+from .etags import bump_version
+from .models import Activity, Prospect
+from .phones import key_fields
+from .references import ReferenceField, labels_for
+from .signals import build_prospect_activity
+
+
+IMPORT_FIELDS = [
+    'entreprise', 'adresse', 'wilaya', 'commune', 'phone_number', 'email', 'categorie',
+    'forme_legale', 'secteur', 'sous_secteur', 'nif', 'registre_commerce', 'status',
+]
+
+# Fields stored as reference ids: mapped from their labels while staging rows
+REFERENCE_FIELDS = {
+    name: Prospect._meta.get_field(name) for name in IMPORT_FIELDS
+    if isinstance(Prospect._meta.get_field(name), ReferenceField)
+}
+
+# Derived lookup keys (phone, duplicate detection) computed while staging rows
+KEY_FIELDS = key_fields(Prospect)
+
+# Upper bound on invalid rows echoed back, the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+# Characters sent per write when COPYing with psycopg 3
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class ProspectImporter:
+    """
+    Import prospects for one user from a CSV stream whose header names
+    Prospect fields (unknown columns are ignored).
+
+    Rows are parsed and validated in a single streaming pass, with the
+    per-column checks (max length, required) precomputed once. On Postgres,
+    valid rows (reference labels mapped to their ids) are COPY'd into a
+    temporary staging table and merged with one INSERT ... SELECT that skips
+    rows whose nif or registre_commerce already exists for the user (or
+    repeats an earlier row of the file); the same statement inserts the
+    matching `prospect_added` activities. Each key is checked on its own
+    (window functions within the file, one anti-join per key against the
+    table) so every step can hash or use an index instead of comparing
+    pairs of rows. Other databases use an equivalent in-Python
+    merge with bulk_create.
+    """
+
+    def __init__(self, user, default_status='New', batch_size=5000):
+        self.user = user
+        self.default_status = default_status
+        self.batch_size = batch_size
+        self.max_lengths = {
+            name: Prospect._meta.get_field(name).max_length for name in IMPORT_FIELDS
+        }
+        for name, field in REFERENCE_FIELDS.items():
+            self.max_lengths[name] = labels_for(field.related_model).max_length
+        self.required = {
+            name for name in IMPORT_FIELDS if not Prospect._meta.get_field(name).null
+        }
+
+    def clean_rows(self, text_stream, errors):
+        """Yield validated rows as tuples in IMPORT_FIELDS order, recording invalid ones in `errors`"""
+        reader = csv.DictReader(text_stream)
+        columns = [name for name in IMPORT_FIELDS if name in (reader.fieldnames or [])]
+        for line, raw in enumerate(reader, start=2):
+            row = {}
+            problems = []
+            for name in columns:
+                value = (raw.get(name) or '').strip() or None
+                if value is not None and len(value) > self.max_lengths[name]:
+                    problems.append(f"{name} longer than {self.max_lengths[name]} characters")
+                row[name] = value
+            if not row.get('status'):
+                row['status'] = self.default_status
+            problems.extend(f"{name} is required" for name in self.required if not row.get(name))
+            if problems:
+                errors.append({'line': line, 'errors': problems})
+                continue
+            yield tuple(row.get(name) for name in IMPORT_FIELDS)
+
+    def run(self, text_stream):
+        started = time.monotonic()
+        errors = []
+        rows = self.clean_rows(text_stream, errors)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                received, created = self._merge_with_copy(rows)
+            else:
+                received, created = self._merge_with_orm(rows)
+            if created:
+                # Set-based import: recount the dashboard rather than tracking each row
+                rebuild_dashboard(self.user)
+                bump_version(self.user.pk, Prospect._meta.db_table, Activity._meta.db_table)
+
+        return {
+            'created': created,
+            'duplicates': received - created,
+            'invalid': len(errors),
+            'errors': errors[:MAX_REPORTED_ERRORS],
+            'elapsed': round(time.monotonic() - started, 3),
+        }
+
+    def _merge_with_copy(self, rows):
+        attnames = [Prospect._meta.get_field(name).attname for name in IMPORT_FIELDS]
+        columns = ', '.join(attnames)
+        keys = ', '.join(field.name for field in KEY_FIELDS)
+        staging = ', '.join(
+            f'{attname} smallint' if name in REFERENCE_FIELDS else f'{name} text'
+            for name, attname in zip(IMPORT_FIELDS, attnames)
+        )
+        references = {
+            index: labels_for(REFERENCE_FIELDS[name].related_model)
+            for index, name in enumerate(IMPORT_FIELDS) if name in REFERENCE_FIELDS
+        }
+        received = 0
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024, mode='w+', newline='') as buffer:
+            writer = csv.writer(buffer)
+            for row in rows:
+                record = SimpleNamespace(**dict(zip(IMPORT_FIELDS, row)))
+                values = [
+                    references[index].resolve(value) if index in references else value
+                    for index, value in enumerate(row)
+                ]
+                writer.writerow([
+                    *('' if value is None else value for value in values),
+                    *(field.compute(record) for field in KEY_FIELDS),
+                ])
+                received += 1
+            buffer.seek(0)
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE prospects_import "
+                    f"(row_num bigserial, {staging}, {', '.join(f'{field.name} text' for field in KEY_FIELDS)}) "
+                    f"ON COMMIT DROP"
+                )
+                copy_sql = f"COPY prospects_import ({columns}, {keys}) FROM STDIN WITH (FORMAT csv)"
+                if hasattr(cursor.cursor, 'copy_expert'):
+                    # psycopg2
+                    cursor.cursor.copy_expert(copy_sql, buffer)
+                else:
+                    with cursor.cursor.copy(copy_sql) as copy:
+                        while chunk := buffer.read(COPY_CHUNK_SIZE):
+                            copy.write(chunk)
+                # The merge below plans its joins from the row count and value spread
+                cursor.execute("ANALYZE prospects_import")
+                cursor.execute(
+                    f"""
+                    WITH ranked AS (
+                        SELECT *,
+                               row_number() OVER (PARTITION BY nif ORDER BY row_num) AS nif_rank,
+                               row_number() OVER (PARTITION BY registre_commerce ORDER BY row_num) AS rc_rank
+                        FROM prospects_import
+                    ),
+                    staged AS (
+                        SELECT * FROM ranked
+                        WHERE (nif IS NULL OR nif_rank = 1)
+                          AND (registre_commerce IS NULL OR rc_rank = 1)
+                    ),
+                    inserted AS (
+                        INSERT INTO prospects (id, {columns}, {keys}, user_id, updated_at)
+                        SELECT gen_random_uuid(), {', '.join(f's.{attname}' for attname in attnames)},
+                               {', '.join(f"COALESCE(s.{field.name}, '')" for field in KEY_FIELDS)},
+                               %(user_id)s, now()
+                        FROM staged s
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM prospects p
+                            WHERE p.user_id = %(user_id)s AND p.nif = s.nif
+                        )
+                        AND NOT EXISTS (
+                            SELECT 1 FROM prospects p
+                            WHERE p.user_id = %(user_id)s AND p.registre_commerce = s.registre_commerce
+                        )
+                        RETURNING id, entreprise
+                    )
+                    INSERT INTO activities (id, title, description, "type", "timestamp", user_id, prospect_id)
+                    SELECT gen_random_uuid(), 'Prospect ajouté', 'New prospect created: ' || entreprise,
+                           'prospect_added', now(), %(user_id)s, id
+                    FROM inserted
+                    """,
+                    {'user_id': self.user.pk},
+                )
+                created = cursor.rowcount
+        return received, created
+
+    def _merge_with_orm(self, rows):
+        existing = Prospect.objects.filter(user=self.user).filter(
+            Q(nif__isnull=False) | Q(registre_commerce__isnull=False)
+        ).values_list('nif', 'registre_commerce')
+        seen_nif, seen_rc = set(), set()
+        for nif, rc in existing.iterator():
+            if nif:
+                seen_nif.add(nif)
+            if rc:
+                seen_rc.add(rc)
+
+        received = created = 0
+        batch = []
+        nif_index = IMPORT_FIELDS.index('nif')
+        rc_index = IMPORT_FIELDS.index('registre_commerce')
+        for row in rows:
+            received += 1
+            nif, rc = row[nif_index], row[rc_index]
+            if (nif and nif in seen_nif) or (rc and rc in seen_rc):
+                continue
+            if nif:
+                seen_nif.add(nif)
+            if rc:
+                seen_rc.add(rc)
+            batch.append(Prospect(user=self.user, **dict(zip(IMPORT_FIELDS, row))))
+            if len(batch) >= self.batch_size:
+                created += self._write_batch(batch)
+                batch = []
+        if batch:
+            created += self._write_batch(batch)
+        return received, created
+
+    def _write_batch(self, batch):
+        Prospect.objects.bulk_create(batch)
+        Activity.objects.bulk_create([build_prospect_activity(prospect, True) for prospect in batch])
+        return len(batch)
+
+
+def open_text(fileobj):
+    """Wrap a binary upload or file in a text stream (BOM-tolerant UTF-8)"""
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.partitions import add_months, archive_partitions, create_partitions, is_partitioned, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the monthly partitions of the activities table ahead of time, and detach "
+        "activities older than the retention period into per-user gzipped CSV archives (PostgreSQL only)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.ACTIVITY_PARTITION_MONTHS_AHEAD,
+                            help='Create partitions up to this many months after the current one')
+        parser.add_argument('--retention-months', type=int, default=settings.ACTIVITY_RETENTION_MONTHS,
+                            help='Archive activities older than this many months before the current month '
+                                 '(0 disables archiving)')
+        parser.add_argument('--archive-dir', default=settings.ACTIVITY_ARCHIVE_DIR,
+                            help='Directory receiving the archive files')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("The activities table is not partitioned (PostgreSQL with migration 0012 required)")
+
+        now = timezone.now()
+        for name in create_partitions(options['months_ahead'], now):
+            self.stdout.write(f"Created partition {name}")
+
+        if options['retention_months'] > 0:
+            before = add_months(month_start(now), -options['retention_months'])
+            for name, path in archive_partitions(before, options['archive_dir']):
+                self.stdout.write(f"Archived partition {name} to {path}")
+
+        self.stdout.write(self.style.SUCCESS("Activity partitions are up to date"))
@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from api.benchmark import SCENARIOS, compare_to_baseline, run_benchmark, run_concurrency, run_renderer_comparison, seed
+
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and benchmark every API route (p50/p95/p99 latency, "
+        "throughput, SQL queries per request), failing on regressions against a stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2)
+        parser.add_argument('--contacts', type=int, default=200, help='Contacts per user')
+        parser.add_argument('--prospects', type=int, default=500, help='Prospects per user')
+        parser.add_argument('--activities', type=int, default=2000, help='Activities per user')
+        parser.add_argument('--iterations', type=int, default=100, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data')
+        parser.add_argument('--only', action='append', default=[],
+                            help='Benchmark only routes whose name starts with this (repeatable)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write the results as the new baseline instead of comparing')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed median slowdown over the baseline (0.5 = 50%%)')
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Also compare a mixed load through WSGI (one request at a time) and '
+                                 'ASGI with the async views and this many requests in flight')
+        parser.add_argument('--concurrency-requests', type=int, default=400,
+                            help='Requests sent in the WSGI/ASGI comparison')
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help='Simulated round trip added to every query in the WSGI/ASGI comparison')
+        parser.add_argument('--renderers', action='store_true',
+                            help='Also compare the stdlib and fast JSON renderers, and gzip/brotli, '
+                                 'on the contact, prospect and activity lists')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['only'] or scenario.name.startswith(tuple(options['only']))
+        ]
+        if not scenarios:
+            raise CommandError('No route matches --only')
+
+        # Isolated test database, so runs are reproducible and never touch real data
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            contexts = seed(
+                users=max(options['users'], 1), contacts=options['contacts'], prospects=options['prospects'],
+                activities=options['activities'], seed=options['seed'],
+            )
+            results = run_benchmark(contexts, options['iterations'], options['warmup'], scenarios)
+            concurrency = None
+            if options['concurrency']:
+                concurrency = run_concurrency(
+                    contexts, options['concurrency_requests'], options['concurrency'], options['db_latency_ms'],
+                )
+            renderers = run_renderer_comparison(contexts) if options['renderers'] else None
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'route':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>9}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<24}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+                f"{stats['throughput_rps']:>10}{stats['queries']:>9}"
+            )
+
+        if concurrency:
+            self.stdout.write(
+                f"Mixed load, {concurrency['requests']} requests: WSGI {concurrency['wsgi_rps']} req/s, "
+                f"ASGI x{concurrency['concurrency']} {concurrency['asgi_rps']} req/s"
+            )
+
+        if renderers:
+            self.stdout.write(f"{'list':<24}{'bytes':>9}{'stdlib us':>11}{'fast us':>9}{'gzip':>16}{'br':>16}")
+            for name, stats in renderers.items():
+                compressed = [
+                    f"{stats['compressed'][encoding]['bytes']} {stats['compressed'][encoding]['cpu_us']}us"
+                    if encoding in stats['compressed'] else '-'
+                    for encoding in ('gzip', 'br')
+                ]
+                self.stdout.write(
+                    f"{name:<24}{stats['bytes']:>9}{stats['render_us']['stdlib']:>11}{stats['render_us']['fast']:>9}"
+                    f"{compressed[0]:>16}{compressed[1]:>16}"
+                )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}, nothing to compare"))
+            return
+
+        regressions = compare_to_baseline(results, json.loads(baseline_path.read_text()), options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.duplicates import find_duplicate_pairs
+from api.models import Prospect
+
+
+class Command(BaseCommand):
+    help = (
+        "List likely duplicate prospects (shared NIF/RC, phone or email, or near-identical "
+        "names in the same wilaya), one tab-separated pair per line, best match first"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only scan this username (phone number)')
+        parser.add_argument('--min-score', type=float, default=0.0, help='Only report pairs scoring at least this')
+        parser.add_argument('--max-block-size', type=int,
+                            help='Skip blocking keys shared by more prospects (default DUPLICATE_MAX_BLOCK_SIZE)')
+
+    def handle(self, *args, **options):
+        prospects = Prospect.objects.all()
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+            prospects = prospects.filter(user=user)
+
+        started = time.monotonic()
+        pairs, skipped = find_duplicate_pairs(prospects, options['min_score'], options['max_block_size'])
+        for score, reasons, a, b in pairs:
+            self.stdout.write('\t'.join([
+                f"{score:.2f}", ','.join(reasons), str(a['id']), a['entreprise'], str(b['id']), b['entreprise'],
+            ]))
+        if skipped:
+            self.stderr.write(f"Skipped {skipped} oversized blocks")
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {len(pairs)} likely duplicate pairs in {time.monotonic() - started:.2f}s"
+        ))
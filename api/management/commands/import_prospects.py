@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import ProspectImporter
+
+
+class Command(BaseCommand):
+    help = "Import prospects for a user from a CSV file, skipping duplicate nif / registre_commerce"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV file with a header row naming Prospect fields')
+        parser.add_argument('--user', required=True, help='Username (phone number) of the owner')
+        parser.add_argument('--status', default='New', help='Status for rows without one')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found")
+
+        with open(options['csv_path'], encoding='utf-8-sig', newline='') as stream:
+            result = ProspectImporter(user, default_status=options['status']).run(stream)
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {', '.join(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} prospects, skipped {result['duplicates']} duplicates "
+            f"and {result['invalid']} invalid rows in {result['elapsed']:.2f}s"
+        ))
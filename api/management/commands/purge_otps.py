@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.otp_reaper import purge_expired_otps, purge_lock
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete consumed and expired OTPs in bounded batches and give OTPs without expires_at a default expiry. "
+        "Meant to run from a scheduler (see render.yaml); a run finding another in progress exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OTP_PURGE_BATCH_SIZE,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--retention', type=int, default=settings.OTP_RETENTION_SECONDS,
+                            help='Keep consumed/expired OTPs for this many seconds')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        with purge_lock() as acquired:
+            if not acquired:
+                self.stdout.write('Another purge is in progress, skipping')
+                return
+            result = purge_expired_otps(
+                batch_size=options['batch_size'],
+                retention_seconds=options['retention'],
+                pause=options['pause'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {result['deleted']} OTPs, backfilled expiry on {result['backfilled']} "
+            f"in {result['elapsed']:.2f}s"
+        ))
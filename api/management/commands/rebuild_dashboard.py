@@ -0,0 +1,29 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.dashboard import rebuild_dashboard
+
+
+class Command(BaseCommand):
+    help = "Recompute dashboard counters from the contacts, prospects and activities tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this username (phone number)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} not found")
+
+        started = time.monotonic()
+        rebuilt = counters = 0
+        for user in users.iterator():
+            counters += rebuild_dashboard(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {counters} counters for {rebuilt} users in {time.monotonic() - started:.2f}s"
+        ))
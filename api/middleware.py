@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import time
+import zlib
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .routers import reads_from_replica
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+logger = logging.getLogger('api.performance')
+
+# Stats of the request being served; a ContextVar rather than a thread-local
+# so it follows ASGI requests into the threads that run their queries
+_request_stats = ContextVar('request_query_stats', default=None)
+
+
+class QueryStats:
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper adding each query to the current request's stats"""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.duration += time.perf_counter() - started
+        stats.count += 1
+
+
+def _install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _install_all(**kwargs):
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Counts the SQL queries of each request and their total time (through a
+    connection execute wrapper), reports them in a `Server-Timing` header
+    and logs a JSON line to the `api.performance` logger when a request is
+    slower than SLOW_REQUEST_MS or runs more than SLOW_REQUEST_QUERIES
+    queries.
+
+    Disabled unless SQL_INSTRUMENTATION is set, in which case Django drops
+    the middleware from the chain entirely. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'SLOW_REQUEST_MS', 500)
+        self.slow_queries = getattr(settings, 'SLOW_REQUEST_QUERIES', 50)
+        # Connections are per thread: wrap new ones as they open, and existing
+        # ones from request_started, which Django sends (under ASGI too) in the
+        # thread that runs the view and its queries
+        connection_created.connect(_install, dispatch_uid='api.middleware.install')
+        request_started.connect(_install_all, dispatch_uid='api.middleware.install_all')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self._finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self._finish(request, response, stats, started)
+
+    def _start(self):
+        stats = QueryStats()
+        return stats, _request_stats.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = stats.duration * 1000
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}'
+        )
+        if total_ms >= self.slow_ms or stats.count >= self.slow_queries:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(total_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'queries': stats.count,
+                'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+            }))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets GET/HEAD/OPTIONS requests read from the replica database (see
+    api.routers.PrimaryReplicaRouter), except for clients that made a
+    successful write in the last REPLICA_STICKY_SECONDS: their reads stay on
+    the primary so they see their own writes despite replication lag.
+
+    Clients are identified by their credentials (API token or session
+    cookie). The write markers live in the shared cache, so stickiness holds
+    across workers. Not loaded when no replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REPLICA_DATABASE_ALIAS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        client = self._client_key(request)
+        token = reads_from_replica.set(self._may_use_replica(request, client))
+        try:
+            response = self.get_response(request)
+        finally:
+            reads_from_replica.reset(token)
+        self._remember_write(request, response, client)
+        return response
+
+    async def __acall__(self, request):
+        client = self._client_key(request)
+        token = reads_from_replica.set(self._may_use_replica(request, client))
+        try:
+            response = await self.get_response(request)
+        finally:
+            reads_from_replica.reset(token)
+        self._remember_write(request, response, client)
+        return response
+
+    @staticmethod
+    def _client_key(request):
+        credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not credentials:
+            return None
+        return 'replica-sticky:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+    def _may_use_replica(self, request, client):
+        if request.method not in self.safe_methods:
+            return False
+        return client is None or caches['default'].get(client) is None
+
+    def _remember_write(self, request, response, client):
+        if client is not None and request.method not in self.safe_methods and response.status_code < 400:
+            caches['default'].set(client, 1, timeout=self.sticky_seconds)
+
+
+def accepted_encodings(header):
+    """Content codings of an Accept-Encoding header, without those refused with q=0"""
+    accepted = set()
+    for part in header.split(','):
+        name, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        # Flush every chunk so streamed rows reach the client as they come
+        yield compressor.process(item) + compressor.flush()
+    yield compressor.finish()
+
+
+async def _acompress_sequence(sequence, encoding, brotli_quality):
+    """Async counterpart of the streaming compression, for async streaming responses"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=brotli_quality)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+        flush = partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+    async for item in sequence:
+        yield process(item) + flush()
+    yield finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses JSON, NDJSON and text responses of at least
+    RESPONSE_COMPRESSION_MIN_SIZE bytes with brotli (when installed) or
+    gzip, whichever the client's Accept-Encoding allows, brotli first.
+    Streaming responses (exports), sync or async, are compressed chunk by
+    chunk whatever their size.
+
+    Like Django's GZipMiddleware, it sets `Vary: Accept-Encoding`, keeps the
+    uncompressed body when compression does not shrink it and weakens ETags.
+    Not loaded when RESPONSE_COMPRESSION is off.
+    """
+    compressible_types = ('application/json', 'application/x-ndjson', 'text/')
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'RESPONSE_COMPRESSION', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+        self.brotli_quality = getattr(settings, 'BROTLI_QUALITY', 4)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or not response.get('Content-Type', '').startswith(self.compressible_types):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming and response.is_async:
+            response.streaming_content = _acompress_sequence(response.streaming_content, encoding, self.brotli_quality)
+            del response.headers['Content-Length']
+        elif response.streaming:
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content, self.brotli_quality)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes,
+                )
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,17 @@
+# Composite index backing keyset pagination of activities
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_populate_and_finalize_user_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-timestamp', 'id'], name='activities_user_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Change tracking for delta sync: updated_at on contacts/prospects and tombstones
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0006_activity_user_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['user', 'updated_at'], name='contacts_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'updated_at'], name='prospects_user_updated_idx'),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('object_type', models.CharField(choices=[('contact', 'Contact'), ('prospect', 'Prospect')], max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'tombstones',
+                'indexes': [models.Index(fields=['user', 'deleted_at'], name='tombstones_user_deleted_idx')],
+            },
+        ),
+    ]
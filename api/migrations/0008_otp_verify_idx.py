@@ -0,0 +1,17 @@
+# Index backing the single-statement OTP consume
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_sync_updated_at_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['phone_number', 'otp_code', 'is_valid', 'expires_at'], name='otps_verify_idx'),
+        ),
+    ]
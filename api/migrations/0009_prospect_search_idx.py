@@ -0,0 +1,36 @@
+# Full-text GIN index for prospect search (?q=). Postgres only: on other
+# databases search falls back to icontains filters and no index is created.
+
+from django.db import migrations
+
+SEARCH_FIELDS = ['entreprise', 'nif', 'registre_commerce', 'email', 'phone_number', 'wilaya', 'commune']
+
+# Must stay identical to api.search.PROSPECT_SEARCH_VECTOR_SQL
+SEARCH_VECTOR_SQL = "to_tsvector('simple'::regconfig, {})".format(
+    " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS prospects_search_idx ON prospects USING gin ({SEARCH_VECTOR_SQL})"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS prospects_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_otp_verify_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Indexes used to deduplicate prospects on nif / registre_commerce during import
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_prospect_search_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'nif'], name='prospects_user_nif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'registre_commerce'], name='prospects_user_rc_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Per-user summary counters for the dashboard endpoint
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0010_prospect_dedupe_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('dimension', models.CharField(max_length=30)),
+                ('value', models.CharField(blank=True, default='', max_length=255)),
+                ('bucket', models.CharField(blank=True, default='', max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'dashboard_counters',
+                'constraints': [models.UniqueConstraint(fields=('user', 'dimension', 'value', 'bucket'), name='dashboard_counters_unique')],
+            },
+        ),
+    ]
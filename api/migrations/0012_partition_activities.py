@@ -0,0 +1,108 @@
+# Turns `activities` into a table range-partitioned on timestamp (Postgres
+# only: other databases keep the plain table). The existing table is attached
+# as it is, without copying rows, as the partition for everything before next
+# month; newer rows land in a default partition until `manage.py
+# activity_partitions` creates the monthly ones (see api/partitions.py). The
+# same command archives the legacy partition month by month as its months
+# pass the retention period, and drops it once it is entirely past it.
+#
+# Partitioned tables need the partition key in their primary key, which
+# becomes (id, timestamp). Ids are random UUIDs, so nothing is lost in
+# practice; the ORM keeps using `id` alone.
+#
+# Everything slow (the new primary key index, checking the partition bound)
+# is done on the live table first without blocking writes, so the swap
+# itself only renames and attaches.
+
+from datetime import datetime, timezone
+
+from django.db import migrations, transaction
+
+
+# Built on the current table to become the primary key of its partition
+LEGACY_KEY_INDEX = 'activities_id_timestamp_key'
+BOUND_CHECK = 'activities_partition_bound'
+
+
+def _legacy_name(name):
+    return f"{name[:56]}_legacy"
+
+
+def partition_activities(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    now = datetime.now(timezone.utc)
+    years, month = divmod(now.month, 12)
+    next_month = datetime(now.year + years, month + 1, 1, tzinfo=timezone.utc)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('activities')")
+        if cursor.fetchone()[0] == 'p':
+            return
+        # Leftovers of an interrupted run, so they are neither listed below nor reused half-built
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {LEGACY_KEY_INDEX}")
+        cursor.execute(f"ALTER TABLE activities DROP CONSTRAINT IF EXISTS {BOUND_CHECK}")
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = 'activities'::regclass AND contype = 'p'")
+        pkey = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = 'activities' AND indexname <> %s",
+            [pkey],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'activities'::regclass AND contype = 'f'"
+        )
+        foreign_keys = cursor.fetchall()
+
+        # Prepared on the live table without blocking writes: the unique index
+        # the partition's primary key will use, and a validated CHECK implying
+        # its partition bound so that ATTACH does not scan the table
+        cursor.execute(f'CREATE UNIQUE INDEX CONCURRENTLY {LEGACY_KEY_INDEX} ON activities (id, "timestamp")')
+        cursor.execute(
+            f"ALTER TABLE activities ADD CONSTRAINT {BOUND_CHECK} "
+            f"CHECK (\"timestamp\" IS NOT NULL AND \"timestamp\" < '{next_month.isoformat()}') NOT VALID"
+        )
+        cursor.execute(f"ALTER TABLE activities VALIDATE CONSTRAINT {BOUND_CHECK}")
+
+    with transaction.atomic(using=schema_editor.connection.alias), schema_editor.connection.cursor() as cursor:
+        # Free the names (index names are per schema) for the partitioned table
+        cursor.execute("ALTER TABLE activities RENAME TO activities_legacy")
+        # The parent's primary key is (id, timestamp): the partition needs the same
+        cursor.execute(
+            f"ALTER TABLE activities_legacy DROP CONSTRAINT {pkey}, "
+            f"ADD CONSTRAINT activities_legacy_pkey PRIMARY KEY USING INDEX {LEGACY_KEY_INDEX}"
+        )
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {_legacy_name(name)}")
+
+        cursor.execute('CREATE TABLE activities (LIKE activities_legacy INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'ALTER TABLE activities ADD CONSTRAINT {pkey} PRIMARY KEY (id, "timestamp")')
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE activities ADD CONSTRAINT {name} {definition}")
+        cursor.execute(
+            f"ALTER TABLE activities ATTACH PARTITION activities_legacy "
+            f"FOR VALUES FROM (MINVALUE) TO ('{next_month.isoformat()}')"
+        )
+        # Implied by the partition bound from now on
+        cursor.execute(f"ALTER TABLE activities_legacy DROP CONSTRAINT {BOUND_CHECK}")
+        # Same definitions as before, now on the parent: the legacy table's
+        # equivalent indexes are attached rather than rebuilt
+        for _, definition in indexes:
+            cursor.execute(definition)
+        cursor.execute("CREATE TABLE activities_default PARTITION OF activities DEFAULT")
+
+
+class Migration(migrations.Migration):
+    # Builds an index CONCURRENTLY, then swaps the tables in a transaction of its own
+    atomic = False
+
+    dependencies = [
+        ('api', '0011_dashboardcounter'),
+    ]
+
+    operations = [
+        # Not reversed: the partitioned table works with the previous schema as is
+        migrations.RunPython(partition_activities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Normalized phone keys (api.phones.normalize_phone) on contacts, prospects
+# and phone numbers, backfilled here and indexed in 0014 (a separate
+# transaction, as Postgres refuses DDL on tables with pending trigger events)
+
+from django.db import migrations
+
+import api.phones
+
+BATCH_SIZE = 2000
+
+
+def backfill_phone_keys(apps, schema_editor):
+    for model_name in ('Contact', 'Prospect', 'PhoneNumber'):
+        model = apps.get_model('api', model_name)
+        batch = []
+        for obj in model.objects.only('pk', 'phone_number').iterator(chunk_size=BATCH_SIZE):
+            obj.phone_key = api.phones.normalize_phone(obj.phone_number)
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ['phone_key'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['phone_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_partition_activities'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='phone_key',
+            field=api.phones.PhoneKeyField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='phone_key',
+            field=api.phones.PhoneKeyField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='phonenumber',
+            name='phone_key',
+            field=api.phones.PhoneKeyField(blank=True, default='', max_length=32),
+        ),
+        migrations.RunPython(backfill_phone_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Indexes on the phone keys backfilled by 0013
+
+from django.db import migrations, models
+
+import api.phones
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_phone_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='phonenumber',
+            name='phone_key',
+            field=api.phones.PhoneKeyField(blank=True, db_index=True, default='', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['user', 'phone_key'], name='contacts_user_phone_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'phone_key'], name='prospects_user_phone_key_idx'),
+        ),
+    ]
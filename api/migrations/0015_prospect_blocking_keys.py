@@ -0,0 +1,43 @@
+# Duplicate detection blocking keys on prospects (api.duplicates), backfilled
+# here and indexed in 0016, like the phone keys in 0013/0014
+
+from django.db import migrations
+
+import api.duplicates
+
+BATCH_SIZE = 2000
+
+
+def backfill_blocking_keys(apps, schema_editor):
+    Prospect = apps.get_model('api', 'Prospect')
+    batch = []
+    for obj in Prospect.objects.only('pk', 'entreprise', 'wilaya', 'email').iterator(chunk_size=BATCH_SIZE):
+        obj.name_key = api.duplicates.name_key(obj.entreprise, obj.wilaya)
+        obj.email_key = api.duplicates.normalize_email(obj.email)
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            Prospect.objects.bulk_update(batch, ['name_key', 'email_key'])
+            batch = []
+    if batch:
+        Prospect.objects.bulk_update(batch, ['name_key', 'email_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_phone_key_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prospect',
+            name='name_key',
+            field=api.duplicates.NameKeyField(blank=True, default='', max_length=120),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='email_key',
+            field=api.duplicates.EmailKeyField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_blocking_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Indexes on the blocking keys backfilled by 0015
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_prospect_blocking_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'name_key'], name='prospects_user_name_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'email_key'], name='prospects_user_email_key_idx'),
+        ),
+    ]
@@ -0,0 +1,161 @@
+# Reference tables for the free-text prospect columns wilaya, commune,
+# categorie, forme_legale, secteur and sous_secteur. Each distinct value is
+# mapped onto the row of its spelling-insensitive key (api.references.label_key)
+# in new <field>_ref columns; 0018 drops the text columns and takes the names
+# over (a separate transaction, as Postgres refuses DDL on tables with pending
+# trigger events).
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+import api.references
+
+REFERENCE_FIELDS = {
+    'wilaya': 'Wilaya',
+    'commune': 'Commune',
+    'categorie': 'Categorie',
+    'forme_legale': 'FormeLegale',
+    'secteur': 'Secteur',
+    'sous_secteur': 'SousSecteur',
+}
+
+
+def map_labels(apps, schema_editor):
+    Prospect = apps.get_model('api', 'Prospect')
+    table = schema_editor.quote_name(Prospect._meta.db_table)
+    for field, model_name in REFERENCE_FIELDS.items():
+        Reference = apps.get_model('api', model_name)
+        # Most frequent spelling first: it becomes the label
+        values = (
+            Prospect.objects.filter(**{f'{field}__isnull': False})
+            .values_list(field).annotate(n=Count('pk')).order_by('-n', field)
+        )
+        keys, references = {}, {}
+        for value, _ in values:
+            key = api.references.label_key(value)[:100]
+            if not key:
+                continue
+            keys[value] = key
+            references.setdefault(key, Reference(key=key, label=' '.join(value.split())[:100]))
+        ids = {obj.key: obj.pk for obj in Reference.objects.bulk_create(references.values())}
+
+        if schema_editor.connection.vendor == 'postgresql':
+            # One UPDATE per column, joined on the value -> id mapping (keys
+            # are computed in Python: label_key() is not expressible in SQL)
+            schema_editor.execute(
+                f'UPDATE {table} p SET {field}_ref_id = m.ref_id '
+                f'FROM unnest(%s::text[], %s::smallint[]) AS m(value, ref_id) '
+                f'WHERE p.{field} = m.value',
+                (list(keys), [ids[key] for key in keys.values()]),
+            )
+        else:
+            for value, key in keys.items():
+                Prospect.objects.filter(**{field: value}).update(**{f'{field}_ref': ids[key]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_prospect_blocking_key_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Categorie',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('label', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='Commune',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('label', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'communes',
+            },
+        ),
+        migrations.CreateModel(
+            name='FormeLegale',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('label', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'formes_legales',
+            },
+        ),
+        migrations.CreateModel(
+            name='Secteur',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('label', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'secteurs',
+            },
+        ),
+        migrations.CreateModel(
+            name='SousSecteur',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('label', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'sous_secteurs',
+            },
+        ),
+        migrations.CreateModel(
+            name='Wilaya',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('label', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'wilayas',
+            },
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='categorie_ref',
+            field=api.references.ReferenceField(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.categorie'),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='commune_ref',
+            field=api.references.ReferenceField(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.commune'),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='forme_legale_ref',
+            field=api.references.ReferenceField(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.formelegale'),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='secteur_ref',
+            field=api.references.ReferenceField(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.secteur'),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='sous_secteur_ref',
+            field=api.references.ReferenceField(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.soussecteur'),
+        ),
+        migrations.AddField(
+            model_name='prospect',
+            name='wilaya_ref',
+            field=api.references.ReferenceField(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.wilaya'),
+        ),
+        migrations.RunPython(map_labels, migrations.RunPython.noop),
+    ]
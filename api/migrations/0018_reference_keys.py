@@ -0,0 +1,100 @@
+# Replaces the free-text columns by the reference keys filled in by 0017,
+# and rebuilds the search index without wilaya and commune (searched through
+# the reference tables, see api.search)
+
+from django.db import migrations, models
+
+SEARCH_FIELDS = ['entreprise', 'nif', 'registre_commerce', 'email', 'phone_number']
+
+# Must stay identical to api.search.PROSPECT_SEARCH_VECTOR_SQL
+SEARCH_VECTOR_SQL = "to_tsvector('simple'::regconfig, {})".format(
+    " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS prospects_search_idx")
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS prospects_search_idx ON prospects USING gin ({SEARCH_VECTOR_SQL})"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_reference_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_index, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='prospect',
+            name='categorie',
+        ),
+        migrations.RenameField(
+            model_name='prospect',
+            old_name='categorie_ref',
+            new_name='categorie',
+        ),
+        migrations.RemoveField(
+            model_name='prospect',
+            name='commune',
+        ),
+        migrations.RenameField(
+            model_name='prospect',
+            old_name='commune_ref',
+            new_name='commune',
+        ),
+        migrations.RemoveField(
+            model_name='prospect',
+            name='forme_legale',
+        ),
+        migrations.RenameField(
+            model_name='prospect',
+            old_name='forme_legale_ref',
+            new_name='forme_legale',
+        ),
+        migrations.RemoveField(
+            model_name='prospect',
+            name='secteur',
+        ),
+        migrations.RenameField(
+            model_name='prospect',
+            old_name='secteur_ref',
+            new_name='secteur',
+        ),
+        migrations.RemoveField(
+            model_name='prospect',
+            name='sous_secteur',
+        ),
+        migrations.RenameField(
+            model_name='prospect',
+            old_name='sous_secteur_ref',
+            new_name='sous_secteur',
+        ),
+        migrations.RemoveField(
+            model_name='prospect',
+            name='wilaya',
+        ),
+        migrations.RenameField(
+            model_name='prospect',
+            old_name='wilaya_ref',
+            new_name='wilaya',
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'wilaya'], name='prospects_user_wilaya_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['user', 'secteur'], name='prospects_user_secteur_idx'),
+        ),
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Indexes backing the OTP purge (api.otp_reaper): expired rows and rows
+# without expiry through expires_at, consumed rows through created_at
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_reference_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_at'], name='otps_expires_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(
+                fields=['created_at'], name='otps_consumed_created_idx', condition=models.Q(is_valid=False)
+            ),
+        ),
+    ]
@@ -1,7 +1,86 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
+from .duplicates import EmailKeyField, NameKeyField
+from .phones import PhoneKeyField, normalize_phone
+from .references import ReferenceField, has_pending_labels
+
+
+class LoadedValuesMixin:
+    """
+    Remembers the field values an instance was loaded with, so signal
+    receivers can tell what a save changed (see Model.from_db in the Django
+    docs), and skips saves that change nothing.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_loaded_value(self, field_name, default=None):
+        """Value of `field_name` when loaded (or last tracked), `default` if unknown"""
+        value = getattr(self, '_loaded_values', {}).get(field_name, default)
+        return default if value is models.DEFERRED else value
+
+    def remember_loaded_values(self, field_names=None):
+        """
+        Treat the current values of `field_names` (default: every field) as
+        the loaded ones, after a save or refresh. Saves and refreshes do it
+        themselves; bulk_create() and bulk_update() callers must.
+        """
+        if field_names is None:
+            self._loaded_values = {
+                field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if field.attname in self.__dict__
+            }
+            return
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for name in field_names:
+            attname = self._meta.get_field(name).attname
+            loaded[attname] = getattr(self, attname)
+
+    def get_dirty_fields(self):
+        """
+        Attnames of the fields changed since the instance was loaded (or last
+        saved), None when that is unknown (instance built in memory).
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return {
+            field.attname
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname))
+        }
+
+    def save(self, *args, **kwargs):
+        # A save that would write back the loaded values is skipped entirely:
+        # no UPDATE, and no post_save (activity, ETag and dashboard updates)
+        if (
+            not self._state.adding
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+            and self.get_dirty_fields() == set()
+        ):
+            return
+        if has_pending_labels(self):
+            # New labels get their reference rows in the same transaction
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        # After post_save: receivers compare with the values as they were loaded
+        self.remember_loaded_values(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.remember_loaded_values(fields)
+
 class Activity(models.Model):
     ACTIVITY_TYPE_CHOICES = (
         ('prospect_added', 'Prospect Added'),
@@ -23,15 +102,31 @@ class Activity(models.Model):
     class Meta:
         db_table = 'activities'
         ordering = ['-timestamp']
+        indexes = [
+            # Backs the keyset pagination in ActivityViewSet
+            models.Index(fields=['user', '-timestamp', 'id'], name='activities_user_ts_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.timestamp}"
 
+class PhoneNumberQuerySet(models.QuerySet):
+    def matching(self, phone_number):
+        """Registered numbers equal to `phone_number` however it is written, oldest first (phone_key index)"""
+        key = normalize_phone(phone_number)
+        if not key:
+            return self.none()
+        return self.filter(phone_key=key).order_by('created_at')
+
+
 class PhoneNumber(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     phone_number = models.CharField(max_length=50, unique=True)
+    phone_key = PhoneKeyField(db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PhoneNumberQuerySet.as_manager()
+
     class Meta:
         #managed = False  # The table is already created via SQL
         db_table = 'phone_numbers'
@@ -50,11 +145,18 @@ class OTP(models.Model):
     class Meta:
         #managed = False
         db_table = 'otps'
+        indexes = [
+            # Backs the single-statement consume in OTPViewSet.verify
+            models.Index(fields=['phone_number', 'otp_code', 'is_valid', 'expires_at'], name='otps_verify_idx'),
+            # Back the expiry backfill and the purge in api.otp_reaper
+            models.Index(fields=['expires_at'], name='otps_expires_at_idx'),
+            models.Index(fields=['created_at'], name='otps_consumed_created_idx', condition=models.Q(is_valid=False)),
+        ]
 
     def __str__(self):
         return f"{self.phone_number.phone_number} - {self.otp_code}"
 
-class Contact(models.Model):
+class Contact(LoadedValuesMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     phone_number = models.CharField(max_length=50)
@@ -62,34 +164,155 @@ class Contact(models.Model):
     company = models.CharField(max_length=255, null=True, blank=True)
     type = models.CharField(max_length=50)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contacts')
+    updated_at = models.DateTimeField(auto_now=True)
+    phone_key = PhoneKeyField()
 
     class Meta:
         #managed = False
         db_table = 'contacts'
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='contacts_user_updated_idx'),
+            # Caller ID lookup (/api/lookup/phone/)
+            models.Index(fields=['user', 'phone_key'], name='contacts_user_phone_key_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-class Prospect(models.Model):
+class ReferenceTable(models.Model):
+    """
+    List of labels behind a ReferenceField (wilayas, secteurs, ...), keyed by
+    small integers. `key` is the spelling-insensitive form of the label
+    (api.references.label_key), `label` the spelling first seen.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    key = models.CharField(max_length=100, unique=True)
+    label = models.CharField(max_length=100)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.label
+
+class Wilaya(ReferenceTable):
+    class Meta:
+        db_table = 'wilayas'
+
+class Commune(ReferenceTable):
+    class Meta:
+        db_table = 'communes'
+
+class Categorie(ReferenceTable):
+    class Meta:
+        db_table = 'categories'
+
+class FormeLegale(ReferenceTable):
+    class Meta:
+        db_table = 'formes_legales'
+
+class Secteur(ReferenceTable):
+    class Meta:
+        db_table = 'secteurs'
+
+class SousSecteur(ReferenceTable):
+    class Meta:
+        db_table = 'sous_secteurs'
+
+class Prospect(LoadedValuesMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     entreprise = models.CharField(max_length=255)
     adresse = models.CharField(max_length=255, null=True, blank=True)
-    wilaya = models.CharField(max_length=100, null=True, blank=True)
-    commune = models.CharField(max_length=100, null=True, blank=True)
+    wilaya = ReferenceField(Wilaya)
+    commune = ReferenceField(Commune)
     phone_number = models.CharField(max_length=50, null=True, blank=True)
     email = models.CharField(max_length=255, null=True, blank=True)
-    categorie = models.CharField(max_length=100, null=True, blank=True)
-    forme_legale = models.CharField(max_length=100, null=True, blank=True)
-    secteur = models.CharField(max_length=100, null=True, blank=True)
-    sous_secteur = models.CharField(max_length=100, null=True, blank=True)
+    categorie = ReferenceField(Categorie)
+    forme_legale = ReferenceField(FormeLegale)
+    secteur = ReferenceField(Secteur)
+    sous_secteur = ReferenceField(SousSecteur)
     nif = models.CharField(max_length=50, null=True, blank=True)
     registre_commerce = models.CharField(max_length=50, null=True, blank=True)
     status = models.CharField(max_length=50)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prospects')
+    updated_at = models.DateTimeField(auto_now=True)
+    phone_key = PhoneKeyField()
+    # Duplicate detection blocking keys (api/duplicates.py)
+    name_key = NameKeyField()
+    email_key = EmailKeyField()
 
     class Meta:
         #managed = False
         db_table = 'prospects'
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='prospects_user_updated_idx'),
+            # Caller ID lookup (/api/lookup/phone/)
+            models.Index(fields=['user', 'phone_key'], name='prospects_user_phone_key_idx'),
+            # Deduplication on import
+            models.Index(fields=['user', 'nif'], name='prospects_user_nif_idx'),
+            models.Index(fields=['user', 'registre_commerce'], name='prospects_user_rc_idx'),
+            # Duplicate detection
+            models.Index(fields=['user', 'name_key'], name='prospects_user_name_key_idx'),
+            models.Index(fields=['user', 'email_key'], name='prospects_user_email_key_idx'),
+            # Dashboard group-bys
+            models.Index(fields=['user', 'wilaya'], name='prospects_user_wilaya_idx'),
+            models.Index(fields=['user', 'secteur'], name='prospects_user_secteur_idx'),
+        ]
 
     def __str__(self):
         return self.entreprise
+
+class Tombstone(models.Model):
+    """Records a deleted Contact or Prospect so clients can sync deletions"""
+    OBJECT_TYPE_CHOICES = (
+        ('contact', 'Contact'),
+        ('prospect', 'Prospect'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    object_type = models.CharField(max_length=20, choices=OBJECT_TYPE_CHOICES)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+
+    class Meta:
+        db_table = 'tombstones'
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstones_user_deleted_idx'),
+        ]
+
+    @classmethod
+    def for_instance(cls, instance):
+        """Build (without saving) the tombstone for a deleted Contact or Prospect"""
+        return cls(
+            object_type=instance._meta.model_name,
+            object_id=instance.pk,
+            user_id=instance.user_id,
+        )
+
+    def __str__(self):
+        return f"{self.object_type} {self.object_id} - {self.deleted_at}"
+
+
+class DashboardCounter(models.Model):
+    """
+    Incrementally maintained per-user count behind /api/dashboard/.
+    `dimension` names what is counted (e.g. prospect_status) and `value` the
+    group ('' for empty). Activity counts are kept per day in `bucket`
+    (YYYY-MM-DD) so rolling windows can be summed; other counters use ''.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dashboard_counters')
+    dimension = models.CharField(max_length=30)
+    value = models.CharField(max_length=255, blank=True, default='')
+    bucket = models.CharField(max_length=10, blank=True, default='')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'dashboard_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dimension', 'value', 'bucket'], name='dashboard_counters_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.dimension}={self.value} {self.bucket}: {self.count}"
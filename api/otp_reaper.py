@@ -0,0 +1,94 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OTP
+
+logger = logging.getLogger(__name__)
+
+# Postgres advisory lock held by a purge run (any constant shared by all hosts)
+PURGE_LOCK_KEY = 0x4f5450
+
+
+@contextmanager
+def purge_lock():
+    """
+    Whether this run may purge: a Postgres advisory lock held for the block,
+    so overlapping runs (a slow cron run, several schedulers) skip instead
+    of racing over the same rows. Always acquired on other databases.
+    """
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [PURGE_LOCK_KEY])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [PURGE_LOCK_KEY])
+
+
+def _in_batches(pks, batch_size, pause, apply):
+    """
+    Call `apply` on slices of `batch_size` primary keys of `pks` (a
+    values_list queryset the calls empty) until none are left, returning
+    the total of what it returned.
+    """
+    total = 0
+    while True:
+        ids = list(pks[:batch_size])
+        if not ids:
+            return total
+        total += apply(ids)
+        if len(ids) < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def purge_expired_otps(batch_size=None, retention_seconds=None, pause=0.0):
+    """
+    Purge consumed and expired OTPs in bounded batches.
+
+    Rows without `expires_at` are first given a default expiry of
+    created_at + OTP_TTL_SECONDS. Then rows that expired, or were consumed,
+    more than `retention_seconds` ago are deleted. Both steps work
+    `batch_size` rows at a time, each batch in its own short transaction so
+    no long locks are held.
+
+    Returns a dict with `deleted`, `backfilled` and `elapsed` (seconds).
+    """
+    batch_size = batch_size or getattr(settings, 'OTP_PURGE_BATCH_SIZE', 1000)
+    if retention_seconds is None:
+        retention_seconds = getattr(settings, 'OTP_RETENTION_SECONDS', 3600)
+    started = time.monotonic()
+
+    missing_expiry = OTP.objects.filter(expires_at__isnull=True).values_list('pk', flat=True)
+    default_expiry = F('created_at') + timedelta(seconds=getattr(settings, 'OTP_TTL_SECONDS', 300))
+    backfilled = _in_batches(
+        missing_expiry, batch_size, pause, lambda ids: OTP.objects.filter(pk__in=ids).update(expires_at=default_expiry)
+    )
+
+    cutoff = timezone.now() - timedelta(seconds=retention_seconds)
+    purgeable = OTP.objects.filter(
+        Q(expires_at__lt=cutoff) | Q(is_valid=False, created_at__lt=cutoff)
+    ).values_list('pk', flat=True)
+    deleted = _in_batches(purgeable, batch_size, pause, lambda ids: OTP.objects.filter(pk__in=ids).delete()[0])
+
+    result = {
+        'deleted': deleted,
+        'backfilled': backfilled,
+        'elapsed': time.monotonic() - started,
+    }
+    if deleted or backfilled:
+        logger.info('Purged OTPs: deleted %d, backfilled %d in %.2fs', deleted, backfilled, result['elapsed'])
+    return result
@@ -0,0 +1,106 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Subquery
+from django.utils import timezone
+
+from .models import OTP, PhoneNumber
+from .phones import normalize_phone
+
+
+class DatabaseOTPStore:
+    """Stores OTPs in the `otps` table"""
+
+    def issue(self, phone_obj, otp_code, expires_at):
+        return OTP.objects.create(
+            phone_number=phone_obj,
+            otp_code=otp_code,
+            expires_at=expires_at,
+            is_valid=True,
+        )
+
+    async def aissue(self, phone_obj, otp_code, expires_at):
+        return await OTP.objects.acreate(
+            phone_number=phone_obj,
+            otp_code=otp_code,
+            expires_at=expires_at,
+            is_valid=True,
+        )
+
+    def consume(self, phone_number_str, otp_code):
+        """
+        Atomically invalidate the latest matching, unexpired OTP in a single
+        UPDATE statement (phone number lookup on its normalized key included). Returns True if one
+        was consumed. The outer `is_valid` check makes concurrent verifies of
+        the same code race safely: only one of them updates the row.
+        """
+        return self._consumable(phone_number_str, otp_code).update(is_valid=False) == 1
+
+    async def aconsume(self, phone_number_str, otp_code):
+        return await self._consumable(phone_number_str, otp_code).aupdate(is_valid=False) == 1
+
+    @staticmethod
+    def _consumable(phone_number_str, otp_code):
+        latest = OTP.objects.filter(
+            phone_number__in=PhoneNumber.objects.matching(phone_number_str),
+            otp_code=otp_code,
+            is_valid=True,
+            expires_at__gt=timezone.now(),
+        ).order_by('-created_at').values('pk')[:1]
+        return OTP.objects.filter(pk=Subquery(latest), is_valid=True)
+
+
+class CacheOTPStore:
+    """
+    Stores OTPs as TTL keys in a Django cache alias, so issuing and verifying
+    codes never touches the `otps` table. Consuming relies on the atomic
+    delete of the cache backend (Redis DEL), so a code verifies only once.
+    """
+
+    def _cache(self):
+        return caches[getattr(settings, 'OTP_CACHE_ALIAS', 'default')]
+
+    @staticmethod
+    def _key(phone_number_str, otp_code):
+        # Normalized, so a code verifies whatever formatting of the number is sent
+        return f"otp:{normalize_phone(phone_number_str)}:{otp_code}"
+
+    def issue(self, phone_obj, otp_code, expires_at):
+        now = timezone.now()
+        self._cache().set(self._key(phone_obj.phone_number, otp_code), 1, timeout=self._ttl(expires_at, now))
+        return self._unsaved(phone_obj, otp_code, expires_at, now)
+
+    async def aissue(self, phone_obj, otp_code, expires_at):
+        now = timezone.now()
+        await self._cache().aset(self._key(phone_obj.phone_number, otp_code), 1, timeout=self._ttl(expires_at, now))
+        return self._unsaved(phone_obj, otp_code, expires_at, now)
+
+    @staticmethod
+    def _ttl(expires_at, now):
+        return max(int((expires_at - now).total_seconds()), 1)
+
+    @staticmethod
+    def _unsaved(phone_obj, otp_code, expires_at, now):
+        # Unsaved instance so callers can build the same responses as with the DB store
+        return OTP(
+            id=uuid.uuid4(),
+            phone_number=phone_obj,
+            otp_code=otp_code,
+            is_valid=True,
+            created_at=now,
+            expires_at=expires_at,
+        )
+
+    def consume(self, phone_number_str, otp_code):
+        return bool(self._cache().delete(self._key(phone_number_str, otp_code)))
+
+    async def aconsume(self, phone_number_str, otp_code):
+        return bool(await self._cache().adelete(self._key(phone_number_str, otp_code)))
+
+
+def get_otp_store():
+    """Return the OTP store selected by the OTP_STORE setting ('database' or 'cache')"""
+    if getattr(settings, 'OTP_STORE', 'database') == 'cache':
+        return CacheOTPStore()
+    return DatabaseOTPStore()
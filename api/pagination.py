@@ -0,0 +1,148 @@
+import base64
+import binascii
+import uuid
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over (timestamp DESC, id ASC).
+
+    The cursor is an opaque token holding the (timestamp, id) of the last row
+    of the previous page. Each page is fetched with a bounded index range scan
+    on (user_id, timestamp DESC, id), so deep pages cost the same as the first
+    one: there is no OFFSET and no COUNT(*).
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    timestamp_field = 'timestamp'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def cursor_fields(self):
+        """Columns every row must carry to build the next cursor"""
+        return ('id', self.timestamp_field)
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                page_size = int(raw)
+            except ValueError:
+                pass
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            decoded = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            raw_timestamp, raw_id = decoded.split('|', 1)
+            timestamp = parse_datetime(raw_timestamp)
+            row_id = uuid.UUID(raw_id)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, row_id
+
+    def encode_cursor(self, row):
+        # Rows are model instances, or dicts when the view reads .values()
+        if isinstance(row, dict):
+            timestamp, pk = row[self.timestamp_field], row['id']
+        else:
+            timestamp, pk = getattr(row, self.timestamp_field), row.pk
+        raw = f"{timestamp.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, fetching the page with the async ORM"""
+        return self._set_page([row async for row in self._page_queryset(queryset, request)])
+
+    def _page_queryset(self, queryset, request):
+        """The unevaluated query for the requested page, one row past its end"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        field = self.timestamp_field
+
+        queryset = queryset.order_by(f'-{field}', 'id')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            timestamp, row_id = cursor
+            # The `<=` bound lets the planner start the index scan right at the
+            # cursor; the OR only discards rows sharing the cursor timestamp.
+            queryset = queryset.filter(**{f'{field}__lte': timestamp}).filter(
+                Q(**{f'{field}__lt': timestamp}) | Q(id__gt=row_id)
+            )
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = parse_qs(query, keep_blank_values=True)
+        params[self.cursor_query_param] = [self.encode_cursor(self.page[-1])]
+        return urlunsplit((scheme, netloc, path, urlencode(params, doseq=True), fragment))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Offset pagination for relevance-ranked search results, which have no
+    stable keyset. Pages are fetched with LIMIT page_size + 1, so no
+    COUNT(*) is issued.
+    """
+    offset_query_param = 'offset'
+    cursor_fields = ()
+
+    def _page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.offset = max(int(request.query_params.get(self.offset_query_param, 0)), 0)
+        except ValueError:
+            self.offset = 0
+        return queryset[self.offset:self.offset + self.page_size + 1]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = parse_qs(query, keep_blank_values=True)
+        params[self.offset_query_param] = [str(self.offset + self.page_size)]
+        return urlunsplit((scheme, netloc, path, urlencode(params, doseq=True), fragment))
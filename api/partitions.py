@@ -0,0 +1,361 @@
+import csv
+import gzip
+import logging
+import os
+import re
+import shutil
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from itertools import chain, groupby
+from operator import itemgetter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+TABLE = 'activities'
+DEFAULT_PARTITION = 'activities_default'
+# Longest wait for the lock on `activities` when detaching an archived partition
+DETACH_LOCK_TIMEOUT = '5s'
+# Columns written to archive files, in this order (header row included)
+ARCHIVE_COLUMNS = ('id', 'title', 'description', 'type', 'timestamp', 'user_id', 'contact_id', 'prospect_id')
+# Rows fetched per round trip when writing archives
+ARCHIVE_FETCH_SIZE = 2000
+
+Partition = namedtuple('Partition', 'name lower upper')
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+_ARCHIVE_RE = re.compile(r"^activities_(min|\d{8})_(\d{8})$")
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(start, months):
+    years, month = divmod(start.month - 1 + months, 12)
+    return start.replace(year=start.year + years, month=month + 1)
+
+
+def _partition_bound(text):
+    if text in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return parse_datetime(text.strip("'"))
+
+
+def parse_bound(value):
+    """Query parameter date or datetime -> aware datetime (UTC when naive), None if invalid"""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime(day.year, day.month, day.day)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions():
+    """Range partitions of `activities` (lower/upper None for MINVALUE/MAXVALUE), oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound)
+        if match:
+            partitions.append(Partition(name, _partition_bound(match.group(1)), _partition_bound(match.group(2))))
+    return sorted(partitions, key=lambda p: p.lower or datetime.min.replace(tzinfo=dt_timezone.utc))
+
+
+def _overlaps(partition, lower, upper):
+    return (partition.lower is None or partition.lower < upper) and (partition.upper is None or lower < partition.upper)
+
+
+def create_partitions(months_ahead, now):
+    """
+    Create the monthly partitions from the current month to `months_ahead`
+    months ahead, skipping ranges already covered. Rows of a new range that
+    went to the default partition are moved into it. Returns the names of
+    the created partitions.
+    """
+    start = month_start(now)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = list_partitions()
+        for offset in range(months_ahead + 1):
+            lower, upper = add_months(start, offset), add_months(start, offset + 1)
+            if any(_overlaps(partition, lower, upper) for partition in existing):
+                continue
+            name = f"{TABLE}_{lower:%Y_%m}"
+            # Created standalone then attached: a partition cannot be created
+            # for rows still in the default partition
+            cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+                f"INSERT INTO {name} SELECT * FROM moved",
+                [lower, upper],
+            )
+            cursor.execute(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            created.append(name)
+    return created
+
+
+def archive_dirname(lower, upper):
+    return f"activities_{'min' if lower is None else f'{lower:%Y%m%d}'}_{upper:%Y%m%d}"
+
+
+def _user_archive(path, user_id):
+    return Path(path) / f"{user_id}.csv.gz"
+
+
+def _read_rows(path):
+    with gzip.open(path, 'rt', newline='') as archive:
+        yield from csv.DictReader(archive)
+
+
+def _write_rows(path, rows):
+    """Write ARCHIVE_COLUMNS rows to the gzipped CSV `path`, synced to disk. Returns the row count."""
+    count = 0
+    with gzip.open(path, 'wt', newline='') as archive:
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    with open(path, 'rb') as written:
+        os.fsync(written.fileno())
+    return count
+
+
+def _write_archive(sql, params, path):
+    """
+    Write the rows of `sql` (ARCHIVE_COLUMNS ordered by user_id, newest
+    first) to directory `path`, as one gzipped CSV per user, read through a
+    server-side cursor. Returns the row count.
+    """
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    count = 0
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = iter(lambda: cursor.fetchmany(ARCHIVE_FETCH_SIZE), [])
+        user_index = ARCHIVE_COLUMNS.index('user_id')
+        for user_id, user_rows in groupby(chain.from_iterable(rows), key=itemgetter(user_index)):
+            count += _write_rows(_user_archive(path, user_id), user_rows)
+    return count
+
+
+def _archive_sql(table, where=''):
+    return (
+        f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {table} {where} "
+        f'ORDER BY user_id, "timestamp" DESC, id'
+    )
+
+
+def _install(partial, path):
+    """
+    Move the archive directory `partial` to `path`. An existing archive of
+    the same range (a run interrupted before its rows were removed, or
+    backdated rows archived later) is merged user by user, without
+    duplicating rows.
+    """
+    if not path.exists():
+        os.replace(partial, path)
+        return
+    for new in partial.iterdir():
+        existing = path / new.name
+        rows = {row['id']: row for row in _read_rows(existing)} if existing.exists() else {}
+        rows.update((row['id'], row) for row in _read_rows(new))
+        merged = sorted(rows.values(), key=itemgetter('id'))
+        merged.sort(key=lambda row: parse_datetime(row['timestamp']), reverse=True)
+        tmp = existing.with_name(existing.name + '.tmp')
+        _write_rows(tmp, ([row[column] for column in ARCHIVE_COLUMNS] for row in merged))
+        os.replace(tmp, existing)
+    shutil.rmtree(partial)
+
+
+class _RowsChanged(Exception):
+    pass
+
+
+def _archive_partition(partition, path):
+    """
+    Archive the whole partition to `path`, then detach and drop it.
+
+    The rows are copied out while the partition is still attached, which
+    only locks the partition itself. DETACH then takes an ACCESS EXCLUSIVE
+    lock on `activities` (CONCURRENTLY is not allowed with a default
+    partition), so it runs in a short transaction of its own with the DROP,
+    giving up after DETACH_LOCK_TIMEOUT rather than queueing every query on
+    the table behind it. Rows written to the partition during the copy
+    (backdated activities) are caught by a row count and copied again
+    before the table is dropped.
+    """
+    partial = path.with_name(path.name + '.partial')
+    sql = _archive_sql(partition.name)
+    copied = _write_archive(sql, [], partial)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {partition.name}")
+        cursor.execute(f"SELECT count(*) FROM {partition.name}")
+        if cursor.fetchone()[0] != copied:
+            _write_archive(sql, [], partial)
+        # Only dropped once its archive is complete on disk
+        _install(partial, path)
+        cursor.execute(f"DROP TABLE {partition.name}")
+
+
+def _archive_month(partition, lower, upper, path):
+    """
+    Archive the rows of one month of a partition spanning several months
+    (the legacy table attached by migration 0012) to `path`, then delete
+    them. Rows written to that month in between roll the deletion back
+    (_RowsChanged), to be archived by the next run. Returns the number of
+    archived rows.
+    """
+    partial = path.with_name(path.name + '.partial')
+    where = 'WHERE "timestamp" >= %s AND "timestamp" < %s'
+    copied = _write_archive(_archive_sql(partition.name, where), [lower, upper], partial)
+    if not copied:
+        shutil.rmtree(partial)
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+        cursor.execute(f"DELETE FROM {partition.name} {where}", [lower, upper])
+        if cursor.rowcount != copied:
+            raise _RowsChanged(f"{cursor.rowcount} rows to delete, {copied} archived")
+        _install(partial, path)
+    return copied
+
+
+def _months_to_split(partition, before):
+    """[(lower, upper)] of the months of a multi-month partition ending on or before `before`"""
+    if partition.lower is not None and add_months(partition.lower, 1) >= partition.upper:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min("timestamp") FROM {partition.name}')
+        oldest = cursor.fetchone()[0]
+    if oldest is None:
+        return []
+    end = before if partition.upper is None else min(before, partition.upper)
+    months = []
+    lower = month_start(oldest)
+    while add_months(lower, 1) <= end:
+        months.append((lower, add_months(lower, 1)))
+        lower = add_months(lower, 1)
+    return months
+
+
+def archive_partitions(before, archive_dir):
+    """
+    Archive the activities older than `before` (a month start) to
+    `archive_dir`, one directory per month holding a gzipped CSV per user,
+    and remove them from the database. Returns [(archived name, archive
+    path)].
+
+    Monthly partitions ending on or before `before` are archived whole,
+    then detached and dropped. A partition spanning several months (the
+    legacy table) is archived and emptied month by month, each month as
+    soon as it is older than `before`, and dropped once entirely past it.
+
+    A partition or month that cannot be archived (lock timeout, rows
+    changing meanwhile) is logged and left for the next run; the others
+    are still archived.
+    """
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    archived = []
+    for partition in list_partitions():
+        if partition.upper is None:
+            continue
+        for lower, upper in _months_to_split(partition, before):
+            path = archive_dir / archive_dirname(lower, upper)
+            try:
+                if not _archive_month(partition, lower, upper, path):
+                    continue
+            except (OperationalError, _RowsChanged) as e:
+                shutil.rmtree(path.with_name(path.name + '.partial'), ignore_errors=True)
+                logger.warning("Could not archive %s from %s: %s", path.name, partition.name, e)
+                continue
+            archived.append((f"{partition.name} {lower:%Y-%m}", path))
+
+        if partition.upper > before:
+            continue
+        path = archive_dir / archive_dirname(partition.lower, partition.upper)
+        try:
+            _archive_partition(partition, path)
+        except OperationalError as e:
+            shutil.rmtree(path.with_name(path.name + '.partial'), ignore_errors=True)
+            logger.warning("Could not archive partition %s: %s", partition.name, e)
+            continue
+        archived.append((partition.name, path))
+    return archived
+
+
+def archived_ranges(archive_dir):
+    """[(lower, upper, path)] of the archives in `archive_dir`, newest first"""
+    archive_dir = Path(archive_dir)
+    if not archive_dir.is_dir():
+        return []
+    ranges = []
+    for path in archive_dir.iterdir():
+        match = _ARCHIVE_RE.match(path.name)
+        if match is None or not path.is_dir():
+            continue
+        lower, upper = (
+            None if value == 'min' else datetime.strptime(value, '%Y%m%d').replace(tzinfo=dt_timezone.utc)
+            for value in match.groups()
+        )
+        ranges.append((lower, upper, path))
+    return sorted(ranges, key=lambda r: r[1], reverse=True)
+
+
+def read_archived(user_id, start, end, archive_dir=None):
+    """
+    Yield a user's archived activities with start <= timestamp < end, as
+    dicts of ARCHIVE_COLUMNS (timestamp parsed), newest first like the API.
+    Only the user's own file of the archives overlapping the range is
+    read, row by row: files are sorted newest first.
+    """
+    archive_dir = archive_dir or settings.ACTIVITY_ARCHIVE_DIR
+    for lower, upper, path in archived_ranges(archive_dir):
+        if (lower is not None and lower >= end) or upper <= start:
+            continue
+        path = _user_archive(path, user_id)
+        if not path.is_file():
+            continue
+        for row in _read_rows(path):
+            row['timestamp'] = parse_datetime(row['timestamp'])
+            if row['timestamp'] < start:
+                break
+            if row['timestamp'] < end:
+                yield row
@@ -0,0 +1,88 @@
+import re
+from abc import ABCMeta, abstractmethod
+
+from django.conf import settings
+from django.db import models
+
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(value):
+    """
+    Digits-only international form of a phone number, the same for every
+    way of writing it: '+213 555 12 34 56', '00213555123456' and
+    '0555-12-34-56' all give '213555123456'. Numbers in national format
+    (trunk prefix 0) get PHONE_COUNTRY_CODE. Returns '' for empty values.
+    """
+    if not value:
+        return ''
+    value = str(value).strip()
+    digits = _NON_DIGITS.sub('', value)
+    if value.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    if digits.startswith('0'):
+        return getattr(settings, 'PHONE_COUNTRY_CODE', '213') + digits[1:]
+    return digits
+
+
+class NormalizedKeyField(models.CharField, metaclass=ABCMeta):
+    """
+    Read-only lookup key computed from other fields of the model by
+    `compute()` (defined by subclasses), refreshed whenever the row is written, like auto_now: on
+    save() and bulk_create(). bulk_update() and raw SQL must set it
+    themselves (see refresh_keys).
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 32)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('default', '')
+        kwargs['editable'] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['editable']
+        return name, path, args, kwargs
+
+    @abstractmethod
+    def compute(self, model_instance):
+        """The key of `model_instance`"""
+
+    def pre_save(self, model_instance, add):
+        value = self.compute(model_instance)[:self.max_length]
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def key_fields(model):
+    """The NormalizedKeyFields of `model`"""
+    return [field for field in model._meta.concrete_fields if isinstance(field, NormalizedKeyField)]
+
+
+def refresh_keys(instance):
+    """Recompute the NormalizedKeyFields of `instance`, returning their names"""
+    fields = key_fields(type(instance))
+    for field in fields:
+        field.pre_save(instance, False)
+    return [field.name for field in fields]
+
+
+class PhoneKeyField(NormalizedKeyField):
+    """normalize_phone() of another field of the model (phone_number by default)"""
+
+    def __init__(self, *args, source='phone_number', **kwargs):
+        self.source = source
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.source != 'phone_number':
+            kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def compute(self, model_instance):
+        return normalize_phone(getattr(model_instance, self.source))
@@ -0,0 +1,217 @@
+import re
+import unicodedata
+
+from django.db import models, router, transaction
+from django.db.models import Q
+
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def split_words(value):
+    """Lowercase ASCII words of `value`, accents removed"""
+    if not value:
+        return []
+    value = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', value.lower()).split()
+
+
+def label_key(value):
+    """Spelling-insensitive key of a label: 'Béjaïa', 'BEJAIA ' and 'bejaia' all give 'bejaia'"""
+    return ' '.join(split_words(value))
+
+
+class PendingLabel(str):
+    """
+    A label assigned to a ReferenceField before its reference row exists:
+    held in place of the id until the instance is saved, where
+    ReferenceField.pre_save creates the row in the save's transaction.
+    """
+
+
+class ReferenceLabels:
+    """
+    Process-wide id <-> label lookup of one reference table, so rows are
+    serialized and written by label without joining or querying it.
+
+    Reference rows are never renamed or deleted, so entries stay valid once
+    cached. Rows created by a transaction are only cached once it commits:
+    a rolled back id must not stick to its label.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.max_length = model._meta.get_field('label').max_length
+        self._labels = {}
+        self._ids = {}
+        self._uncommitted = set()
+        self._loaded = False
+
+    def _manager(self):
+        # Misses read the primary: a new label may not have reached a replica yet
+        return self.model._default_manager.db_manager(router.db_for_write(self.model))
+
+    def _store(self, pk, key, label):
+        self._uncommitted.discard(pk)
+        self._labels[pk] = label
+        self._ids[key] = pk
+
+    def load(self):
+        """Cache every label of the table (a query: async code runs it through sync_to_async)"""
+        rows = list(self._manager().values_list('id', 'key', 'label'))
+        for pk, key, label in rows:
+            if pk not in self._uncommitted:
+                self._store(pk, key, label)
+        self._loaded = True
+        return rows
+
+    def label(self, pk):
+        """Label of reference id `pk` (None for None)"""
+        if pk is None:
+            return None
+        if isinstance(pk, PendingLabel):
+            return str(pk)
+        label = self._labels.get(pk)
+        if label is None:
+            row = self._manager().filter(pk=pk).values_list('key', 'label').first()
+            if row is not None:
+                key, label = row
+                if pk not in self._uncommitted:
+                    self._store(pk, key, label)
+        return label
+
+    def missing(self, pks):
+        """Whether some of the ids `pks` are not cached yet"""
+        return any(pk is not None and pk not in self._labels for pk in pks)
+
+    def find(self, label):
+        """
+        Id of `label` (spelling-insensitive) without creating anything: a
+        PendingLabel when it has no row yet, None for empty labels
+        """
+        key = label_key(label)[:self.max_length]
+        if not key:
+            return None
+        pk = self._ids.get(key)
+        if pk is None and not self._loaded:
+            self.load()
+            pk = self._ids.get(key)
+        return PendingLabel(label) if pk is None else pk
+
+    def resolve(self, label):
+        """Id of `label` (spelling-insensitive), created if new; None for empty labels"""
+        pk = self.find(label)
+        if not isinstance(pk, PendingLabel):
+            return pk
+
+        key = label_key(label)[:self.max_length]
+        obj, created = self._manager().get_or_create(
+            key=key, defaults={'label': ' '.join(str(label).split())[:self.max_length]}
+        )
+        if created or obj.pk in self._uncommitted:
+            self._uncommitted.add(obj.pk)
+            transaction.on_commit(lambda: self._store(obj.pk, obj.key, obj.label), using=self._manager().db)
+        else:
+            self._store(obj.pk, obj.key, obj.label)
+        return obj.pk
+
+    def matching(self, term):
+        """Subquery of the ids of the labels with a word starting with `term`"""
+        term = label_key(term)
+        return self.model._default_manager.filter(Q(key__startswith=term) | Q(key__contains=f' {term}')).values('pk')
+
+    def clear(self):
+        self._labels.clear()
+        self._ids.clear()
+        self._loaded = False
+
+
+_labels = {}
+
+
+def labels_for(model):
+    """The ReferenceLabels of reference model `model`"""
+    if model not in _labels:
+        _labels[model] = ReferenceLabels(model)
+    return _labels[model]
+
+
+class ReferenceLabelDescriptor:
+    """
+    Reads a ReferenceField as its label and accepts a label (or a reference
+    instance) when set; the id itself is in `<name>_id`, or a PendingLabel
+    until the instance is saved when the label is new.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        return labels_for(self.field.related_model).label(getattr(instance, self.field.attname))
+
+    def __set__(self, instance, value):
+        if isinstance(value, self.field.related_model):
+            pk = value.pk
+        else:
+            pk = labels_for(self.field.related_model).find(value)
+        setattr(instance, self.field.attname, pk)
+
+
+class ReferenceField(models.ForeignKey):
+    """
+    Optional foreign key to a reference table (api.models.ReferenceTable)
+    used like the free-text column it replaces: `prospect.wilaya` is the
+    label and `prospect.wilaya = 'Alger'` finds the reference row, created
+    when the prospect is saved if it is new.
+    Queries filter and group on `<name>_id`.
+    """
+    forward_related_accessor_class = ReferenceLabelDescriptor
+
+    def __init__(self, to, **kwargs):
+        kwargs.setdefault('on_delete', models.PROTECT)
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('related_name', '+')
+        # Filtered and grouped per user: see the (user, <name>) indexes
+        kwargs.setdefault('db_index', False)
+        super().__init__(to, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if isinstance(value, PendingLabel):
+            value = labels_for(self.related_model).resolve(value)
+            setattr(model_instance, self.attname, value)
+        return value
+
+    def label(self, pk):
+        return labels_for(self.related_model).label(pk)
+
+
+def has_pending_labels(instance):
+    """Whether `instance` has ReferenceFields set to labels without a row yet"""
+    return any(
+        isinstance(getattr(instance, field.attname), PendingLabel)
+        for field in instance._meta.concrete_fields if isinstance(field, ReferenceField)
+    )
+
+
+def resolve_pending_labels(instance):
+    """
+    Create the reference rows of the new labels of `instance` and set their
+    ids, as saving it would: for bulk_update(), which skips pre_save
+    """
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, ReferenceField):
+            field.pre_save(instance, False)
+
+
+def label_converters(model, field_names):
+    """{index: id -> label} for the ReferenceFields among `field_names`, to convert values_list() rows"""
+    converters = {}
+    for index, name in enumerate(field_names):
+        field = model._meta.get_field(name)
+        if isinstance(field, ReferenceField):
+            converters[index] = field.label
+    return converters
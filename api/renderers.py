@@ -0,0 +1,37 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+_fallback_encoder = encoders.JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes with orjson, which encodes UUIDs,
+    datetimes and dates natively instead of through the encoder's `default`
+    hook. Anything else orjson does not know (Decimal, lazy strings, ...)
+    goes through DRF's encoder as before.
+
+    Pretty-printed (`; indent=N`, the browsable API), non-compact or
+    ASCII-only output (COMPACT_JSON / UNICODE_JSON off), or a missing
+    orjson, use the stdlib path.
+    """
+    options = 0 if orjson is None else orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_fallback_encoder.default, option=self.options)
+        # Same escaping as JSONRenderer, keeping the output a JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,45 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# Set by ReplicaRoutingMiddleware for requests whose reads may use the replica;
+# everything else (writes, background threads, commands) reads the primary
+reads_from_replica = ContextVar('reads_from_replica', default=False)
+
+# Authentication and session lookups right after a login must not miss on a
+# lagging replica
+PRIMARY_ONLY_APPS = {'auth', 'authtoken', 'sessions', 'contenttypes', 'admin'}
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to the REPLICA_DATABASE_ALIAS database when the current
+    request allows it (see ReplicaRoutingMiddleware), everything else to
+    `default`. Without a replica configured it has no opinion.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+        if replica is None:
+            return None
+        if reads_from_replica.get() and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        if getattr(settings, 'REPLICA_DATABASE_ALIAS', None) is None:
+            return None
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if getattr(settings, 'REPLICA_DATABASE_ALIAS', None) is None:
+            return None
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        replica = getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+        if replica is not None and db == replica:
+            return False
+        return None
@@ -0,0 +1,70 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .references import labels_for
+
+
+PROSPECT_SEARCH_FIELDS = ['entreprise', 'nif', 'registre_commerce', 'email', 'phone_number']
+# Matched through their reference tables
+PROSPECT_SEARCH_REFERENCES = ['wilaya', 'commune']
+
+# Must stay identical to the expression of the prospects_search_idx GIN index
+# (migration 0018) so Postgres can use the index.
+PROSPECT_SEARCH_VECTOR_SQL = "to_tsvector('simple'::regconfig, {})".format(
+    " || ' ' || ".join(f"coalesce({field}, '')" for field in PROSPECT_SEARCH_FIELDS)
+)
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(q):
+    """Split a free-text query into lower-cased word terms"""
+    return [term.lower() for term in _TERM_RE.findall(q or '')]
+
+
+def _reference_match(model, term):
+    """Q matching the prospects whose wilaya or commune has a word starting with `term`"""
+    match = Q()
+    for name in PROSPECT_SEARCH_REFERENCES:
+        field = model._meta.get_field(name)
+        match |= Q(**{f'{field.attname}__in': labels_for(field.related_model).matching(term)})
+    return match
+
+
+def search_prospects(queryset, q):
+    """
+    Filter `queryset` to prospects matching every term of `q` (as a prefix)
+    in any of PROSPECT_SEARCH_FIELDS or the labels of
+    PROSPECT_SEARCH_REFERENCES, most relevant first.
+
+    On Postgres each term is a full-text match against the indexed tsvector
+    or a lookup in the (small) reference tables, ranked with ts_rank. Other
+    databases (SQLite in tests) fall back to icontains filters ordered by
+    name.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == 'postgresql':
+        for term in terms:
+            queryset = queryset.filter(
+                Q(RawSQL(f"{PROSPECT_SEARCH_VECTOR_SQL} @@ to_tsquery('simple', %s)", [f"{term}:*"], output_field=BooleanField()))
+                | _reference_match(queryset.model, term)
+            )
+        # Terms matched in a wilaya or commune only are not in the vector:
+        # rank on any term rather than all of them
+        tsquery = ' | '.join(f"{term}:*" for term in terms)
+        return queryset.annotate(
+            rank=RawSQL(f"ts_rank({PROSPECT_SEARCH_VECTOR_SQL}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField())
+        ).order_by('-rank', 'id')
+
+    for term in terms:
+        match = _reference_match(queryset.model, term)
+        for field in PROSPECT_SEARCH_FIELDS:
+            match |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(match)
+    return queryset.order_by('entreprise', 'id')
@@ -1,5 +1,38 @@
 from rest_framework import serializers
 from .models import PhoneNumber, OTP, Contact, Prospect, Activity
+from .projection import DynamicFieldsMixin
+from .references import labels_for
+
+
+class ReferenceLabelField(serializers.CharField):
+    """
+    A ReferenceField read and written as its label, through the in-memory
+    lookup (api.references.ReferenceLabels): no join or query per row. New
+    labels create their reference row, blank ones clear the field.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_length', 100)
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('allow_null', True)
+        kwargs.setdefault('allow_blank', True)
+        super().__init__(**kwargs)
+
+    def bind(self, field_name, parent):
+        model_field = parent.Meta.model._meta.get_field(self.source or field_name)
+        self.labels = labels_for(model_field.related_model)
+        # Read and write the id column, as values() rows hold it
+        self.source = model_field.attname
+        super().bind(field_name, parent)
+
+    def run_validation(self, data=serializers.empty):
+        # Validated as text, stored as the id; rows for new labels are only
+        # created when the instance is saved
+        label = super().run_validation(data)
+        return self.labels.find(label) if label else None
+
+    def to_representation(self, value):
+        return self.labels.label(value)
 
 class PhoneNumberSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,19 +51,29 @@ class OTPVerifySerializer(serializers.Serializer):
     phone_number = serializers.CharField(required=True, help_text="Phone number string")
     otp_code = serializers.CharField(required=True, help_text="OTP code to verify")
 
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = ['id', 'name', 'phone_number', 'email', 'company', 'type']
         read_only_fields = ['id']
 
-class ProspectSerializer(serializers.ModelSerializer):
+class ProspectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    wilaya = ReferenceLabelField()
+    commune = ReferenceLabelField()
+    categorie = ReferenceLabelField()
+    forme_legale = ReferenceLabelField()
+    secteur = ReferenceLabelField()
+    sous_secteur = ReferenceLabelField()
+
     class Meta:
         model = Prospect
-        fields = '__all__'
+        fields = [
+            'id', 'entreprise', 'adresse', 'wilaya', 'commune', 'phone_number', 'email', 'categorie',
+            'forme_legale', 'secteur', 'sous_secteur', 'nif', 'registre_commerce', 'status', 'user', 'updated_at',
+        ]
         read_only_fields = ['id']
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = ['id', 'title', 'description', 'type', 'timestamp']
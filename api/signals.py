@@ -1,7 +1,192 @@
-from django.db.models.signals import post_save, post_delete
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q, Subquery
+from django.utils import timezone
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Contact, Prospect, Activity
+from rest_framework.authtoken.models import Token
+from .models import Contact, Prospect, Activity, Tombstone
+from .activity_queue import activity_queue
+from .etags import bump_version
+from .authentication import token_user_cache
+from .dashboard import apply_deltas, cascaded_activity_deltas, instance_deltas, record_activities, save_deltas
+
+
+# Set while bulk operations write their own activities/tombstones in one batch
+_tracking_muted = ContextVar('change_tracking_muted', default=False)
+
+
+@contextmanager
+def mute_change_tracking():
+    """
+    Disable the per-row activity and tombstone receivers for the duration of
+    the block. Used by bulk endpoints, which build the same rows themselves
+    and insert them with a single bulk_create.
+    """
+    token = _tracking_muted.set(True)
+    try:
+        yield
+    finally:
+        _tracking_muted.reset(token)
+
+
+def log_activity(activity):
+    """
+    Persist an activity built by one of the builders below: synchronously by
+    default, or through the write-behind queue when ACTIVITY_WRITE_BEHIND is on.
+    """
+    if getattr(settings, 'ACTIVITY_WRITE_BEHIND', False):
+        activity_queue.enqueue(activity)
+    else:
+        activity.save(force_insert=True)
+
+
+def log_dashboard_deltas(user_id, deltas):
+    """
+    Apply the dashboard counter deltas of a write: synchronously by default,
+    or with the next write-behind batch when ACTIVITY_WRITE_BEHIND is on.
+    """
+    if not any(deltas.values()):
+        return
+    if getattr(settings, 'ACTIVITY_WRITE_BEHIND', False):
+        activity_queue.enqueue_deltas(user_id, deltas)
+    else:
+        apply_deltas(user_id, deltas)
+
+
+def coalesce_update_activity(activity):
+    """
+    Merge an update activity into the latest update activity of the same
+    contact/prospect when that one was logged less than
+    ACTIVITY_COALESCE_SECONDS ago, with one UPDATE that keeps its timestamp
+    and takes the new description. Returns True if merged; the caller logs
+    the activity otherwise.
+    """
+    window = getattr(settings, 'ACTIVITY_COALESCE_SECONDS', 0)
+    if window <= 0:
+        return False
+    latest = Activity.objects.filter(
+        user_id=activity.user_id,
+        contact_id=activity.contact_id,
+        prospect_id=activity.prospect_id,
+        type=activity.type,
+        title=activity.title,
+        timestamp__gte=timezone.now() - timedelta(seconds=window),
+    ).order_by('-timestamp').values('pk')[:1]
+    merged = Activity.objects.filter(pk=Subquery(latest)).update(description=activity.description)
+    if merged:
+        bump_version(activity.user_id, Activity._meta.db_table)
+    return merged == 1
+
+
+def coalesce_update_activities(activities):
+    """
+    coalesce_update_activity() for a batch of update activities of one
+    user's contacts/prospects (bulk updates): the recent activities they
+    merge into are read in one query and updated with one bulk_update.
+    Returns the activities left to log.
+    """
+    window = getattr(settings, 'ACTIVITY_COALESCE_SECONDS', 0)
+    if window <= 0 or not activities:
+        return list(activities)
+
+    def key(activity):
+        return activity.contact_id, activity.prospect_id, activity.type, activity.title
+
+    recent = Activity.objects.filter(
+        Q(contact_id__in=[activity.contact_id for activity in activities if activity.contact_id])
+        | Q(prospect_id__in=[activity.prospect_id for activity in activities if activity.prospect_id]),
+        user_id=activities[0].user_id,
+        type__in={activity.type for activity in activities},
+        title__in={activity.title for activity in activities},
+        timestamp__gte=timezone.now() - timedelta(seconds=window),
+    ).only('id', 'contact_id', 'prospect_id', 'type', 'title').order_by('-timestamp')
+    latest = {}
+    for activity in recent:
+        latest.setdefault(key(activity), activity)
+
+    merged, remaining = [], []
+    for activity in activities:
+        target = latest.get(key(activity))
+        if target is None:
+            remaining.append(activity)
+        else:
+            target.description = activity.description
+            merged.append(target)
+    if merged:
+        Activity.objects.bulk_update(merged, ['description'])
+        bump_version(activities[0].user_id, Activity._meta.db_table)
+    return remaining
+
+
+def log_save_activity(activity, created):
+    """Log the activity of a save, coalescing bursts of updates"""
+    if created or not coalesce_update_activity(activity):
+        log_activity(activity)
+
+
+def build_contact_activity(instance, created):
+    """Build (without saving) the activity for a created or updated Contact"""
+    if created:
+        activity_type = 'client_added' if instance.type and instance.type.lower() == 'client' else 'prospect_added'
+        title = 'Client ajouté' if activity_type == 'client_added' else 'Prospect ajouté'
+        return Activity(
+            title=title,
+            description=f"New {instance.type} contact created: {instance.name}",
+            type=activity_type,
+            user=instance.user,
+            contact=instance,
+        )
+    return Activity(
+        title='Contact mis à jour',
+        description=f"Contact updated: {instance.name}",
+        type='status_updated',
+        user=instance.user,
+        contact=instance,
+    )
+
+
+def build_contact_delete_activity(instance):
+    """Build (without saving) the activity for a deleted Contact"""
+    return Activity(
+        title='Contact supprimé',
+        description=f"Contact deleted: {instance.name}",
+        type='other',
+        user=instance.user,
+    )
+
+
+def build_prospect_activity(instance, created):
+    """Build (without saving) the activity for a created or updated Prospect"""
+    if created:
+        return Activity(
+            title='Prospect ajouté',
+            description=f"New prospect created: {instance.entreprise}",
+            type='prospect_added',
+            user=instance.user,
+            prospect=instance,
+        )
+    return Activity(
+        title='Prospect mis à jour',
+        description=f"Prospect updated: {instance.entreprise}",
+        type='status_updated',
+        user=instance.user,
+        prospect=instance,
+    )
+
+
+def build_prospect_delete_activity(instance):
+    """Build (without saving) the activity for a deleted Prospect"""
+    return Activity(
+        title='Prospect supprimé',
+        description=f"Prospect deleted: {instance.entreprise}",
+        type='other',
+        user=instance.user,
+    )
 
 
 @receiver(post_save, sender=Contact)
@@ -10,29 +195,10 @@ def track_contact_activity(sender, instance, created, **kwargs):
     Track Contact CRUD operations: create and update.
     Uses the contact's owner (user) for activity tracking.
     """
+    if _tracking_muted.get():
+        return
     try:
-        if created:
-            # Contact created
-            activity_type = 'client_added' if instance.type and instance.type.lower() == 'client' else 'prospect_added'
-            title = 'Client ajouté' if activity_type == 'client_added' else 'Prospect ajouté'
-            description = f"New {instance.type} contact created: {instance.name}"
-            
-            Activity.objects.create(
-                title=title,
-                description=description,
-                type=activity_type,
-                user=instance.user,
-                contact=instance,
-            )
-        else:
-            # Contact updated
-            Activity.objects.create(
-                title='Contact mis à jour',
-                description=f"Contact updated: {instance.name}",
-                type='status_updated',
-                user=instance.user,
-                contact=instance,
-            )
+        log_save_activity(build_contact_activity(instance, created), created)
     except Exception as e:
         print(f"Error tracking Contact activity: {str(e)}")
 
@@ -43,13 +209,10 @@ def track_contact_delete(sender, instance, **kwargs):
     Track Contact deletion.
     Uses the contact's owner (user) for activity tracking.
     """
+    if _tracking_muted.get():
+        return
     try:
-        Activity.objects.create(
-            title='Contact supprimé',
-            description=f"Contact deleted: {instance.name}",
-            type='other',
-            user=instance.user,
-        )
+        log_activity(build_contact_delete_activity(instance))
     except Exception as e:
         print(f"Error tracking Contact deletion: {str(e)}")
 
@@ -60,25 +223,10 @@ def track_prospect_activity(sender, instance, created, **kwargs):
     Track Prospect CRUD operations: create and update.
     Uses the prospect's owner (user) for activity tracking.
     """
+    if _tracking_muted.get():
+        return
     try:
-        if created:
-            # Prospect created
-            Activity.objects.create(
-                title='Prospect ajouté',
-                description=f"New prospect created: {instance.entreprise}",
-                type='prospect_added',
-                user=instance.user,
-                prospect=instance,
-            )
-        else:
-            # Prospect updated
-            Activity.objects.create(
-                title='Prospect mis à jour',
-                description=f"Prospect updated: {instance.entreprise}",
-                type='status_updated',
-                user=instance.user,
-                prospect=instance,
-            )
+        log_save_activity(build_prospect_activity(instance, created), created)
     except Exception as e:
         print(f"Error tracking Prospect activity: {str(e)}")
 
@@ -89,12 +237,97 @@ def track_prospect_delete(sender, instance, **kwargs):
     Track Prospect deletion.
     Uses the prospect's owner (user) for activity tracking.
     """
+    if _tracking_muted.get():
+        return
     try:
-        Activity.objects.create(
-            title='Prospect supprimé',
-            description=f"Prospect deleted: {instance.entreprise}",
-            type='other',
-            user=instance.user,
-        )
+        log_activity(build_prospect_delete_activity(instance))
     except Exception as e:
         print(f"Error tracking Prospect deletion: {str(e)}")
+
+
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Prospect)
+def record_tombstone(sender, instance, **kwargs):
+    """
+    Leave a tombstone for deleted contacts and prospects so the sync
+    endpoint can report deletions to clients.
+    """
+    if _tracking_muted.get():
+        return
+    try:
+        Tombstone.for_instance(instance).save(force_insert=True)
+    except Exception as e:
+        print(f"Error recording {sender.__name__} tombstone: {str(e)}")
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+@receiver(post_save, sender=Prospect)
+@receiver(post_delete, sender=Prospect)
+@receiver(post_save, sender=Activity)
+def bump_resource_version(sender, instance, **kwargs):
+    """
+    Invalidate the owner's ETags for the changed resource
+    (contacts, prospects or activities).
+    """
+    if _tracking_muted.get():
+        return
+    try:
+        bump_version(instance.user_id, sender._meta.db_table)
+    except Exception as e:
+        print(f"Error bumping {sender.__name__} version: {str(e)}")
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Drop a deleted token from the authentication cache"""
+    token_user_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def evict_inactive_user_tokens(sender, instance, **kwargs):
+    """Drop a deactivated user's tokens from the authentication cache"""
+    if instance.is_active:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        token_user_cache.invalidate(key)
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Prospect)
+def update_dashboard_on_save(sender, instance, created, **kwargs):
+    """Move the saved contact/prospect between its dashboard counter groups"""
+    if _tracking_muted.get():
+        return
+    try:
+        log_dashboard_deltas(instance.user_id, save_deltas(instance, created))
+    except Exception as e:
+        print(f"Error updating {sender.__name__} dashboard counters: {str(e)}")
+
+
+@receiver(pre_delete, sender=Contact)
+@receiver(pre_delete, sender=Prospect)
+def update_dashboard_on_delete(sender, instance, **kwargs):
+    """
+    Remove the contact/prospect being deleted, and the activities its
+    deletion cascades to, from the dashboard counters.
+    """
+    if _tracking_muted.get():
+        return
+    try:
+        deltas = instance_deltas(instance, sign=-1)
+        deltas.update(cascaded_activity_deltas(sender, [instance.pk]))
+        log_dashboard_deltas(instance.user_id, deltas)
+    except Exception as e:
+        print(f"Error updating {sender.__name__} dashboard counters: {str(e)}")
+
+
+@receiver(post_save, sender=Activity)
+def update_dashboard_on_activity(sender, instance, created, **kwargs):
+    """Count a newly logged activity in today's dashboard bucket"""
+    if not created or _tracking_muted.get():
+        return
+    try:
+        record_activities([instance])
+    except Exception as e:
+        print(f"Error updating activity dashboard counters: {str(e)}")
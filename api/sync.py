@@ -0,0 +1,65 @@
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Contact, Prospect, Tombstone
+
+
+TOKEN_VERSION = 'v1'
+
+
+def encode_sync_token(moment):
+    """Encode a server timestamp as an opaque sync token"""
+    micros = int(moment.timestamp() * 1_000_000)
+    return base64.urlsafe_b64encode(f"{TOKEN_VERSION}:{micros}".encode('ascii')).decode('ascii')
+
+
+def decode_sync_token(token):
+    """Decode a sync token back to a timestamp. Raises ValueError if malformed."""
+    try:
+        version, micros = base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii').split(':', 1)
+        if version != TOKEN_VERSION:
+            raise ValueError('Unknown sync token version')
+        return datetime.fromtimestamp(int(micros) / 1_000_000, tz=dt_timezone.utc)
+    except (binascii.Error, UnicodeError, OverflowError, OSError) as e:
+        raise ValueError(str(e))
+
+
+def changes_since(user, since):
+    """
+    Collect the user's contacts and prospects changed since `since` (or all of
+    them when `since` is None) plus the ids of those deleted since then.
+
+    Returns (token, changes) where `token` is to be passed back on the next
+    sync. Every query is a range scan on a (user, <timestamp>) index.
+
+    The lower bound is pulled back by SYNC_OVERLAP_SECONDS so rows written by
+    transactions that committed after the previous sync started are not
+    missed; clients apply changes idempotently by id, so the overlap is safe.
+    """
+    token = encode_sync_token(timezone.now())
+    contacts = Contact.objects.filter(user=user)
+    prospects = Prospect.objects.filter(user=user)
+    tombstones = Tombstone.objects.filter(user=user)
+
+    if since is None:
+        tombstones = tombstones.none()
+    else:
+        lower = since - timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 5))
+        contacts = contacts.filter(updated_at__gte=lower)
+        prospects = prospects.filter(updated_at__gte=lower)
+        tombstones = tombstones.filter(deleted_at__gte=lower)
+
+    deleted = {'contact': [], 'prospect': []}
+    for object_type, object_id in tombstones.values_list('object_type', 'object_id'):
+        deleted[object_type].append(str(object_id))
+
+    return token, {
+        'contacts': contacts,
+        'prospects': prospects,
+        'deleted_contacts': deleted['contact'],
+        'deleted_prospects': deleted['prospect'],
+    }
@@ -1,3 +1,1130 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+import brotli
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import Activity, Contact, DashboardCounter, OTP, PhoneNumber, Prospect, Secteur, Tombstone, Wilaya
+from .checks import check_etag_cache
+from .signals import mute_change_tracking
+from .otp_reaper import PURGE_LOCK_KEY, purge_expired_otps
+from .sync import encode_sync_token
+from .partitions import (
+    ARCHIVE_COLUMNS, Partition, add_months, archive_dirname, archive_partitions, list_partitions, month_start,
+    read_archived,
+)
+from .renderers import FastJSONRenderer
+from .phones import normalize_phone
+from .duplicates import find_duplicate_pairs, name_key
+from .references import labels_for
+from .activity_queue import ActivityWriteBehindQueue
+from .authentication import token_user_cache
+from .middleware import ReplicaRoutingMiddleware
+from .benchmark import SCENARIOS, compare_to_baseline, run_benchmark, seed
+from .async_views import async_route
+from .views import ActivityViewSet, ContactViewSet, OTPViewSet, ProspectViewSet
+
+
+class AuthenticatedAPITestCase(TestCase):
+    """Base test case with a token-authenticated API client"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='0555000000')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class ActivityPaginationTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        activities = [
+            Activity(title=f'Activity {i}', description='', type='other', user=self.user)
+            for i in range(7)
+        ]
+        Activity.objects.bulk_create(activities)
+        # Two rows share a timestamp to exercise the id tie-breaker
+        for i, activity in enumerate(activities):
+            Activity.objects.filter(pk=activity.pk).update(timestamp=now - timedelta(minutes=min(i, 5)))
+
+    def test_walks_all_pages_without_duplicates(self):
+        seen = []
+        url = '/api/activities/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        expected = [str(pk) for pk in Activity.objects.filter(user=self.user)
+                    .order_by('-timestamp', 'id').values_list('id', flat=True)]
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/activities/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkEndpointsTest(AuthenticatedAPITestCase):
+    def test_bulk_create_matches_signal_activities(self):
+        payload = [
+            {'entreprise': f'Company {i}', 'status': 'new', 'user': self.user.id}
+            for i in range(3)
+        ]
+        response = self.client.post('/api/prospects/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Prospect.objects.filter(user=self.user).count(), 3)
+
+        activities = Activity.objects.filter(user=self.user, type='prospect_added')
+        self.assertEqual(activities.count(), 3)
+        self.assertEqual(
+            set(activities.values_list('description', flat=True)),
+            {f'New prospect created: Company {i}' for i in range(3)},
+        )
+
+    def test_bulk_create_rejects_whole_batch_on_error(self):
+        payload = [
+            {'name': 'Ok', 'phone_number': '0555', 'email': 'a@b.c', 'type': 'client'},
+            {'name': 'Missing type', 'phone_number': '0555', 'email': 'a@b.c'},
+        ]
+        response = self.client.post('/api/contacts/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Contact.objects.exists())
+        self.assertFalse(Activity.objects.exists())
+
+    def test_bulk_update_and_delete(self):
+        contacts = [
+            Contact.objects.create(name=f'C{i}', phone_number='0555', email='a@b.c', type='client', user=self.user)
+            for i in range(2)
+        ]
+        payload = [{'id': str(c.id), 'company': 'ACME'} for c in contacts]
+        response = self.client.patch('/api/contacts/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Contact.objects.filter(company='ACME').count(), 2)
+        self.assertEqual(Activity.objects.filter(title='Contact mis à jour').count(), 2)
+
+        response = self.client.delete('/api/contacts/bulk/', {'ids': [str(c.id) for c in contacts]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(Activity.objects.filter(title='Contact supprimé').count(), 2)
+
+    def test_bulk_update_coalesces_like_single_updates(self):
+        contacts = [
+            Contact.objects.create(name=f'C{i}', phone_number='0555', email='a@b.c', type='client', user=self.user)
+            for i in range(2)
+        ]
+        self.client.patch(f'/api/contacts/{contacts[0].id}/', {'name': 'First'}, format='json')
+        payload = [{'id': str(c.id), 'name': f'Bulk {i}'} for i, c in enumerate(contacts)]
+        self.client.patch('/api/contacts/bulk/', payload, format='json')
+
+        updates = Activity.objects.filter(title='Contact mis à jour')
+        self.assertEqual(
+            sorted(updates.values_list('description', flat=True)), ['Contact updated: Bulk 0', 'Contact updated: Bulk 1']
+        )
+
+    def test_bulk_update_rejects_repeated_ids(self):
+        contacts = [
+            Contact.objects.create(name=f'C{i}', phone_number='0555', email='a@b.c', type='client', user=self.user)
+            for i in range(2)
+        ]
+        payload = [{'id': str(contacts[0].id), 'name': 'A'}, {'id': str(contacts[1].id), 'name': 'B'},
+                   {'id': str(contacts[0].id).upper(), 'name': 'C'}]
+        response = self.client.patch('/api/contacts/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['ids'], [str(contacts[0].id)])
+        self.assertEqual(sorted(Contact.objects.values_list('name', flat=True)), ['C0', 'C1'])
+
+    def test_bulk_update_ignores_other_users_objects(self):
+        other = User.objects.create(username='0555999999')
+        contact = Contact.objects.create(name='Theirs', phone_number='0555', email='a@b.c', type='client', user=other)
+        response = self.client.patch('/api/contacts/bulk/', [{'id': str(contact.id), 'name': 'Mine'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        contact.refresh_from_db()
+        self.assertEqual(contact.name, 'Theirs')
+
+
+class SyncEndpointTest(AuthenticatedAPITestCase):
+    def test_full_snapshot_then_delta(self):
+        kept = Contact.objects.create(name='Kept', phone_number='0555', email='a@b.c', type='client', user=self.user)
+        gone = Prospect.objects.create(entreprise='Gone', status='new', user=self.user)
+
+        response = self.client.get('/api/sync/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['contacts']['changed']), 1)
+        self.assertEqual(len(response.data['prospects']['changed']), 1)
+
+        # Simulate a sync well after those writes so the overlap window excludes them
+        Contact.objects.filter(pk=kept.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        since = encode_sync_token(timezone.now() - timedelta(minutes=30))
+        gone_id = gone.id
+        gone.delete()
+        added = Contact.objects.create(name='New', phone_number='0555', email='a@b.c', type='client', user=self.user)
+
+        response = self.client.get(f'/api/sync/?since={since}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['id'] for c in response.data['contacts']['changed']], [str(added.id)])
+        self.assertEqual(response.data['prospects']['deleted'], [str(gone_id)])
+        self.assertTrue(Tombstone.objects.filter(object_id=gone_id, object_type='prospect').exists())
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/sync/?since=garbage')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityWriteBehindTest(AuthenticatedAPITestCase):
+    @override_settings(ACTIVITY_WRITE_BEHIND=True)
+    def test_save_queues_activity_until_flush(self):
+        write_behind = ActivityWriteBehindQueue(batch_size=2, autostart=False)
+        with mock.patch('api.signals.activity_queue', write_behind):
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(3):
+                    Prospect.objects.create(entreprise=f'Company {i}', status='new', user=self.user)
+            self.assertFalse(Activity.objects.exists())
+            # Activities and dashboard counter deltas
+            self.assertEqual(write_behind.qsize(), 6)
+            self.assertFalse(DashboardCounter.objects.exists())
+
+        self.assertEqual(write_behind.flush(), 6)
+        self.assertEqual(Activity.objects.filter(type='prospect_added').count(), 3)
+        dashboard = self.client.get('/api/dashboard/').data
+        self.assertEqual(dashboard['prospects']['by_status'], {'new': 3})
+        self.assertEqual(dashboard['activities']['last_7_days'], {'prospect_added': 3})
+
+    def test_full_queue_writes_synchronously(self):
+        write_behind = ActivityWriteBehindQueue(max_size=1, autostart=False)
+        write_behind._put(Activity(title='a', description='', type='other', user=self.user))
+        write_behind._put(Activity(title='b', description='', type='other', user=self.user))
+        self.assertEqual(write_behind.qsize(), 1)
+        self.assertEqual(Activity.objects.count(), 1)
+
+
+@override_settings(ETAG_ENABLED=True)
+class ConditionalGetTest(AuthenticatedAPITestCase):
+    def test_not_modified_until_resource_changes(self):
+        response = self.client.get('/api/contacts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # The token is cached after the first request: no query at all
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/contacts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(name='New', phone_number='0555', email='a@b.c', type='client', user=self.user)
+
+        response = self.client.get('/api/contacts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 1)
+
+    def test_per_process_cache_is_refused(self):
+        self.assertEqual([error.id for error in check_etag_cache(None)], ['api.E001'])
+        with override_settings(ETAG_ENABLED=False):
+            self.assertEqual(check_etag_cache(None), [])
+
+
+class CachedTokenAuthenticationTest(AuthenticatedAPITestCase):
+    def test_token_lookup_is_cached(self):
+        self.client.get('/api/contacts/')
+        with self.assertNumQueries(1):
+            # Only the contacts query itself
+            response = self.client.get('/api/contacts/', HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_is_evicted(self):
+        self.client.get('/api/contacts/')
+        self.token.delete()
+        response = self.client.get('/api/contacts/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deactivated_user_is_evicted(self):
+        self.client.get('/api/contacts/')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/contacts/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OTPVerifyTest(TestCase):
+    def setUp(self):
+        # OTP throttle counters live in the cache
+        caches['default'].clear()
+        self.client = APIClient()
+        self.phone_number = '0555123456'
+        PhoneNumber.objects.create(phone_number=self.phone_number)
+
+    def generate_and_verify(self):
+        response = self.client.post('/api/otps/generate/', {'phone_number': self.phone_number}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = {'phone_number': self.phone_number, 'otp_code': response.data['otp_code']}
+        first = self.client.post('/api/otps/verify/', data, format='json')
+        second = self.client.post('/api/otps/verify/', data, format='json')
+        return first, second
+
+    def test_code_verifies_only_once(self):
+        first, second = self.generate_and_verify()
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertTrue(Token.objects.filter(key=first.data['token']).exists())
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OTP.objects.filter(is_valid=True).exists())
+
+    def test_any_formatting_logs_into_the_registered_number(self):
+        for store in ('database', 'cache'):
+            with self.subTest(store=store), override_settings(OTP_STORE=store):
+                response = self.client.post('/api/otps/generate/', {'phone_number': '+213 555 12 34 56'}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                data = {'phone_number': '00213555123456', 'otp_code': response.data['otp_code']}
+                response = self.client.post('/api/otps/verify/', data, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(Token.objects.get(key=response.data['token']).user.username, self.phone_number)
+        self.assertFalse(User.objects.filter(username__in=['+213 555 12 34 56', '00213555123456']).exists())
+
+    def test_numbers_sharing_a_key_log_into_the_oldest(self):
+        # Another registration of the same number, whose user already has a token
+        newer = PhoneNumber.objects.create(phone_number='+213555123456')
+        PhoneNumber.objects.filter(pk=newer.pk).update(created_at=timezone.now() + timedelta(minutes=1))
+        Token.objects.create(user=User.objects.create(username=newer.phone_number))
+
+        first, _ = self.generate_and_verify()
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(Token.objects.get(key=first.data['token']).user.username, self.phone_number)
+        first, _ = self.generate_and_verify()
+        self.assertEqual(Token.objects.get(key=first.data['token']).user.username, self.phone_number)
+
+    def test_unknown_phone_number(self):
+        response = self.client.post('/api/otps/verify/', {'phone_number': '0000', 'otp_code': '12345'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Invalid phone number')
+
+    @override_settings(OTP_STORE='cache')
+    def test_cache_store_skips_otps_table(self):
+        first, second = self.generate_and_verify()
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OTP.objects.exists())
+
+
+class PurgeOTPsTest(TestCase):
+    def test_purges_expired_and_consumed_and_backfills_expiry(self):
+        phone = PhoneNumber.objects.create(phone_number='0555123456')
+        now = timezone.now()
+        live = OTP.objects.create(phone_number=phone, otp_code='11111', expires_at=now + timedelta(minutes=5))
+        OTP.objects.create(phone_number=phone, otp_code='22222', expires_at=now - timedelta(days=1))
+        consumed = OTP.objects.create(phone_number=phone, otp_code='33333', expires_at=now + timedelta(minutes=5), is_valid=False)
+        OTP.objects.filter(pk=consumed.pk).update(created_at=now - timedelta(days=1))
+        no_expiry = OTP.objects.create(phone_number=phone, otp_code='44444')
+
+        out = StringIO()
+        call_command('purge_otps', '--batch-size=1', stdout=out)
+
+        self.assertEqual(set(OTP.objects.values_list('pk', flat=True)), {live.pk, no_expiry.pk})
+        no_expiry.refresh_from_db()
+        self.assertIsNotNone(no_expiry.expires_at)
+        self.assertIn('Deleted 2 OTPs, backfilled expiry on 1', out.getvalue())
+
+    def test_backfills_expiry_in_batches(self):
+        phone = PhoneNumber.objects.create(phone_number='0555123456')
+        OTP.objects.bulk_create([OTP(phone_number=phone, otp_code=f'{i:05}') for i in range(5)])
+
+        with CaptureQueriesContext(connection) as captured:
+            result = purge_expired_otps(batch_size=2)
+        self.assertEqual(result['backfilled'], 5)
+        self.assertFalse(OTP.objects.filter(expires_at__isnull=True).exists())
+        self.assertEqual(len([query for query in captured if query['sql'].startswith('UPDATE')]), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'advisory locks are Postgres only')
+    def test_overlapping_runs_skip(self):
+        phone = PhoneNumber.objects.create(phone_number='0555123456')
+        OTP.objects.create(phone_number=phone, otp_code='11111', expires_at=timezone.now() - timedelta(days=1))
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [PURGE_LOCK_KEY])
+
+        out = StringIO()
+        call_command('purge_otps', stdout=out)
+        self.assertIn('Another purge is in progress', out.getvalue())
+        self.assertTrue(OTP.objects.exists())
+
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [PURGE_LOCK_KEY])
+        with self.assertLogs('api.otp_reaper', 'INFO') as logs:
+            call_command('purge_otps', stdout=StringIO())
+        self.assertIn('deleted 1', logs.output[0])
+        self.assertFalse(OTP.objects.exists())
+
+
+class ProspectSearchTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Prospect.objects.create(entreprise='Sonatrach', wilaya='Alger', nif='000111', status='new', user=self.user)
+        Prospect.objects.create(entreprise='Cevital', wilaya='Bejaia', status='new', user=self.user)
+        Prospect.objects.create(entreprise='Condor', wilaya='Bordj', commune='Alger centre', status='new', user=self.user)
+        other = User.objects.create(username='0555999999')
+        Prospect.objects.create(entreprise='Sonelgaz', wilaya='Alger', status='new', user=other)
+
+    def test_search_matches_any_field_for_own_prospects(self):
+        response = self.client.get('/api/prospects/?q=alger')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({p['entreprise'] for p in response.data['results']}, {'Sonatrach', 'Condor'})
+
+        response = self.client.get('/api/prospects/?q=000111')
+        self.assertEqual([p['entreprise'] for p in response.data['results']], ['Sonatrach'])
+
+    def test_search_is_paginated(self):
+        response = self.client.get('/api/prospects/?q=alger&page_size=1')
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_plain_list_is_unchanged(self):
+        response = self.client.get('/api/prospects/')
+        self.assertEqual(len(response.data), 3)
+
+
+class ExportTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            Prospect.objects.create(entreprise=f'Company {i}', wilaya='Alger', status='new', user=self.user)
+
+    def test_csv_export(self):
+        response = self.client.get('/api/prospects/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'entreprise'])
+        self.assertEqual(len(lines), 4)
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/prospects/export/?output=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({row['entreprise'] for row in rows}, {f'Company {i}' for i in range(3)})
+        self.assertNotIn('user', rows[0])
+
+    async def test_streams_asynchronously_under_asgi(self):
+        response = await AsyncClient().get(
+            '/api/prospects/export/?output=ndjson',
+            headers={'Authorization': f'Token {self.token.key}', 'Accept-Encoding': 'gzip'},
+        )
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(len(body.decode().splitlines()), 3)
+
+
+class ProspectImportTest(AuthenticatedAPITestCase):
+    CSV = (
+        "entreprise,nif,registre_commerce,wilaya,unknown\n"
+        "Existing Co,111,,Alger,x\n"
+        "New Co,222,RC-2,Oran,x\n"
+        "Same RC,,RC-2,Oran,x\n"
+        ",333,,Oran,x\n"
+        "Other Co,444,,Blida,x\n"
+    )
+
+    def test_import_dedupes_and_logs_activities(self):
+        Prospect.objects.create(entreprise='Existing Co', nif='111', status='New', user=self.user)
+        upload = SimpleUploadedFile('prospects.csv', self.CSV.encode(), content_type='text/csv')
+
+        response = self.client.post('/api/prospects/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['duplicates'], 2)
+        self.assertEqual(response.data['invalid'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 5)
+
+        self.assertEqual(
+            set(Prospect.objects.filter(user=self.user).values_list('entreprise', flat=True)),
+            {'Existing Co', 'New Co', 'Other Co'},
+        )
+        self.assertEqual(Activity.objects.filter(type='prospect_added', prospect__nif__in=['222', '444']).count(), 2)
+
+
+class DashboardTest(AuthenticatedAPITestCase):
+    def test_counters_follow_writes_and_match_rebuild(self):
+        prospect = Prospect.objects.create(entreprise='A', status='New', wilaya='Alger', user=self.user)
+        Prospect.objects.create(entreprise='B', status='New', wilaya='Oran', user=self.user)
+        contact = Contact.objects.create(name='C', phone_number='0555', email='a@b.c', type='Client', user=self.user)
+
+        prospect = Prospect.objects.get(pk=prospect.pk)
+        prospect.status = 'Contacted'
+        prospect.save()
+        contact.delete()
+        self.client.post('/api/prospects/bulk/', [{'entreprise': 'D', 'status': 'Lost', 'user': self.user.id}], format='json')
+
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['prospects']['total'], 3)
+        self.assertEqual(data['prospects']['by_status'], {'New': 1, 'Contacted': 1, 'Lost': 1})
+        self.assertEqual(data['contacts']['total'], 0)
+        self.assertEqual(data['activities']['last_7_days'], {
+            'prospect_added': 3, 'status_updated': 1, 'other': 1,
+        })
+
+        call_command('rebuild_dashboard', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/dashboard/').data, data)
+
+    @mock.patch.dict('api.dashboard._pruned_on', clear=True)
+    def test_writes_upsert_counters_and_prune_expired_days(self):
+        today = timezone.localdate()
+        for days_ago in (45, 3):
+            DashboardCounter.objects.create(user=self.user, dimension='activity_type', value='other',
+                                            bucket=(today - timedelta(days=days_ago)).isoformat(), count=2)
+        prospect = Prospect.objects.create(entreprise='A', status='New', user=self.user)
+        self.assertEqual(list(DashboardCounter.objects.filter(value='other').values_list('count', flat=True)), [2])
+
+        prospect = Prospect.objects.get(pk=prospect.pk)
+        prospect.status = 'Won'
+        with CaptureQueriesContext(connection) as captured:
+            prospect.save()
+        writes = [query['sql'] for query in captured if 'dashboard_counters' in query['sql']]
+        # One upsert for the status move, one for the update activity
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(all(sql.startswith('INSERT') for sql in writes))
+        data = self.client.get('/api/dashboard/').data
+        self.assertEqual(data['prospects']['by_status'], {'Won': 1})
+        self.assertEqual(data['activities']['last_7_days'], {'other': 2, 'prospect_added': 1, 'status_updated': 1})
+
+
+class SparseFieldsTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            Prospect.objects.create(entreprise=f'P{i}', status='New', nif=f'N{i}', user=self.user)
+
+    def test_fast_list_matches_serializer_output(self):
+        from .serializers import ProspectSerializer
+        response = self.client.get('/api/prospects/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = ProspectSerializer(Prospect.objects.filter(user=self.user), many=True).data
+        self.assertEqual(
+            sorted(response.data, key=lambda item: item['id']),
+            sorted(json.loads(json.dumps(expected)), key=lambda item: item['id']),
+        )
+
+    def test_fields_param_projects_list_and_detail(self):
+        response = self.client.get('/api/prospects/?fields=id,entreprise,status')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({tuple(item) for item in response.data}, {('id', 'entreprise', 'status')})
+
+        prospect_id = response.data[0]['id']
+        detail = self.client.get(f'/api/prospects/{prospect_id}/?fields=entreprise')
+        self.assertEqual(detail.data, {'entreprise': response.data[0]['entreprise']})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/contacts/?fields=name,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_activity_pages_without_cursor_fields(self):
+        first = self.client.get('/api/activities/?page_size=2&fields=title')
+        self.assertEqual([set(item) for item in first.data['results']], [{'title'}, {'title'}])
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 1)
+        self.assertIsNone(second.data['next'])
+
+
+class BenchmarkSuiteTest(TestCase):
+    def test_every_route_runs_and_regressions_are_reported(self):
+        contexts = seed(users=1, contacts=3, prospects=3, activities=5)
+        results = run_benchmark(contexts, iterations=2, warmup=0)
+        self.assertEqual(set(results), {scenario.name for scenario in SCENARIOS})
+        self.assertTrue(all(stats['requests'] == 2 for stats in results.values()))
+
+        baseline = {name: dict(stats) for name, stats in results.items()}
+        self.assertEqual(compare_to_baseline(results, baseline), [])
+        baseline['contacts:list']['queries'] -= 1
+        results['dashboard']['p50_ms'] = baseline['dashboard']['p50_ms'] * 2 + 10
+        self.assertEqual(len(compare_to_baseline(results, baseline)), 2)
+
+
+class QueryInstrumentationTest(AuthenticatedAPITestCase):
+    def test_disabled_by_default(self):
+        response = self.client.get('/api/contacts/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SQL_INSTRUMENTATION=True, SLOW_REQUEST_MS=60000, SLOW_REQUEST_QUERIES=1)
+    def test_server_timing_and_slow_request_log(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with self.assertLogs('api.performance', level='WARNING') as logs:
+            response = client.get('/api/contacts/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['path'], entry['status']), ('/api/contacts/', 200))
+        self.assertGreaterEqual(entry['queries'], 1)
+
+    @override_settings(SQL_INSTRUMENTATION=True)
+    async def test_counts_queries_under_asgi(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        from .middleware import _install_all
+        client = AsyncClient()
+        # The async test client sends request_started outside the thread the
+        # view runs in (the ASGI handler does not), so wrap that thread up front
+        await sync_to_async(_install_all)()
+        response = await client.get('/api/phone-numbers/')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+@override_settings(ETAG_ENABLED=True)
+class AsyncViewsTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.factory = AsyncRequestFactory()
+        Contact.objects.create(name='C', phone_number='0555', email='c@example.com', type='Client', user=self.user)
+        for i in range(3):
+            Prospect.objects.create(entreprise=f'P{i}', status='New', user=self.user)
+
+    async def _async_get(self, view, path):
+        response = await view(self.factory.get(path, headers={'Authorization': f'Token {self.token.key}'}))
+        return response.render()
+
+    async def test_async_lists_match_sync(self):
+        routes = [
+            (ContactViewSet, '/api/contacts/'),
+            (ContactViewSet, '/api/contacts/?fields=id,name'),
+            (ProspectViewSet, '/api/prospects/?q=p1'),
+            (ActivityViewSet, '/api/activities/?page_size=2'),
+        ]
+        for viewset, path in routes:
+            view = async_route(viewset, {'get': 'list'}, {'get': 'alist'})
+            expected = await sync_to_async(self.client.get)(path)
+            response = await self._async_get(view, path)
+            self.assertEqual(response.status_code, expected.status_code, (path, response.content))
+            self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+            self.assertEqual(response['ETag'], expected['ETag'], path)
+
+        view = async_route(ContactViewSet, {'get': 'list'}, {'get': 'alist'})
+        response = await view(self.factory.get('/api/contacts/', headers={'Authorization': 'Token nope'}))
+        self.assertEqual(response.render().status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_async_otp_login(self):
+        await PhoneNumber.objects.acreate(phone_number='0555999999')
+        generate = async_route(OTPViewSet, {'post': 'generate'}, {'post': 'agenerate'})
+        verify = async_route(OTPViewSet, {'post': 'verify'}, {'post': 'averify'})
+
+        response = (await generate(self.factory.post(
+            '/api/otps/generate/', {'phone_number': '0555999999'}, content_type='application/json'
+        ))).render()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        otp_code = json.loads(response.content)['otp_code']
+
+        payload = {'phone_number': '0555999999', 'otp_code': otp_code}
+        response = (await verify(self.factory.post('/api/otps/verify/', payload, content_type='application/json'))).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = await Token.objects.aget(user__username='0555999999')
+        self.assertEqual(json.loads(response.content)['token'], token.key)
+
+        response = (await verify(self.factory.post('/api/otps/verify/', payload, content_type='application/json'))).render()
+        self.assertEqual(json.loads(response.content), {'error': 'Invalid or expired OTP'})
+
+
+class DatabasePoolMetricsTest(AuthenticatedAPITestCase):
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/api/metrics/db-pool/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        token_user_cache.clear()
+        response = self.client.get('/api/metrics/db-pool/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Only PostgreSQL test databases are pooled
+        pooled = {'default'} if connection.settings_dict['ENGINE'] == 'api.db.postgresql_pool' else set()
+        self.assertEqual(set(response.data['pools']), pooled)
+
+    def test_stats_never_open_a_pool(self):
+        # Needs psycopg 3 and psycopg_pool, like the backend
+        from .db.postgresql_pool.base import _pools, pool_stats
+
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'api.db.postgresql_pool', 'NAME': 'crm', 'CONN_MAX_AGE': 0, 'OPTIONS': {'pool': {'min_size': 1}},
+        }})
+        self.assertEqual(pool_stats(handler.all()), {'default': {}})
+        self.assertNotIn(handler['default'].pool_key, _pools)
+
+    def test_close_pools_of_one_alias(self):
+        from .db.postgresql_pool.base import _pools, close_pools
+
+        pools = {('other', 'crm', os.getpid()): mock.Mock(), ('other', 'test_crm', os.getpid()): mock.Mock()}
+        _pools.update(pools)
+        self.addCleanup(lambda: [_pools.pop(key, None) for key in pools])
+        close_pools('missing')
+        self.assertTrue(set(pools) <= set(_pools))
+        close_pools('other')
+        self.assertFalse(set(pools) & set(_pools))
+        for pool in pools.values():
+            pool.close.assert_called_once_with()
+
+
+@override_settings(REPLICA_DATABASE_ALIAS='replica', REPLICA_STICKY_SECONDS=30)
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+
+        def get_response(request):
+            self.seen.append((Contact.objects.all().db, Token.objects.all().db))
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+
+    def request(self, method, token):
+        self.middleware(getattr(self.factory, method)('/api/contacts/', HTTP_AUTHORIZATION=f'Token {token}'))
+        return self.seen[-1]
+
+    def test_reads_go_to_replica_until_the_client_writes(self):
+        self.assertEqual(self.request('get', 'a'), ('replica', 'default'))
+        self.assertEqual(self.request('post', 'a'), ('default', 'default'))
+        # Read-your-writes: client `a` sticks to the primary, others don't
+        self.assertEqual(self.request('get', 'a'), ('default', 'default'))
+        self.assertEqual(self.request('get', 'b'), ('replica', 'default'))
+        # Outside requests everything reads the primary
+        self.assertEqual(Contact.objects.all().db, 'default')
+
+
+@override_settings(OTP_THROTTLE_PHONE_RATE='2/min', OTP_THROTTLE_IP_RATE='4/min')
+class OTPThrottleTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        PhoneNumber.objects.create(phone_number='0555123456')
+        PhoneNumber.objects.create(phone_number='0555654321')
+
+    def generate(self, phone_number):
+        return self.client.post('/api/otps/generate/', {'phone_number': phone_number}, format='json')
+
+    def test_sheds_excess_requests_before_any_query(self):
+        self.assertEqual(self.generate('0555123456').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.generate('0555123456').status_code, status.HTTP_201_CREATED)
+        token_user_cache.clear()
+        with self.assertNumQueries(1):
+            # Only the token lookup: the number is over its limit
+            response = self.generate('0555123456')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+        # Another number is still allowed, then the IP runs out
+        self.assertEqual(self.generate('0555654321').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.generate('0555654321').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        self.user.is_staff = True
+        self.user.save()
+        token_user_cache.clear()
+        response = self.client.get('/api/metrics/throttle/')
+        self.assertEqual(response.data['shed'], {'otp_phone': 1, 'otp_ip': 1})
+
+    def test_spoofed_forwarded_for_shares_the_ip_counter(self):
+        def generate(i, forwarded_for):
+            # A different number each time: only the IP counter fills up
+            return self.client.post('/api/otps/generate/', {'phone_number': f'05550000{i:02}'}, format='json',
+                                    HTTP_X_FORWARDED_FOR=forwarded_for)
+
+        for i in range(4):
+            self.assertNotEqual(generate(i, f'10.0.0.{i}').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(generate(4, '10.0.0.4').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Behind one proxy, only the address it appended identifies the client
+        caches['default'].clear()
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            for i in range(4):
+                response = generate(i, f'10.0.0.{i}, 198.51.100.7')
+                self.assertNotEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(generate(4, '10.0.0.4, 198.51.100.7').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertNotEqual(generate(5, '198.51.100.8').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_phone_counter_ignores_formatting(self):
+        for phone_number in ('0555123456', '+213 555 12 34 56'):
+            self.assertEqual(self.generate(phone_number).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.generate('213555123456').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class ActivityArchiveTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        other = User.objects.create(username='0555000001')
+        files = {
+            self.user.id: [
+                ('a2', 'Newer', 'second', 'other', '2024-01-20 10:00:00+00', self.user.id),
+                ('a1', 'Old', 'first', 'other', '2024-01-05 10:00:00+00', self.user.id),
+            ],
+            other.id: [('b1', 'Not mine', '', 'other', '2024-01-10 10:00:00+00', other.id)],
+        }
+        month = os.path.join(self.archive_dir, 'activities_20240101_20240201')
+        os.mkdir(month)
+        for user_id, rows in files.items():
+            with gzip.open(os.path.join(month, f'{user_id}.csv.gz'), 'wt', newline='') as archive:
+                writer = csv.writer(archive)
+                writer.writerow(ARCHIVE_COLUMNS)
+                for row in rows:
+                    writer.writerow(row + ('', ''))
+
+    def test_reads_own_archived_activities_newest_first(self):
+        with override_settings(ACTIVITY_ARCHIVE_READS=True, ACTIVITY_ARCHIVE_DIR=self.archive_dir):
+            response = self.client.get('/api/activities/archived/?start=2024-01-01&end=2024-01-31')
+            items = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+            self.assertEqual([item['id'] for item in items], ['a2', 'a1'])
+            self.assertEqual(items[0]['timestamp'], '2024-01-20T10:00:00Z')
+
+            response = self.client.get('/api/activities/archived/?start=2024-01-06&end=2024-01-20')
+            self.assertEqual(b''.join(response.streaming_content), b'')
+
+            response = self.client.get('/api/activities/archived/?start=2024-01-10')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            for query in ('start=2024-01-10&end=2024-01-10', 'start=2020-01-01&end=2024-01-31'):
+                response = self.client.get(f'/api/activities/archived/?{query}')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+        response = self.client.get('/api/activities/archived/?start=2024-01-01&end=2024-01-31')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_partition_does_not_stop_the_run(self):
+        archive_dir = os.path.join(self.archive_dir, 'run')
+        partitions = [
+            Partition('activities_2024_01', datetime(2024, 1, 1, tzinfo=dt_timezone.utc), datetime(2024, 2, 1, tzinfo=dt_timezone.utc)),
+            Partition('activities_2024_02', datetime(2024, 2, 1, tzinfo=dt_timezone.utc), datetime(2024, 3, 1, tzinfo=dt_timezone.utc)),
+        ]
+
+        def archive(partition, path):
+            partial = path.with_name(path.name + '.partial')
+            partial.mkdir()
+            if partition.name == 'activities_2024_01':
+                raise OperationalError('canceling statement due to lock timeout')
+            partial.rename(path)
+
+        with mock.patch('api.partitions.list_partitions', return_value=partitions), \
+                mock.patch('api.partitions._archive_partition', side_effect=archive), \
+                self.assertLogs('api.partitions', 'WARNING') as logs:
+            archived = archive_partitions(datetime(2025, 1, 1, tzinfo=dt_timezone.utc), archive_dir)
+        self.assertEqual([name for name, _ in archived], ['activities_2024_02'])
+        self.assertIn('lock timeout', logs.output[0])
+        self.assertEqual(os.listdir(archive_dir), ['activities_20240201_20240301'])
+
+    @skipIf(connection.vendor == 'postgresql', 'activities is partitioned on PostgreSQL')
+    def test_partition_command_needs_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command('activity_partitions', stdout=StringIO())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'activities is only partitioned on PostgreSQL')
+class ActivityPartitionsTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+
+    def test_legacy_months_archived_and_read_back(self):
+        this_month = month_start(timezone.now())
+        # Rows of the table attached by migration 0012, spanning several months
+        timestamps = {
+            'old': add_months(this_month, -20) + timedelta(days=3),
+            'older': add_months(this_month, -20) + timedelta(days=1),
+            'recent': add_months(this_month, -19) + timedelta(days=2),
+            'kept': add_months(this_month, -2) + timedelta(days=2),
+        }
+        for title, at in timestamps.items():
+            activity = Activity.objects.create(title=title, description='', type='other', user=self.user)
+            Activity.objects.filter(pk=activity.pk).update(timestamp=at)
+        other = User.objects.create(username='0555000001')
+        Activity.objects.create(title='theirs', description='', type='other', user=other)
+        Activity.objects.filter(user=other).update(timestamp=timestamps['old'])
+
+        call_command('activity_partitions', retention_months=12, archive_dir=self.archive_dir, stdout=StringIO())
+        self.assertEqual(list(Activity.objects.values_list('title', flat=True)), ['kept'])
+        self.assertEqual(sorted(os.listdir(self.archive_dir)), [
+            archive_dirname(add_months(this_month, -20), add_months(this_month, -19)),
+            archive_dirname(add_months(this_month, -19), add_months(this_month, -18)),
+        ])
+        # Nothing left to archive: a second run changes nothing
+        call_command('activity_partitions', retention_months=12, archive_dir=self.archive_dir, stdout=StringIO())
+
+        with override_settings(ACTIVITY_ARCHIVE_READS=True, ACTIVITY_ARCHIVE_DIR=self.archive_dir):
+            start, end = add_months(this_month, -21).date(), add_months(this_month, -18).date()
+            response = self.client.get(f'/api/activities/archived/?start={start}&end={end}')
+            items = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([item['title'] for item in items], ['recent', 'old', 'older'])
+
+        # Whole partitions past the cutoff are detached and dropped, the legacy one included.
+        # Tables with pending deferred checks cannot be dropped: committed rows have none
+        connection.check_constraints()
+        archive_partitions(add_months(this_month, 4), self.archive_dir)
+        self.assertEqual(list_partitions(), [])
+        self.assertFalse(Activity.objects.exists())
+        kept = read_archived(self.user.pk, add_months(this_month, -3), this_month, self.archive_dir)
+        self.assertEqual([row['title'] for row in kept], ['kept'])
+
+
+class NoOpUpdateTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.contact = Contact.objects.create(name='C', phone_number='0555', email='a@b.c', type='Client', user=self.user)
+        self.url = f'/api/contacts/{self.contact.id}/'
+
+    def updates(self):
+        return Activity.objects.filter(contact=self.contact, type='status_updated')
+
+    def test_unchanged_patch_writes_nothing(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(self.url, {'name': 'C', 'email': 'a@b.c'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in captured if query['sql'].startswith(('UPDATE', 'INSERT'))])
+        self.assertFalse(self.updates().exists())
+
+    def test_saves_and_refreshes_reset_tracking(self):
+        contact = Contact.objects.get(pk=self.contact.pk)
+        with mute_change_tracking():
+            contact.name = 'D'
+            contact.save()
+        Contact.objects.filter(pk=contact.pk).update(email='d@b.c')
+        contact.refresh_from_db(fields=['email'])
+        with self.assertNumQueries(0):
+            contact.save()
+
+        contact.company = 'ACME'
+        contact.refresh_from_db(fields=['email'])
+        self.assertEqual(contact.get_dirty_fields(), {'company'})
+
+    def test_update_bursts_merge_into_one_activity(self):
+        for name in ('D', 'E', 'F'):
+            self.client.patch(self.url, {'name': name}, format='json')
+        self.assertEqual(list(self.updates().values_list('description', flat=True)), ['Contact updated: F'])
+
+        with override_settings(ACTIVITY_COALESCE_SECONDS=0):
+            self.client.patch(self.url, {'name': 'G'}, format='json')
+        self.assertEqual(self.updates().count(), 2)
+
+
+class RendererCompressionTest(AuthenticatedAPITestCase):
+    def test_fast_renderer_matches_stdlib(self):
+        data = {
+            'id': uuid.uuid4(), 'at': timezone.now(), 'day': timezone.now().date(), 'amount': Decimal('1.50'),
+            'label': gettext_lazy('Name'), 'items': [{'é': None}], 'counts': {None: 1, 'Alger': 2},
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=100)
+    def test_negotiates_brotli_then_gzip_above_threshold(self):
+        for i in range(20):
+            Contact.objects.create(name=f'Contact {i}', phone_number='0555', email='a@b.c', type='Client', user=self.user)
+
+        response = self.client.get('/api/contacts/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(brotli.decompress(response.content))), 20)
+
+        response = self.client.get('/api/contacts/', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 20)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # Small responses are sent as they are
+        response = self.client.get(f'/api/contacts/{Contact.objects.first().id}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class PhoneLookupTest(AuthenticatedAPITestCase):
+    def test_normalize_phone(self):
+        for number in ('+213 555 12 34 56', '00213555123456', '0555-12-34-56', '(0555) 123 456'):
+            self.assertEqual(normalize_phone(number), '213555123456')
+        self.assertEqual(normalize_phone('+33 6 12 34 56 78'), '33612345678')
+        self.assertEqual(normalize_phone(None), '')
+
+    def test_matches_any_formatting_in_one_query(self):
+        contact = Contact.objects.create(name='C', phone_number='0555 12 34 56', email='a@b.c', type='Client', user=self.user)
+        prospect = Prospect.objects.create(entreprise='P', phone_number='+213555123456', status='New', user=self.user)
+        Contact.objects.create(name='Other', phone_number='0661000000', email='a@b.c', type='Client', user=self.user)
+        other_user = User.objects.create(username='0555000001')
+        Contact.objects.create(name='Not mine', phone_number='0555123456', email='a@b.c', type='Client', user=other_user)
+        self.client.patch(f'/api/contacts/{contact.id}/', {'phone_number': '00213 555 123 456'}, format='json')
+
+        token_user_cache.clear()
+        self.client.get('/api/lookup/phone/?number=0')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/lookup/phone/', {'number': '0555-123-456'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['number'], '213555123456')
+        self.assertEqual([item['id'] for item in response.data['contacts']], [contact.id])
+        self.assertEqual(response.data['prospects'][0]['entreprise'], 'P')
+        self.assertEqual(response.data['prospects'][0]['id'], prospect.id)
+
+        self.assertEqual(self.client.get('/api/lookup/phone/').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DuplicateProspectTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.original = Prospect.objects.create(
+            entreprise='SARL El Baraka', wilaya='Béjaïa', commune='Akbou', nif='0001', status='New', user=self.user,
+        )
+
+    def test_name_key(self):
+        self.assertEqual(name_key('SARL El Baraka', 'Béjaïa'), name_key('Baraka (EURL)', '06 - BEJAIA'))
+        self.assertNotEqual(name_key('Baraka', 'Bejaia'), name_key('Baraka', 'Oran'))
+        self.assertEqual(self.original.name_key, 'bejaia:baraka')
+
+    def test_create_warns_about_duplicates(self):
+        response = self.client.post('/api/prospects/', {
+            'entreprise': 'Baraka EURL', 'wilaya': 'Bejaia', 'email': 'Contact@Baraka.dz', 'status': 'New', 'user': self.user.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual([d['id'] for d in response.data['duplicates']], [self.original.id])
+        self.assertEqual(response.data['duplicates'][0]['reasons'], ['name'])
+        self.assertNotIn('name_key', response.data)
+
+        response = self.client.post('/api/prospects/', {
+            'entreprise': 'Other', 'email': 'contact@baraka.dz ', 'nif': '0001', 'status': 'New', 'user': self.user.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([(d['score'], d['reasons']) for d in response.data['duplicates']],
+                         [(1.0, ['nif']), (0.9, ['email'])])
+
+        response = self.client.post('/api/prospects/', {'entreprise': 'Unrelated', 'status': 'New', 'user': self.user.pk}, format='json')
+        self.assertEqual(response.data['duplicates'], [])
+
+    def test_batch_scan(self):
+        other_user = User.objects.create(username='0555000002')
+        Prospect.objects.create(entreprise='Baraka', wilaya='Bejaia', nif='0001', status='New', user=other_user)
+        near = Prospect.objects.create(entreprise='El Barakaa', wilaya='bejaia', commune='AKBOU', status='New', user=self.user)
+        Prospect.objects.create(entreprise='El Barakaa', wilaya='Bejaia', commune='Amizour', status='New', user=self.user)
+        Prospect.objects.create(entreprise='Barakat Import Export', wilaya='Bejaia', status='New', user=self.user)
+
+        pairs, skipped = find_duplicate_pairs(Prospect.objects.all())
+        self.assertEqual(skipped, 0)
+        self.assertEqual([(reasons, {a['id'], b['id']}) for _, reasons, a, b in pairs],
+                         [(['name'], {self.original.id, near.id})])
+
+        out = StringIO()
+        call_command('find_duplicates', user=self.user.username, stdout=out)
+        self.assertIn('Found 1 likely duplicate pairs', out.getvalue())
+
+
+class ReferenceTablesTest(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        # Rows committed for the test are rolled back afterwards: forget their ids
+        for model in (Wilaya, Secteur):
+            self.addCleanup(labels_for(model).clear)
+
+    def test_labels_in_and_out(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/prospects/', {
+                'entreprise': 'A', 'wilaya': 'Béjaïa', 'secteur': 'Industrie', 'status': 'New', 'user': self.user.pk,
+            }, format='json')
+        second = self.client.post('/api/prospects/', {
+            'entreprise': 'B', 'wilaya': ' BEJAIA', 'commune': '', 'status': 'New', 'user': self.user.pk,
+        }, format='json')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((first.data['wilaya'], second.data['wilaya']), ('Béjaïa', 'Béjaïa'))
+        self.assertIsNone(second.data['commune'])
+        self.assertEqual(Wilaya.objects.count(), 1)
+        self.assertEqual(Prospect.objects.filter(wilaya_id=Wilaya.objects.get().pk).count(), 2)
+
+        token_user_cache.clear()
+        self.client.get('/api/prospects/?fields=entreprise,wilaya')
+        # Labels come from the in-memory lookup, not a join or extra queries
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/prospects/?fields=entreprise,wilaya')
+        self.assertEqual(sorted(response.data, key=lambda item: item['entreprise']),
+                         [{'entreprise': 'A', 'wilaya': 'Béjaïa'}, {'entreprise': 'B', 'wilaya': 'Béjaïa'}])
+
+        response = self.client.patch(f"/api/prospects/{second.data['id']}/", {'wilaya': 'Oran'}, format='json')
+        self.assertEqual(response.data['wilaya'], 'Oran')
+        rows = list(csv.DictReader(StringIO(b''.join(self.client.get('/api/prospects/export/').streaming_content).decode())))
+        self.assertEqual(sorted((row['wilaya'], row['secteur']) for row in rows), [('Béjaïa', 'Industrie'), ('Oran', '')])
+
+    async def test_async_list_with_cold_labels(self):
+        def create():
+            with self.captureOnCommitCallbacks(execute=True):
+                Prospect.objects.create(entreprise='A', wilaya='Alger', status='New', user=self.user)
+
+        await sync_to_async(create)()
+        labels_for(Wilaya).clear()
+        view = async_route(ProspectViewSet, {'get': 'list'}, {'get': 'alist'})
+        request = AsyncRequestFactory().get('/api/prospects/?fields=entreprise,wilaya',
+                                            headers={'Authorization': f'Token {self.token.key}'})
+        response = (await view(request)).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), [{'entreprise': 'A', 'wilaya': 'Alger'}])
+
+    def test_search_and_dashboard_use_labels(self):
+        Prospect.objects.create(entreprise='Cevital', wilaya='Bejaia', commune='Akbou', status='New', user=self.user)
+        Prospect.objects.create(entreprise='Condor', wilaya='Bordj Bou Arreridj', status='New', user=self.user)
+        response = self.client.get('/api/prospects/?q=bou')
+        self.assertEqual([p['entreprise'] for p in response.data['results']], ['Condor'])
+        response = self.client.get('/api/prospects/?q=akb')
+        self.assertEqual([p['entreprise'] for p in response.data['results']], ['Cevital'])
+
+        call_command('rebuild_dashboard', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/dashboard/').data['prospects']['by_wilaya'],
+                         {'Bejaia': 1, 'Bordj Bou Arreridj': 1})
+
+    def test_rejected_batches_create_no_reference_rows(self):
+        prospect = Prospect.objects.create(entreprise='A', status='New', user=self.user)
+        response = self.client.post('/api/prospects/bulk/', [
+            {'entreprise': 'B', 'wilaya': 'Tlemcen', 'status': 'New', 'user': self.user.pk},
+            {'entreprise': 'C', 'secteur': 'Agriculture', 'user': self.user.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        other = Prospect.objects.create(entreprise='D', status='New', user=self.user)
+        response = self.client.patch('/api/prospects/bulk/', [
+            {'id': prospect.pk, 'wilaya': 'Tlemcen'}, {'id': other.pk, 'status': 'x' * 51},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Wilaya.objects.exists() or Secteur.objects.exists())
+
+        # Assigning a new label only creates its row when the prospect is saved
+        prospect.wilaya = 'Tlemcen'
+        self.assertEqual(prospect.wilaya, 'Tlemcen')
+        self.assertFalse(Wilaya.objects.exists())
+        prospect.save()
+        self.assertEqual(Wilaya.objects.get().pk, Prospect.objects.get(pk=prospect.pk).wilaya_id)
+
+        response = self.client.patch('/api/prospects/bulk/', [{'id': prospect.pk, 'wilaya': 'Oran'}], format='json')
+        self.assertEqual(response.data[0]['wilaya'], 'Oran')
+        self.assertEqual(Prospect.objects.get(pk=prospect.pk).wilaya_id, Wilaya.objects.get(key='oran').pk)
+
+    def test_label_miss_fetches_one_row(self):
+        labels = labels_for(Wilaya)
+        labels.load()
+        wilaya = Wilaya.objects.create(key='oran', label='Oran')
+        Wilaya.objects.create(key='alger', label='Alger')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(labels.label(wilaya.pk), 'Oran')
+            self.assertEqual(labels.label(wilaya.pk), 'Oran')
+        # Only the missing row is read, once
+        self.assertEqual(len(queries), 1)
+        self.assertIn('WHERE', queries[0]['sql'])
@@ -0,0 +1,129 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .phones import normalize_phone
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/min' -> (5, 60), as DRF's rate strings"""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def _cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+def _incr(cache, key, timeout):
+    """Atomic increment (Redis INCR), creating the key when missing or evicted"""
+    cache.add(key, 0, timeout=timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=timeout)
+        return 1
+
+
+def _shed_key(scope):
+    return f"throttle-shed:{scope}"
+
+
+def shed_counts(scopes):
+    """Requests rejected so far by each throttle scope, across workers"""
+    counts = _cache().get_many([_shed_key(scope) for scope in scopes])
+    return {scope: counts.get(_shed_key(scope), 0) for scope in scopes}
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Sliding-window counter allowing `capacity` requests per `period`, from a
+    DRF rate string ('5/min') in the `rate_setting` setting; an empty
+    setting disables the throttle.
+
+    The window is approximated with two fixed-window counters in the cache:
+    the previous window's count weighted by how much of it still overlaps,
+    plus the current one. Counting a request is a single atomic INCR and the
+    state is shared by every worker. Rejected requests are not counted, so a
+    client in a retry loop is let through again as soon as the window has
+    room. Nothing here touches the database.
+    """
+    scope = None
+    rate_setting = None
+
+    def get_counter_ident(self, request):
+        """
+        Key of the counter `request` counts against, None to let it through
+        uncounted: by default the client IP (DRF's get_ident, see
+        NUM_PROXIES in settings).
+        """
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        rate = getattr(settings, self.rate_setting, None)
+        ident = self.get_counter_ident(request) if rate else None
+        if ident is None:
+            return True
+        capacity, period = parse_rate(rate)
+
+        now = time.time()
+        window, offset = divmod(now, period)
+        base = f"throttle:{self.scope}:{hashlib.sha256(ident.encode()).hexdigest()}"
+        cache = _cache()
+        previous = cache.get(f"{base}:{int(window) - 1}", 0)
+        key = f"{base}:{int(window)}"
+        count = _incr(cache, key, timeout=2 * period)
+
+        overlap = 1 - offset / period
+        if previous * overlap + count <= capacity:
+            return True
+
+        cache.decr(key)
+        _incr(cache, _shed_key(self.scope), timeout=None)
+        self._wait = self._refill_time(capacity, period, previous, count - 1, offset)
+        return False
+
+    @staticmethod
+    def _refill_time(capacity, period, previous, count, offset):
+        """Seconds until one more request fits in the window"""
+        if count + 1 <= capacity and previous:
+            # Room once the previous window has slid out far enough
+            fraction = 1 - (capacity - count - 1) / previous
+            return max(fraction * period - offset, 0)
+        # Wait for the next window, where this one's count weighs in
+        fraction = 1 - (capacity - 1) / count if count else 0
+        return period - offset + max(fraction, 0) * period
+
+    def wait(self):
+        return math.ceil(self._wait)
+
+
+class OTPPhoneThrottle(SlidingWindowThrottle):
+    """
+    Counter per submitted phone number (or PhoneNumber id), on its normalized
+    form: '+213 555…', '0555…' and '213555…' share one counter
+    """
+    scope = 'otp_phone'
+    rate_setting = 'OTP_THROTTLE_PHONE_RATE'
+
+    def get_counter_ident(self, request):
+        phone_number = request.data.get('phone_number')
+        if not phone_number:
+            return None
+        return normalize_phone(phone_number) or str(phone_number).strip()
+
+
+class OTPIPThrottle(SlidingWindowThrottle):
+    """Counter per client IP"""
+    scope = 'otp_ip'
+    rate_setting = 'OTP_THROTTLE_IP_RATE'
+
+
+OTP_THROTTLES = (OTPPhoneThrottle, OTPIPThrottle)
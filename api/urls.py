@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PhoneNumberViewSet, OTPViewSet, ContactViewSet, ProspectViewSet, ActivityViewSet
+from .async_views import async_route
+from .views import PhoneNumberViewSet, OTPViewSet, ContactViewSet, ProspectViewSet, ActivityViewSet, SyncViewSet, DashboardViewSet, DatabasePoolViewSet, ThrottleMetricsViewSet, PhoneLookupViewSet
 
 router = DefaultRouter()
 router.register(r'phone-numbers', PhoneNumberViewSet)
@@ -8,7 +10,33 @@ router.register(r'otps', OTPViewSet, basename='otps')
 router.register(r'contacts', ContactViewSet, basename='contacts')
 router.register(r'prospects', ProspectViewSet, basename='prospects')
 router.register(r'activities', ActivityViewSet, basename='activities')
+router.register(r'sync', SyncViewSet, basename='sync')
+router.register(r'dashboard', DashboardViewSet, basename='dashboard')
+router.register(r'lookup/phone', PhoneLookupViewSet, basename='phone-lookup')
+router.register(r'metrics/db-pool', DatabasePoolViewSet, basename='db-pool')
+router.register(r'metrics/throttle', ThrottleMetricsViewSet, basename='throttle-metrics')
 
 urlpatterns = [
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_VIEWS:
+    # ASGI deployment: OTP login and the list endpoints run as async views,
+    # taking precedence over the router's sync routes for the same URLs
+    urlpatterns = [
+        path('otps/generate/', async_route(
+            OTPViewSet, {'post': 'generate'}, {'post': 'agenerate'}, basename='otps', detail=False,
+        ), name='otps-generate'),
+        path('otps/verify/', async_route(
+            OTPViewSet, {'post': 'verify'}, {'post': 'averify'}, basename='otps', detail=False,
+        ), name='otps-verify'),
+        path('contacts/', async_route(
+            ContactViewSet, {'get': 'list', 'post': 'create'}, {'get': 'alist'}, basename='contacts', detail=False,
+        ), name='contacts-list'),
+        path('prospects/', async_route(
+            ProspectViewSet, {'get': 'list', 'post': 'create'}, {'get': 'alist'}, basename='prospects', detail=False,
+        ), name='prospects-list'),
+        path('activities/', async_route(
+            ActivityViewSet, {'get': 'list'}, {'get': 'alist'}, basename='activities', detail=False,
+        ), name='activities-list'),
+    ] + urlpatterns
@@ -1,17 +1,44 @@
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.viewsets import ReadOnlyModelViewSet
-from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.authtoken.models import Token
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import F, Value
 from django.utils import timezone
 from datetime import timedelta
+import os
 import random
 import uuid
 
 from .models import PhoneNumber, OTP, Contact, Prospect, Activity
 from .serializers import PhoneNumberSerializer, OTPSerializer, OTPVerifySerializer, ContactSerializer, ProspectSerializer, ActivitySerializer
+from .pagination import KeysetPagination, SearchPagination
+from .authentication import CachedTokenAuthentication
+from .otp_store import get_otp_store
+from .search import search_prospects
+from .importer import ProspectImporter, open_text
+from .dashboard import dashboard_for
+from .bulk import BulkModelMixin
+from .etags import ConditionalGetMixin
+from .export import ExportMixin, streaming_response
+from .projection import SparseFieldsMixin
+from .async_views import AsyncActionsMixin
+from .throttling import OTP_THROTTLES, shed_counts
+from .partitions import parse_bound, read_archived
+from .phones import normalize_phone
+from .duplicates import find_duplicates
+from .sync import changes_since, decode_sync_token
+from .signals import (
+    build_contact_activity, build_contact_delete_activity,
+    build_prospect_activity, build_prospect_delete_activity,
+)
 
 class PhoneNumberViewSet(viewsets.ModelViewSet):
     queryset = PhoneNumber.objects.all()
@@ -28,11 +55,17 @@ class PhoneNumberViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(obj)
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
-class OTPViewSet(viewsets.ModelViewSet):
+class OTPViewSet(AsyncActionsMixin, viewsets.ModelViewSet):
     queryset = OTP.objects.all()
     serializer_class = OTPSerializer
     http_method_names = ['post']
+    # Actions issuing OTPs: throttled per phone number and per IP before any query
+    throttled_actions = ('request_otp', 'generate', 'create')
 
+    def get_throttles(self):
+        if self.action in self.throttled_actions:
+            return [throttle() for throttle in OTP_THROTTLES]
+        return super().get_throttles()
 
     @action(detail=False, methods=['post'])
     def request_otp(self, request):
@@ -40,18 +73,15 @@ class OTPViewSet(viewsets.ModelViewSet):
         if not phone_number_str:
             return Response({'error': 'Phone number is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            # Check if phone number exists (do NOT create)
-            phone_obj = PhoneNumber.objects.get(phone_number=phone_number_str)
-        except PhoneNumber.DoesNotExist:
+        # Check if phone number exists (do NOT create), whatever its formatting
+        phone_obj = PhoneNumber.objects.matching(phone_number_str).first()
+        if phone_obj is None:
             return Response({'error': 'Phone number not found'}, status=status.HTTP_404_NOT_FOUND)
         
         # Generate OTP for existing phone number
         otp_code = f"{random.randint(10000, 99999)}"
-        otp = OTP.objects.create(
-            phone_number=phone_obj, 
-            otp_code=otp_code
-        )
+        expires_at = timezone.now() + timedelta(seconds=settings.OTP_TTL_SECONDS)
+        otp = get_otp_store().issue(phone_obj, otp_code, expires_at)
         return Response({
             "success": True,
             "message": "OTP generated successfully",
@@ -74,15 +104,10 @@ class OTPViewSet(viewsets.ModelViewSet):
             
             # Generate OTP code
             otp_code = 12345
-            expires_at = timezone.now() + timedelta(minutes=5)
+            expires_at = timezone.now() + timedelta(seconds=settings.OTP_TTL_SECONDS)
             
             # Create OTP
-            otp = OTP.objects.create(
-                phone_number=phone_obj,
-                otp_code=otp_code,
-                expires_at=expires_at,
-                is_valid=True
-            )
+            otp = get_otp_store().issue(phone_obj, otp_code, expires_at)
             
             # Return response with OTP code visible
             return Response({
@@ -113,23 +138,38 @@ class OTPViewSet(viewsets.ModelViewSet):
         if not phone_number_str:
             return Response({'error': 'Phone number is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            # Check if phone number exists (do NOT create with get_or_create)
-            phone_obj = PhoneNumber.objects.get(phone_number=phone_number_str)
-        except PhoneNumber.DoesNotExist:
+        # Check if phone number exists (do NOT create with get_or_create),
+        # whatever its formatting ('+213 555...', '0555...')
+        phone_obj = PhoneNumber.objects.matching(phone_number_str).first()
+        if phone_obj is None:
             return Response({'error': 'Phone number not found'}, status=status.HTTP_404_NOT_FOUND)
 
         otp_code = f"{random.randint(10000, 99999)}"
-        expires_at = timezone.now() + timedelta(minutes=5)
+        expires_at = timezone.now() + timedelta(seconds=settings.OTP_TTL_SECONDS)
 
-        otp = OTP.objects.create(
-            phone_number=phone_obj,
-            otp_code=otp_code,
-            expires_at=expires_at,
-            is_valid=True
-        )
+        otp = get_otp_store().issue(phone_obj, otp_code, expires_at)
 
         # In a real app, send SMS here. For now just return it for testing.
+        return self._generated_response(phone_number_str, otp_code, expires_at)
+
+    async def agenerate(self, request):
+        """`generate` for the ASGI deployment (see async_views.py)"""
+        phone_number_str = request.data.get('phone_number')
+        if not phone_number_str:
+            return Response({'error': 'Phone number is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        phone_obj = await PhoneNumber.objects.matching(phone_number_str).afirst()
+        if phone_obj is None:
+            return Response({'error': 'Phone number not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        otp_code = f"{random.randint(10000, 99999)}"
+        expires_at = timezone.now() + timedelta(seconds=settings.OTP_TTL_SECONDS)
+
+        await get_otp_store().aissue(phone_obj, otp_code, expires_at)
+        return self._generated_response(phone_number_str, otp_code, expires_at)
+
+    @staticmethod
+    def _generated_response(phone_number_str, otp_code, expires_at):
         return Response({
             'message': 'OTP generated successfully',
             'phone_number': phone_number_str,
@@ -146,48 +186,87 @@ class OTPViewSet(viewsets.ModelViewSet):
         phone_number_str = serializer.validated_data.get('phone_number')
         otp_code = serializer.validated_data.get('otp_code')
 
-        try:
-            phone_obj = PhoneNumber.objects.get(phone_number=phone_number_str)
-        except PhoneNumber.DoesNotExist:
-             return Response({'error': 'Invalid phone number'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Find the latest valid OTP for this phone number
-        otp = OTP.objects.filter(
-            phone_number=phone_obj,
-            otp_code=otp_code,
-            is_valid=True,
-            expires_at__gt=timezone.now()
-        ).first()
-
-        if otp:
-            # Mark as used (invalidate)
-            otp.is_valid = False
-            otp.save()
-            
-            # Get or create a user for this phone number (for activities tracking)
-            from django.contrib.auth.models import User
-            user, _ = User.objects.get_or_create(
-                username=phone_number_str,
-                defaults={'is_active': True}
-            )
-            
-            # Get or create auth token for this user
-            token, _ = Token.objects.get_or_create(user=user)
-            
-            return Response({
-                'message': 'OTP verified successfully',
-                'token': token.key,
-                'user_id': user.id,
-                'phone_number': phone_number_str
-            }, status=status.HTTP_200_OK)
-        else:
+        with transaction.atomic():
+            # Consume the latest valid OTP in one conditional UPDATE
+            if not get_otp_store().consume(phone_number_str, otp_code):
+                if not PhoneNumber.objects.matching(phone_number_str).exists():
+                    return Response({'error': 'Invalid phone number'}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({'error': 'Invalid or expired OTP'}, status=status.HTTP_400_BAD_REQUEST)
+
+            username = self._registered(phone_number_str).first() or phone_number_str
+            # Returning users already have a token: fetch it with its user in one query
+            token = self._tokens(username).first()
+            if token is None:
+                token = self._create_token(username)
+
+        return self._verified_response(phone_number_str, token)
+
+    async def averify(self, request):
+        """
+        `verify` for the ASGI deployment (see async_views.py). The async ORM
+        has no transactions, so the consume UPDATE commits on its own; the
+        rare first login still creates the user and token atomically.
+        """
+        serializer = OTPVerifySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        phone_number_str = serializer.validated_data.get('phone_number')
+        otp_code = serializer.validated_data.get('otp_code')
+
+        if not await get_otp_store().aconsume(phone_number_str, otp_code):
+            if not await PhoneNumber.objects.matching(phone_number_str).aexists():
+                return Response({'error': 'Invalid phone number'}, status=status.HTTP_400_BAD_REQUEST)
             return Response({'error': 'Invalid or expired OTP'}, status=status.HTTP_400_BAD_REQUEST)
 
-class ContactViewSet(viewsets.ModelViewSet):
+        username = await self._registered(phone_number_str).afirst() or phone_number_str
+        token = await self._tokens(username).afirst()
+        if token is None:
+            token = await sync_to_async(transaction.atomic(self._create_token))(username)
+        return self._verified_response(phone_number_str, token)
+
+    @staticmethod
+    def _registered(phone_number_str):
+        # Users are named after the number as registered, which may be written
+        # differently: the oldest registration when several share its key
+        return PhoneNumber.objects.matching(phone_number_str).order_by('created_at', 'id').values_list(
+            'phone_number', flat=True
+        )
+
+    @staticmethod
+    def _tokens(username):
+        return Token.objects.select_related('user').filter(user__username=username)
+
+    @staticmethod
+    def _create_token(username):
+        # Get or create a user for this phone number (for activities tracking)
+        user, _ = User.objects.get_or_create(
+            username=username,
+            defaults={'is_active': True}
+        )
+        # Get or create auth token for this user
+        token, _ = Token.objects.get_or_create(user=user)
+        return token
+
+    @staticmethod
+    def _verified_response(phone_number_str, token):
+        return Response({
+            'message': 'OTP verified successfully',
+            'token': token.key,
+            'user_id': token.user.id,
+            'phone_number': phone_number_str
+        }, status=status.HTTP_200_OK)
+
+class ContactViewSet(AsyncActionsMixin, ConditionalGetMixin, BulkModelMixin, ExportMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     serializer_class = ContactSerializer
     lookup_field = 'id'
     permission_classes = [IsAuthenticated]
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    build_activity = staticmethod(build_contact_activity)
+    build_delete_activity = staticmethod(build_contact_delete_activity)
+    etag_resource = 'contacts'
+    export_fields = ('id', 'name', 'phone_number', 'email', 'company', 'type', 'updated_at')
+    export_filename = 'contacts'
 
     def get_queryset(self):
         """Return only contacts belonging to the logged-in user"""
@@ -197,26 +276,216 @@ class ContactViewSet(viewsets.ModelViewSet):
         """Automatically assign the logged-in user when creating a contact"""
         serializer.save(user=self.request.user)
 
-class ProspectViewSet(viewsets.ModelViewSet):
+class ProspectViewSet(AsyncActionsMixin, ConditionalGetMixin, BulkModelMixin, ExportMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     serializer_class = ProspectSerializer
     lookup_field = 'id'
     permission_classes = [IsAuthenticated]
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    build_activity = staticmethod(build_prospect_activity)
+    build_delete_activity = staticmethod(build_prospect_delete_activity)
+    etag_resource = 'prospects'
+    export_fields = (
+        'id', 'entreprise', 'adresse', 'wilaya', 'commune', 'phone_number', 'email', 'categorie',
+        'forme_legale', 'secteur', 'sous_secteur', 'nif', 'registre_commerce', 'status', 'updated_at',
+    )
+    export_filename = 'prospects'
 
     def get_queryset(self):
-        """Return only prospects belonging to the logged-in user"""
-        return Prospect.objects.filter(user=self.request.user)
+        """
+        Return only prospects belonging to the logged-in user.
+        With ?q=, return the ones matching the search, most relevant first.
+        """
+        queryset = Prospect.objects.filter(user=self.request.user)
+        q = self.request.query_params.get('q')
+        if q and self.action == 'list':
+            queryset = search_prospects(queryset, q)
+        return queryset
+
+    @property
+    def paginator(self):
+        """Search results are paginated; the plain list keeps its full response"""
+        if not hasattr(self, '_paginator'):
+            self._paginator = SearchPagination() if self.request.query_params.get('q') else None
+        return self._paginator
     
+    def create(self, request, *args, **kwargs):
+        """
+        Create a prospect. The response also lists under `duplicates` the
+        user's existing prospects it likely duplicates (same NIF/RC, phone or
+        email, or a near-identical name in the same wilaya), as a warning:
+        the prospect is created either way.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        data = serializer.data
+        data['duplicates'] = find_duplicates(serializer.instance)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
     def perform_create(self, serializer):
         """Automatically assign the logged-in user when creating a prospect"""
         serializer.save(user=self.request.user)
 
-class ActivityViewSet(ReadOnlyModelViewSet):
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_csv(self, request):
+        """
+        POST /api/prospects/import/ (multipart, `file` = CSV with a header row
+        naming Prospect fields). Rows whose nif or registre_commerce already
+        exist for the user are skipped.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A CSV file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = ProspectImporter(request.user).run(open_text(upload))
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+class ActivityViewSet(AsyncActionsMixin, ConditionalGetMixin, SparseFieldsMixin, ReadOnlyModelViewSet):
     serializer_class = ActivitySerializer
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    etag_resource = 'activities'
     lookup_field = 'id'
 
     def get_queryset(self):
         """Return only activities belonging to the logged-in user, ordered by most recent"""
-        return Activity.objects.filter(user=self.request.user).order_by('-timestamp')
\ No newline at end of file
+        return Activity.objects.filter(user=self.request.user).order_by('-timestamp', 'id')
+
+    @action(detail=False, methods=['get'])
+    def archived(self, request):
+        """
+        GET /api/activities/archived/?start=2024-01-01&end=2024-02-01
+        The user's activities with start <= timestamp < end read from the
+        archive files of `manage.py activity_partitions`, streamed as NDJSON,
+        newest first. Only served when ACTIVITY_ARCHIVE_READS is set, for
+        ranges of at most ACTIVITY_ARCHIVE_MAX_DAYS.
+        """
+        if not settings.ACTIVITY_ARCHIVE_READS:
+            return Response({'error': 'Archived activities are not available'}, status=status.HTTP_404_NOT_FOUND)
+        start = parse_bound(request.query_params.get('start'))
+        end = parse_bound(request.query_params.get('end'))
+        if start is None or end is None:
+            return Response({'error': 'start and end dates are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not start < end <= start + timedelta(days=settings.ACTIVITY_ARCHIVE_MAX_DAYS):
+            return Response(
+                {'error': f'end must be after start, by at most {settings.ACTIVITY_ARCHIVE_MAX_DAYS} days'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fields = self.get_serializer().fields
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        def stream():
+            for row in read_archived(request.user.pk, start, end):
+                yield encoder.encode({
+                    name: None if row[name] in ('', None) else field.to_representation(row[name])
+                    for name, field in fields.items()
+                }) + '\n'
+
+        return streaming_response(request, stream(), content_type='application/x-ndjson; charset=utf-8')
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    GET /api/sync/?since=<token>
+    Returns the user's contacts and prospects changed since the token, the ids
+    of those deleted since then, and a new token for the next sync.
+    Without `since`, returns a full snapshot.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = decode_sync_token(since)
+            except ValueError:
+                return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            since = None
+
+        token, changes = changes_since(request.user, since)
+        return Response({
+            'token': token,
+            'contacts': {
+                'changed': ContactSerializer(changes['contacts'], many=True).data,
+                'deleted': changes['deleted_contacts'],
+            },
+            'prospects': {
+                'changed': ProspectSerializer(changes['prospects'], many=True).data,
+                'deleted': changes['deleted_prospects'],
+            },
+        }, status=status.HTTP_200_OK)
+
+class DatabasePoolViewSet(viewsets.ViewSet):
+    """
+    GET /api/metrics/db-pool/ (staff only)
+    Connection pool statistics of the worker serving the request, by
+    database alias (size, idle connections, waiting requests, wait times...).
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        pools = {}
+        if any(connection.settings_dict['ENGINE'] == 'api.db.postgresql_pool' for connection in connections.all()):
+            # Only importable with psycopg 3 and psycopg_pool installed
+            from .db.postgresql_pool.base import pool_stats
+            pools = pool_stats()
+        return Response({'pid': os.getpid(), 'pools': pools}, status=status.HTTP_200_OK)
+
+class ThrottleMetricsViewSet(viewsets.ViewSet):
+    """
+    GET /api/metrics/throttle/ (staff only)
+    Number of OTP requests rejected by each throttle since the counters were
+    created, across all workers.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        return Response({'shed': shed_counts([throttle.scope for throttle in OTP_THROTTLES])}, status=status.HTTP_200_OK)
+
+class PhoneLookupViewSet(viewsets.ViewSet):
+    """
+    GET /api/lookup/phone/?number=<phone number>
+    The user's contacts and prospects with this number, whatever its
+    formatting ('+213 555...', '0555...'): both tables are searched on their
+    normalized phone key in one UNION query over the (user, phone_key) indexes.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        key = normalize_phone(request.query_params.get('number'))
+        if not key:
+            return Response({'error': 'A phone number is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        contacts = Contact.objects.filter(user=request.user, phone_key=key).annotate(
+            kind=Value('contact'), label=F('name'), category=F('type'),
+        ).values_list('kind', 'id', 'label', 'phone_number', 'category')
+        prospects = Prospect.objects.filter(user=request.user, phone_key=key).annotate(
+            kind=Value('prospect'), label=F('entreprise'), category=F('status'),
+        ).values_list('kind', 'id', 'label', 'phone_number', 'category')
+
+        matches = {'contacts': [], 'prospects': []}
+        for kind, pk, label, phone_number, category in contacts.union(prospects, all=True):
+            if kind == 'contact':
+                matches['contacts'].append({'id': pk, 'name': label, 'phone_number': phone_number, 'type': category})
+            else:
+                matches['prospects'].append({'id': pk, 'entreprise': label, 'phone_number': phone_number, 'status': category})
+        return Response({'number': key, **matches}, status=status.HTTP_200_OK)
+
+class DashboardViewSet(viewsets.ViewSet):
+    """
+    GET /api/dashboard/
+    Prospect counts by status, wilaya and secteur, contact counts by type and
+    activity counts by type over the last 7/30 days, read from the user's
+    incrementally maintained counters.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        return Response(dashboard_for(request.user), status=status.HTTP_200_OK)
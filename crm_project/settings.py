@@ -21,7 +21,6 @@ if DATABASE_URL:
     DATABASES = {
         "default": dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=600,
             ssl_require=True,
         )
     }
@@ -37,6 +36,49 @@ else:
         }
     }
 
+# Optional read replica: GET requests read from it (api.routers,
+# api.middleware.ReplicaRoutingMiddleware), except for clients that wrote in
+# the last REPLICA_STICKY_SECONDS, whose reads stay on the primary. Tests run
+# against `default` only (the replica mirrors it).
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = dj_database_url.config(
+        default=DATABASE_REPLICA_URL,
+        ssl_require=bool(DATABASE_URL),
+    )
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+REPLICA_DATABASE_ALIAS = "replica" if DATABASE_REPLICA_URL else None
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+# Connection pooling, applied to every PostgreSQL database above: each process
+# keeps DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE open connections (psycopg 3 pool,
+# see api/db/postgresql_pool) and requests borrow one instead of connecting.
+# Requests wait up to DB_POOL_TIMEOUT seconds for a free connection.
+# With DB_POOL_ENABLED off, connections persist per thread for DB_CONN_MAX_AGE.
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+
+for database in DATABASES.values():
+    if database["ENGINE"] != "django.db.backends.postgresql":
+        continue
+    database["CONN_HEALTH_CHECKS"] = True
+    if DB_POOL_ENABLED:
+        database["ENGINE"] = "api.db.postgresql_pool"
+        database["CONN_MAX_AGE"] = 0
+        database.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": DB_POOL_TIMEOUT,
+        }
+    else:
+        database["CONN_MAX_AGE"] = DB_CONN_MAX_AGE
+
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -73,20 +115,163 @@ INSTALLED_APPS = [
     'corsheaders',
 ]
 
+# JSON renderer of the API: orjson-backed by default (api/renderers.py),
+# 'rest_framework.renderers.JSONRenderer' for the stdlib one
+API_JSON_RENDERER = os.getenv('API_JSON_RENDERER', 'api.renderers.FastJSONRenderer')
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        API_JSON_RENDERER,
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Reverse proxies in front of the app, each appending to X-Forwarded-For:
+    # client IPs (per-IP throttling) are read that many entries from its end,
+    # or from REMOTE_ADDR with none. Never trust the client-supplied header.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
+}
+
+# Country calling code given to phone numbers written in national format
+# (0XXXXXXXXX) when normalizing them (api/phones.py)
+PHONE_COUNTRY_CODE = os.getenv('PHONE_COUNTRY_CODE', '213')
+
+# Default page size for viewsets that opt into pagination (e.g. activities)
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '50'))
+
+# Maximum number of objects accepted by the contacts/prospects bulk endpoints
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '1000'))
+
+# Delta sync re-sends changes from this many seconds before the client's token
+# to cover transactions that committed late
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', '5'))
+
+# Write-behind activity logging: signal receivers queue activities in memory
+# and a background thread inserts them in batches (see api/activity_queue.py)
+ACTIVITY_WRITE_BEHIND = os.getenv('ACTIVITY_WRITE_BEHIND', 'False').lower() in ('1', 'true', 'yes')
+ACTIVITY_QUEUE_MAX_SIZE = int(os.getenv('ACTIVITY_QUEUE_MAX_SIZE', '10000'))
+ACTIVITY_QUEUE_BATCH_SIZE = int(os.getenv('ACTIVITY_QUEUE_BATCH_SIZE', '500'))
+ACTIVITY_QUEUE_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_QUEUE_FLUSH_INTERVAL', '1.0'))
+
+# Updates of the same contact/prospect within this many seconds of its last
+# update activity are merged into that activity (0 logs every update)
+ACTIVITY_COALESCE_SECONDS = int(os.getenv('ACTIVITY_COALESCE_SECONDS', '60'))
+
+
+# Cache
+# A shared cache (Redis) is required when running several workers, otherwise
+# each process keeps its own ETag version counters.
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Conditional GET (ETag / If-None-Match) on contacts, prospects and activities,
+# keyed on per-user version counters stored in this cache alias. On by default
+# only with the shared cache: the api.E001 check refuses locmem counters.
+ETAG_ENABLED = os.getenv('ETAG_ENABLED', 'True' if REDIS_URL else 'False').lower() in ('1', 'true', 'yes')
+ETAG_CACHE_ALIAS = 'default'
+
+# Token authentication cache: validated token -> user mappings are kept in a
+# per-process LRU, and optionally in a shared cache alias (e.g. 'default')
+TOKEN_AUTH_CACHE_TTL = int(os.getenv('TOKEN_AUTH_CACHE_TTL', '60'))
+TOKEN_AUTH_CACHE_SIZE = int(os.getenv('TOKEN_AUTH_CACHE_SIZE', '10000'))
+TOKEN_AUTH_SHARED_CACHE = os.getenv('TOKEN_AUTH_SHARED_CACHE') or None
+
+# OTPs: 'database' keeps them in the otps table, 'cache' keeps them as TTL
+# keys in OTP_CACHE_ALIAS (needs a shared cache such as Redis in production)
+OTP_STORE = os.getenv('OTP_STORE', 'database')
+OTP_CACHE_ALIAS = 'default'
+OTP_TTL_SECONDS = int(os.getenv('OTP_TTL_SECONDS', '300'))
+
+# OTP throttling (api/throttling.py): sliding-window counters per phone number
+# and per client IP on the endpoints issuing OTPs, kept in THROTTLE_CACHE_ALIAS
+# (needs a shared cache such as Redis with several workers). Empty disables one.
+OTP_THROTTLE_PHONE_RATE = os.getenv('OTP_THROTTLE_PHONE_RATE', '5/min')
+OTP_THROTTLE_IP_RATE = os.getenv('OTP_THROTTLE_IP_RATE', '60/min')
+THROTTLE_CACHE_ALIAS = 'default'
+
+# OTP retention (`manage.py purge_otps`, run by the purge-otps cron job in
+# render.yaml): consumed/expired OTPs older than OTP_RETENTION_SECONDS are
+# deleted OTP_PURGE_BATCH_SIZE rows at a time.
+OTP_RETENTION_SECONDS = int(os.getenv('OTP_RETENTION_SECONDS', '3600'))
+OTP_PURGE_BATCH_SIZE = int(os.getenv('OTP_PURGE_BATCH_SIZE', '1000'))
+
+# Activity partitions (PostgreSQL, see `manage.py activity_partitions`, to run
+# daily): monthly partitions are created ACTIVITY_PARTITION_MONTHS_AHEAD
+# months ahead, and those older than ACTIVITY_RETENTION_MONTHS are detached
+# into ACTIVITY_ARCHIVE_DIR, one directory per month holding a gzipped CSV per
+# user. ACTIVITY_ARCHIVE_READS serves them at /api/activities/archived/, for
+# at most ACTIVITY_ARCHIVE_MAX_DAYS per request.
+ACTIVITY_PARTITION_MONTHS_AHEAD = int(os.getenv('ACTIVITY_PARTITION_MONTHS_AHEAD', '3'))
+ACTIVITY_RETENTION_MONTHS = int(os.getenv('ACTIVITY_RETENTION_MONTHS', '12'))
+ACTIVITY_ARCHIVE_DIR = os.getenv('ACTIVITY_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archives', 'activities'))
+ACTIVITY_ARCHIVE_READS = os.getenv('ACTIVITY_ARCHIVE_READS', 'False').lower() in ('1', 'true', 'yes')
+ACTIVITY_ARCHIVE_MAX_DAYS = int(os.getenv('ACTIVITY_ARCHIVE_MAX_DAYS', '366'))
+
+# Duplicate prospect detection (api/duplicates.py): names in the same block
+# count as duplicates from this similarity ratio on; blocking keys shared by
+# more than DUPLICATE_MAX_BLOCK_SIZE prospects are too common to tell anything
+DUPLICATE_NAME_SIMILARITY = float(os.getenv('DUPLICATE_NAME_SIMILARITY', '0.85'))
+DUPLICATE_MAX_BLOCK_SIZE = int(os.getenv('DUPLICATE_MAX_BLOCK_SIZE', '200'))
+
+# Longest activity window on the dashboard; older daily buckets are pruned as
+# new activities are counted (once a day per user) and by `manage.py rebuild_dashboard`
+DASHBOARD_ACTIVITY_DAYS = int(os.getenv('DASHBOARD_ACTIVITY_DAYS', '30'))
+
+# Per-request SQL instrumentation (api.middleware.QueryInstrumentationMiddleware):
+# query count and SQL time in a Server-Timing header, and a JSON log line on
+# the `api.performance` logger for requests over either threshold
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'False').lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '500'))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', '50'))
+
+# Response compression (api.middleware.CompressionMiddleware): brotli or gzip,
+# as negotiated, for JSON/text responses of at least this many bytes
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True').lower() in ('1', 'true', 'yes')
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+
+# Serve OTP generate/verify and the contact/prospect/activity lists with async
+# views (api/async_views.py). Enable together with the ASGI server:
+#   gunicorn crm_project.asgi:application -k uvicorn.workers.UvicornWorker
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() in ('1', 'true', 'yes')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'api.performance': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
 }
 
 
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.middleware.QueryInstrumentationMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
+    'api.middleware.CompressionMiddleware',
 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',